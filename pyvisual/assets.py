@@ -1,13 +1,17 @@
 
 import os
 import glob
-import time
 import json
+import functools
+
+from pyvisual import watch
 
 ASSET_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "assets")
 SHADER_PATH = os.path.join(ASSET_PATH, "shader")
 SAVE_PATH = os.path.join(ASSET_PATH, "saves")
 SCREENSHOT_PATH = os.path.join(ASSET_PATH, "screenshots")
+# program binaries of compiled shaders, see util.program_cache
+PROGRAM_CACHE_PATH = os.path.join(ASSET_PATH, "cache", "programs")
 
 os.makedirs(SAVE_PATH, exist_ok=True)
 os.makedirs(SCREENSHOT_PATH, exist_ok=True)
@@ -28,27 +32,177 @@ def get_shader_path(name):
 class ShaderError(ValueError):
     pass
 
-def preprocess_shader(source):
-    # we could use a path as context here,
-    # but let's just work with global paths everywhere for now
+class _ShaderFile:
+    def __init__(self, path):
+        self.path = path
+        # lines / source with #include's expanded, None if not loaded (or changed since)
+        self.lines = None
+        self.source = None
+        # paths of the files included directly
+        self.includes = []
+        self.mtime = None
+        self.watched = False
+        # changes whenever the file or a file it includes (directly or not) changes
+        self.version = 0
+
+class ShaderAssets:
+    # Shader files with their #include's expanded, each file is read and expanded once.
+    # Keeps the graph of includes: a changed file (see check_changes / invalidate) invalidates itself
+    # and exactly the files including it (directly or not), their versions change (see FileShaderSource).
+    # Loaded files are watched by the file watch service (see watch.py).
 
-    # handle #include's
-    lines = []
-    for line in source.split("\n"):
-        line = line.strip()
-        if not "#include" in line:
-            lines.append(line)
-            continue
+    def __init__(self):
+        # by absolute path
+        self._files = {}
+        # by the paths they are asked for (relative to SHADER_PATH or absolute)
+        self._by_name = {}
+        # paths of the files including a file directly, by path
+        self._dependents = {}
+        self._changes = watch.file_watch.subscribe()
+
+        # files read / loads served from the cache
+        self.reads = 0
+        self.hits = 0
+
+    def _get_file(self, path):
+        file = self._by_name.get(path)
+        if file is not None:
+            return file
+        full_path = os.path.normpath(get_shader_path(path))
+        file = self._files.get(full_path)
+        if file is None:
+            file = _ShaderFile(full_path)
+            self._files[full_path] = file
+        self._by_name[path] = file
+        return file
+
+    def _load(self, file, stack=()):
+        if file.lines is not None:
+            self.hits += 1
+            return file
+        if file.path in stack:
+            raise ShaderError("Recursive #include of " + file.path)
+
+        # (watched before reading, a change while reading is noticed with the next check)
+        if not file.watched:
+            watch.file_watch.watch(file.path)
+            file.watched = True
+        try:
+            file.mtime = os.path.getmtime(file.path)
+        except FileNotFoundError:
+            file.mtime = None
+        source = open(file.path, "r").read()
+        self.reads += 1
+        lines, includes = self._expand(source, stack + (file.path,))
+
+        for include in file.includes:
+            self._dependents[include].discard(file.path)
+        for include in includes:
+            self._dependents.setdefault(include, set()).add(file.path)
+        file.includes = includes
+        file.lines = lines
+        file.source = "\n".join(lines)
+        return file
+
+    def _expand(self, source, stack=()):
+        # returns the lines with #include's expanded and the paths of the included files
+        # (paths of #include's are relative to SHADER_PATH)
+        lines = []
+        includes = []
+        for line in source.split("\n"):
+            line = line.strip()
+            if not "#include" in line:
+                lines.append(line)
+                continue
+
+            prefix = "#include <"
+            suffix = ">"
+            if not line.startswith(prefix) or not line.endswith(suffix):
+                raise ShaderError("Invalid #include line " + line)
+            included = self._load(self._get_file(line[len(prefix):-len(suffix)]), stack)
+            if not included.path in includes:
+                includes.append(included.path)
+            lines.extend(included.lines)
+        return lines, includes
+
+    def load(self, path):
+        return self._load(self._get_file(path)).source
+
+    def preprocess(self, source):
+        # expands the #include's of a source that isn't a file
+        lines, includes = self._expand(source)
+        return "\n".join(lines)
+
+    def version(self, path):
+        return self._get_file(path).version
+
+    def dependencies(self, path):
+        # paths of the files a file includes (directly or not)
+        paths = set()
+        pending = list(self._load(self._get_file(path)).includes)
+        while pending:
+            include = pending.pop()
+            if not include in paths:
+                paths.add(include)
+                pending.extend(self._files[include].includes)
+        return paths
+
+    def dependents(self, path):
+        # paths of the loaded files including a file (directly or not)
+        paths = set()
+        pending = list(self._dependents.get(self._get_file(path).path, ()))
+        while pending:
+            dependent = pending.pop()
+            if not dependent in paths:
+                paths.add(dependent)
+                pending.extend(self._dependents.get(dependent, ()))
+        return paths
+
+    def invalidate(self, path):
+        # the file has changed, returns the paths of the files that have to be loaded again
+        paths = self.dependents(path) | {self._get_file(path).path}
+        for invalidated_path in paths:
+            file = self._files[invalidated_path]
+            file.lines = None
+            file.source = None
+            file.version += 1
+        return paths
+
+    def check_changes(self, force=False):
+        # invalidates the files that have changed (noticed by the file watch service, or with force by checking
+        # the modification times of all loaded files right away), returns the paths of the invalidated files
+        # (called once per frame by the root graph, see RootGraph._begin_frame)
+        watch.file_watch.update()
+        if not force and not self._changes.paths:
+            return frozenset()
+        paths = self._changes.take()
+        if force:
+            paths = set(paths) | self._modified_files()
+
+        invalidated = set()
+        for path in paths:
+            if path in self._files and not path in invalidated:
+                invalidated |= self.invalidate(path)
+        return invalidated
+
+    def _modified_files(self):
+        paths = set()
+        for file in self._files.values():
+            if file.lines is None or file.mtime is None:
+                continue
+            try:
+                if os.path.getmtime(file.path) != file.mtime:
+                    paths.add(file.path)
+            except FileNotFoundError:
+                continue
+        return paths
 
-        prefix = "#include <"
-        suffix = ">"
-        if not line.startswith(prefix) or not line.endswith(suffix):
-            raise ShaderError("Invalid #include line " + line)
-        path = line[len(prefix):-len(suffix)]
-        shader = preprocess_shader(load_shader(path=path))
-        lines.extend(shader.split("\n"))
+shader_assets = ShaderAssets()
 
-    return "\n".join(lines)
+def preprocess_shader(source):
+    # we could use a path as context here,
+    # but let's just work with global paths everywhere for now
+    return shader_assets.preprocess(source)
 
 def load_shader(path=None, source=None):
     if path is None and source is None:
@@ -57,13 +211,24 @@ def load_shader(path=None, source=None):
         raise ValueError("A path xor source must be provided.")
 
     if path is not None:
-        source = open(get_shader_path(path), "r").read()
-    source = preprocess_shader(source)
+        return shader_assets.load(path)
+    return preprocess_shader(source)
 
-    return source
+# parsed inputs of the last sources (the same sources are parsed by each instance of a shader node)
+PARSE_CACHE_SIZE = 256
+
+def _copy_inputs(inputs):
+    # (callers get their own kwargs)
+    return [ (gltype, name, dict(kwargs)) for gltype, name, kwargs in inputs ]
 
 def parse_shader_preprocessor_inputs(shader_source):
+    return _copy_inputs(_parse_preprocessor_inputs(shader_source))
+
+@functools.lru_cache(maxsize=PARSE_CACHE_SIZE)
+def _parse_preprocessor_inputs(shader_source):
     inputs = []
+    if not "// preprocessor " in shader_source:
+        return ()
     for line in shader_source.split("\n"):
         line = line.strip()
         if not line.startswith("// preprocessor "):
@@ -93,43 +258,44 @@ def parse_shader_preprocessor_inputs(shader_source):
 
         # uniform is then opengl type, name, and other kw arguments
         inputs.append((gltype, name, kwargs))
-    return inputs
+    return tuple(inputs)
 
-def parse_shader_uniform_inputs(vertex_source, fragment_source):
-    def parse_uniforms(source):
-        inputs = []
-        for line in source.split("\n"):
-            line = line.strip()
-            if not line.startswith("uniform"):
-                continue
+@functools.lru_cache(maxsize=PARSE_CACHE_SIZE)
+def _parse_uniform_inputs(source):
+    inputs = []
+    for line in source.split("\n"):
+        line = line.strip()
+        if not line.startswith("uniform"):
+            continue
 
-            comment = None
-            if "//" in line:
-                comment_index = line.find("//")
-                comment = line[comment_index+2:].strip()
-                line = line[:comment_index]
+        comment = None
+        if "//" in line:
+            comment_index = line.find("//")
+            comment = line[comment_index+2:].strip()
+            line = line[:comment_index]
 
-            parts = line.split(" ")
-            if len(parts) < 3:
-                continue
-            # extract opengl uniform type and uniform name
-            gltype = parts[1]
-            # remove trailing ";"
-            name = parts[2][:-1]
+        parts = line.split(" ")
+        if len(parts) < 3:
+            continue
+        # extract opengl uniform type and uniform name
+        gltype = parts[1]
+        # remove trailing ";"
+        name = parts[2][:-1]
 
-            # in case there is a // comment after the uniform definition
-            # attempt to parse json object after this
-            kwargs = {}
-            if comment and comment.startswith("{") and comment.endswith("}"):
-                kwargs = json.loads(comment)
+        # in case there is a // comment after the uniform definition
+        # attempt to parse json object after this
+        kwargs = {}
+        if comment and comment.startswith("{") and comment.endswith("}"):
+            kwargs = json.loads(comment)
 
-            # uniform is then opengl type, name, and other kw arguments
-            inputs.append((gltype, name, kwargs))
-        return inputs
+        # uniform is then opengl type, name, and other kw arguments
+        inputs.append((gltype, name, kwargs))
+    return tuple(inputs)
 
+def parse_shader_uniform_inputs(vertex_source, fragment_source):
     # we assume that vertex/fragment shader don't share any uniforms
-    inputs = parse_uniforms(vertex_source) + parse_uniforms(fragment_source)
-    return inputs
+    inputs = _parse_uniform_inputs(vertex_source) + _parse_uniform_inputs(fragment_source)
+    return _copy_inputs(inputs)
 
 class ShaderSource:
     @property
@@ -140,17 +306,24 @@ class ShaderSource:
         raise NotImplementedError()
 
 class FileShaderSource(ShaderSource):
+    # changes with the file and the files it includes, see ShaderAssets
     def __init__(self, path):
         self._path = path
-        self._watcher = FileWatcher(path)
+        # the file (see ShaderAssets._get_file) and its version the data was taken from
+        self._file = None
+        self._version = None
 
     @property
     def data(self):
-        return load_shader(path=self._path)
+        data = shader_assets.load(self._path)
+        self._file = shader_assets._get_file(self._path)
+        self._version = self._file.version
+        return data
 
     @property
     def has_changed(self):
-        return self._watcher.has_changed()
+        # (changes are taken once per frame, see ShaderAssets.check_changes)
+        return self._file is None or self._file.version != self._version
 
 class StaticShaderSource(ShaderSource):
     def __init__(self):
@@ -186,7 +359,8 @@ class CustomDefineShaderSource(ShaderSource):
 
     @property
     def data(self):
-        defines = "\n".join([ "#define %s" % define for define in self._defines ])
+        # (sorted, the same defines give the same source, see util.program_cache)
+        defines = "\n".join([ "#define %s" % define for define in sorted(self._defines) ])
         data = defines + "\n" + self._source.data
         return data
 
@@ -197,29 +371,23 @@ class CustomDefineShaderSource(ShaderSource):
         return changed
 
 class FileWatcher:
-    CHECK_INTERVAL = 1.0
-
+    # watches a file with the file watch service (see watch.py)
     def __init__(self, path):
         self.path = path
-        self.last_check = 0
+        self._version = watch.file_watch.watch(path)
 
     def has_changed(self):
-        t = time.time()
-        if t - self.CHECK_INTERVAL > self.last_check:
-            last_check = self.last_check
-            self.last_check = t
-            try:
-                last_change = os.path.getmtime(self.path)
-                return last_change > last_check
-            except FileNotFoundError:
-                # might happen sometimes that a file doesn't exist anymore for a moment
-                # when it is saved. dunno why
-                return False
-        return False
+        # (changes are taken once per frame, see ShaderAssets.check_changes)
+        version = watch.file_watch.version(self.path)
+        changed = version != self._version
+        self._version = version
+        return changed
+
+    def close(self):
+        watch.file_watch.unwatch(self.path)
 
     def read(self):
         f = open(self.path)
         data = f.read()
         f.close()
         return data
-
@@ -0,0 +1,32 @@
+#version 150
+
+// converts the input texture to a yuv420 frame (see util.encoder), BT.601 limited range
+// target is a one channel texture of size (w, h * 3 / 2): Y in the first h rows, then U | V side by side
+uniform sampler2D uInputTexture;
+uniform ivec2 uSize;
+
+out vec4 oFragColor;
+
+vec3 fetch(ivec2 p) {
+    return texelFetch(uInputTexture, min(p, uSize - 1), 0).rgb;
+}
+
+void main() {
+    ivec2 p = ivec2(gl_FragCoord.xy);
+    if (p.y < uSize.y) {
+        vec3 c = fetch(p);
+        oFragColor = vec4((16.0 + dot(c, vec3(65.481, 128.553, 24.966))) / 255.0);
+        return;
+    }
+
+    // chroma of the average of 2x2 pixels
+    int halfWidth = uSize.x / 2;
+    bool v = p.x >= halfWidth;
+    ivec2 q = ivec2(v ? p.x - halfWidth : p.x, p.y - uSize.y) * 2;
+    vec3 c = (fetch(q) + fetch(q + ivec2(1, 0)) + fetch(q + ivec2(0, 1)) + fetch(q + ivec2(1, 1))) * 0.25;
+    if (v) {
+        oFragColor = vec4((128.0 + dot(c, vec3(112.0, -93.786, -18.214))) / 255.0);
+    } else {
+        oFragColor = vec4((128.0 + dot(c, vec3(-37.797, -74.203, 112.0))) / 255.0);
+    }
+}
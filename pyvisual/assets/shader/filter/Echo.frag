@@ -0,0 +1,22 @@
+#include <filter/basefilter.frag>
+#include <lib/history.glsl>
+
+// connect history/history_index to a TextureHistory node of the input
+uniform sampler3D uHistory; // {"alias" : "history"}
+uniform int uHistoryIndex; // {"alias" : "history_index"}
+uniform int uEchoCount; // {"alias" : "echoes", "default" : 4, "range" : [0, 64]}
+uniform int uEchoSpacing; // {"alias" : "spacing", "default" : 2, "range" : [1, 64]}
+// (decay 1.0 with spacing 1 averages the last frames like motion blur)
+uniform float uEchoDecay; // {"alias" : "decay", "default" : 0.6, "range" : [0.0, 1.0]}
+
+vec4 filterFrag(vec2 uv, vec4 frag) {
+    vec4 result = frag;
+    float weight = 1.0;
+    float totalWeight = 1.0;
+    for (int i = 1; i <= uEchoCount; i++) {
+        weight *= uEchoDecay;
+        result += weight * historyFrame(uHistory, uHistoryIndex, uv, i * uEchoSpacing);
+        totalWeight += weight;
+    }
+    return result / totalWeight;
+}
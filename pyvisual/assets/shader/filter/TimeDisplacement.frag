@@ -0,0 +1,15 @@
+#define DONT_SAMPLE_FRAGMENT
+#include <filter/basefilter.frag>
+#include <lib/history.glsl>
+
+// connect history/history_index to a TextureHistory node of the input
+uniform sampler3D uHistory; // {"alias" : "history"}
+uniform int uHistoryIndex; // {"alias" : "history_index"}
+// brightness of the displacement texture selects how many frames ago a pixel is from
+uniform sampler2D uDisplacementTexture; // {"alias" : "displacement"}
+uniform float uDisplacementFrames; // {"alias" : "frames", "default" : 8.0, "range" : [0.0, 64.0]}
+
+vec4 filterFrag(vec2 uv, vec4 frag) {
+    float displacement = dot(texture2D(uDisplacementTexture, uv).rgb, vec3(0.299, 0.587, 0.114));
+    return historyFrameSmooth(uHistory, uHistoryIndex, uv, displacement * uDisplacementFrames);
+}
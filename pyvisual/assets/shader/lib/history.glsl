@@ -0,0 +1,17 @@
+// Frames of a TextureHistory node: the newest frame is in layer index of the 3d texture, older frames in the layers before.
+// Layers are sampled at their centers, so linear interpolation doesn't blend neighboring frames.
+
+// frame age frames ago (0 is the newest frame), ages beyond the history return the oldest frame
+vec4 historyFrame(sampler3D history, int index, vec2 uv, int age) {
+    int depth = textureSize(history, 0).z;
+    age = clamp(age, 0, depth - 1);
+    int layer = (index - age + depth) % depth;
+    return texture(history, vec3(uv, (float(layer) + 0.5) / float(depth)));
+}
+
+// interpolates between the frames around a fractional age
+vec4 historyFrameSmooth(sampler3D history, int index, vec2 uv, float age) {
+    age = clamp(age, 0.0, float(textureSize(history, 0).z - 1));
+    int age0 = int(floor(age));
+    return mix(historyFrame(history, index, uv, age0), historyFrame(history, index, uv, age0 + 1), age - float(age0));
+}
@@ -11,9 +11,10 @@ import threading
 from collections import OrderedDict
 
 from pyvisual.audio.pulseaudio import *
+from pyvisual.audio.util import SampleRingBuffer
 
 class PulseAudioContext(threading.Thread):
-    def __init__(self, process_block, sample_rate=5000, block_size=256):
+    def __init__(self, process_block=None, sample_rate=5000, block_size=256, buffer_blocks=64):
         super().__init__()
         self._mainloop = None
         self._mainloop_api = None
@@ -29,12 +30,12 @@ class PulseAudioContext(threading.Thread):
         self._set_current_sink_index = -1
         self._set_sink_index = None
 
-        self._todo = []
-        self._todo_index = []
-
         self._sample_rate = sample_rate
         self._block_size = block_size
+        # called from the pulseaudio thread with each complete block if given,
+        # otherwise blocks are read from the ring buffer by another thread
         self._process_block = process_block
+        self.ring = SampleRingBuffer(block_size, buffer_blocks)
 
     @property
     def sinks(self):
@@ -151,63 +152,28 @@ class PulseAudioContext(threading.Thread):
             self._stream_state_callback(self._stream, None)
             return
 
-        def arrays_len(arrays):
-            return sum([ array.shape[0] for array in arrays ])
-
         buf = ctypes.c_void_p()
         length = size_t(0)
-        #pa_stream_peek(stream, ctypes.byref(buf), ctypes.byref(length))
         if pa_stream_peek(stream, ctypes.byref(buf), ctypes.byref(length)) < 0:
-            print("Unable to read from stream:", pa_strerror(pa_context_errno(context)))
+            print("Unable to read from stream:", pa_strerror(pa_context_errno(self._context)))
             self._quit(1)
             return
+        if length.value == 0:
+            return
+
+        # buf is NULL if there is a hole in the stream
+        if buf.value is not None:
+            count = length.value // 4
+            # view on the fragment in pulseaudio's memory, its samples are copied into the ring buffer only
+            fragment = np.frombuffer((ctypes.c_float * count).from_address(buf.value), dtype=np.float32)
+            self.ring.write(fragment)
         pa_stream_drop(stream)
 
-        count = length.value // 4
-        fragment_ptr = ctypes.cast(buf, ctypes.POINTER(ctypes.c_float))
-        fragment = np.array(np.fromiter(fragment_ptr, dtype=np.float32, count=count))
-
-        self._todo.append(fragment)
-        self._todo_index.append(0)
-
-        def actual_size():
-            if not len(self._todo):
-                return 0
-            return len(self._todo[0]) - self._todo_index[0] + arrays_len(self._todo[1:])
-        while actual_size() >= self._block_size:
-            #print("---")
-            #print([ len(a) for a in self._todo ], self._todo_index)
-            blocks = []
-            for array, index in zip(list(self._todo), list(self._todo_index)):
-                remaining_needed = self._block_size - arrays_len(blocks)
-                assert remaining_needed > 0
-                #print(remaining_needed)
-                array_part = array[index:min(index+remaining_needed, len(array))]
-                left_behind = len(array) - index - len(array_part)
-                #print("taking %d of %d (leaving %d)" % (len(array_part), len(array), left_behind))
-                blocks.append(array_part)
-                if left_behind == 0:
-                    self._todo.pop(0)
-                    self._todo_index.pop(0)
-                else:
-                    assert id(array) == id(self._todo[0])
-                    self._todo_index[0] = index + len(array_part)
-                #print("have now %d" % arrays_len(blocks))
-                if len(array_part) == remaining_needed:
-                    #print("over!")
-                    break
-
-            assert arrays_len(blocks) == self._block_size
-            #print("====>", arrays_len(blocks))
-            #print(actual_size(), "left over")
-
-            block = np.concatenate(blocks, axis=0)
-            #for sample in block[:-1]:
-            #    print(sample, -1.0, file=sys.stderr)
-            #print(block[-1], 1.0, file=sys.stderr)
-            #process_block(block)
-
-            self._process_block(block)
+        if self._process_block is not None:
+            blocks = self.ring.peek_blocks()
+            for block in blocks:
+                self._process_block(block)
+            self.ring.consume(len(blocks))
         return None
     
     def run(self):
@@ -0,0 +1,26 @@
+# Kernel of audio.util.FilterBank: runs several cascades of second order sections over the same samples
+# in one call (like scipy.signal.sosfilt for each of them, transposed direct form II).
+# Without the compiled module FilterBank calls sosfilt for each filter.
+
+cimport cython
+
+@cython.boundscheck(False)
+@cython.wraparound(False)
+def sosfilt_bank(double[:, :, ::1] sos, double[:, ::1] x, double[:, :, :, ::1] zi, double[:, :, ::1] out):
+    # sos: (filters, sections, 6), sections of filters with less sections are padded with [1, 0, 0, 1, 0, 0]
+    # x: (samples, channels), zi: (filters, channels, sections, 2) is updated, out: (filters, samples, channels)
+    cdef Py_ssize_t filters = sos.shape[0], sections = sos.shape[1]
+    cdef Py_ssize_t samples = x.shape[0], channels = x.shape[1]
+    cdef Py_ssize_t f, c, n, s
+    cdef double value, y
+    with nogil:
+        for f in range(filters):
+            for c in range(channels):
+                for n in range(samples):
+                    value = x[n, c]
+                    for s in range(sections):
+                        y = sos[f, s, 0] * value + zi[f, c, s, 0]
+                        zi[f, c, s, 0] = sos[f, s, 1] * value - sos[f, s, 4] * y + zi[f, c, s, 1]
+                        zi[f, c, s, 1] = sos[f, s, 2] * value - sos[f, s, 5] * y
+                        value = y
+                    out[f, n, c] = value
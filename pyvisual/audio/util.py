@@ -1,22 +1,304 @@
 import sys
+import threading
 import numpy as np
 from scipy import signal
 
+try:
+    from pyvisual.audio.sos import sosfilt_bank
+except ImportError:
+    sosfilt_bank = None
+
 def dump_blocks(*blocks, file=sys.stderr):
     for samples in zip(*blocks):
         print(" ".join(map(str, samples)), file=file)
 
 class Filter:
-    def __init__(self, filter_type, order, freq, sample_freq, filter_kwargs):
+    # Filter designed by filter_type (scipy.signal.butter for example). By default the filter is run as cascade of
+    # second order sections (sosfilt), which stays stable for high orders and cutoffs that are low relative to the
+    # sample rate, unlike the transfer function form (sos=False, lfilter).
+    def __init__(self, filter_type, order, freq, sample_freq, filter_kwargs, sos=True):
         norm_freq = freq / (sample_freq * 0.5)
-        self._b, self._a = filter_type(order, norm_freq, **filter_kwargs)
-        self._zf = signal.lfilter_zi(self._b, self._a)
+        self.sos = None
+        if sos:
+            self.sos = np.asarray(filter_type(order, norm_freq, output="sos", **filter_kwargs), dtype=np.float64)
+            self._zf = signal.sosfilt_zi(self.sos)
+        else:
+            self._b, self._a = filter_type(order, norm_freq, **filter_kwargs)
+            self._zf = signal.lfilter_zi(self._b, self._a)
         self._first_block = True
 
-    def process(self, block):
+    @property
+    def sections(self):
+        return len(self.sos) if self.sos is not None else 0
+
+    def _init_state(self, samples):
+        # steady state for the first sample (for each channel)
         if self._first_block:
             self._first_block = False
-            self._zf = self._zf * block[0]
-        out, self._zf = signal.lfilter(self._b, self._a, block, zi=self._zf)
+            channels = samples.shape[1:]
+            # (sections, 2, channels...) for sos, (order, channels...) otherwise
+            self._zf = self._zf.reshape(self._zf.shape + (1,) * len(channels)) * samples[0]
+
+    def process(self, samples):
+        # filters samples along the first axis, of shape (samples,) or (samples, channels)
+        if len(samples) == 0:
+            return np.zeros(samples.shape)
+        self._init_state(samples)
+        if self.sos is not None:
+            out, self._zf = signal.sosfilt(self.sos, samples, axis=0, zi=self._zf)
+        else:
+            out, self._zf = signal.lfilter(self._b, self._a, samples, axis=0, zi=self._zf)
         return out
 
+class FilterBank:
+    # SOS filters (see Filter) that are applied to the same samples, all of them are run with one call of the
+    # compiled kernel (see sos.pyx). Filters may be processed from different threads, the first one processing
+    # a new version of the samples runs all filters, the others take their results.
+    def __init__(self):
+        self._filters = []
+        self._lock = threading.Lock()
+        # version of the samples the results are of, and results by filter
+        self._version = None
+        self._results = {}
+
+    def __len__(self):
+        return len(self._filters)
+
+    def add(self, filter):
+        assert filter.sos is not None
+        with self._lock:
+            if filter not in self._filters:
+                self._filters.append(filter)
+
+    def remove(self, filter):
+        with self._lock:
+            if filter in self._filters:
+                self._filters.remove(filter)
+            self._results.pop(filter, None)
+
+    def process(self, filter, samples, version):
+        # returns the filtered samples, version identifies the samples (changes whenever they change)
+        with self._lock:
+            if version != self._version:
+                self._version = version
+                self._results = self._process_all(samples)
+            out = self._results.get(filter)
+            if out is None:
+                # (added after the others were run)
+                out = filter.process(samples)
+                self._results[filter] = out
+            return out
+
+    def _process_all(self, samples):
+        filters = self._filters
+        if len(samples) == 0 or len(filters) == 0:
+            return {}
+        if sosfilt_bank is None or len(filters) == 1:
+            return { filter : filter.process(samples) for filter in filters }
+
+        for filter in filters:
+            filter._init_state(samples)
+        x = np.ascontiguousarray(samples.reshape((len(samples), -1)), dtype=np.float64)
+        channels = x.shape[1]
+        sections = max(filter.sections for filter in filters)
+        # padded with sections passing samples through
+        sos = np.zeros((len(filters), sections, 6))
+        sos[:, :, [0, 3]] = 1.0
+        zi = np.zeros((len(filters), channels, sections, 2))
+        for i, filter in enumerate(filters):
+            sos[i, :filter.sections] = filter.sos
+            zi[i, :, :filter.sections] = filter._zf.reshape((filter.sections, 2, channels)).transpose(2, 0, 1)
+        out = np.empty((len(filters), len(x), channels))
+        sosfilt_bank(sos, x, zi, out)
+
+        results = {}
+        for i, filter in enumerate(filters):
+            filter._zf = zi[i, :, :filter.sections].transpose(1, 2, 0).reshape(filter._zf.shape)
+            results[filter] = out[i].reshape(samples.shape)
+        return results
+
+class SampleRingBuffer:
+    # Single producer / single consumer ring buffer of float32 samples that are read in blocks of a fixed size.
+    # The producer (audio thread) only moves the write index and the consumer only the read index,
+    # so neither needs a lock. Samples that don't fit anymore are dropped (overrun).
+    # The capacity is a multiple of the block size, so each block is contiguous in the buffer.
+    def __init__(self, block_size, capacity_blocks=64):
+        self.block_size = block_size
+        self.capacity = block_size * capacity_blocks
+        self._samples = np.zeros(self.capacity, dtype=np.float32)
+        self._blocks = self._samples.reshape(capacity_blocks, block_size)
+        # total number of samples written / read, positions in the buffer are modulo capacity
+        self._write_index = 0
+        self._read_index = 0
+
+        # writes that dropped samples, and number of dropped samples
+        self.overruns = 0
+        self.dropped_samples = 0
+        # reads that found no complete block
+        self.underruns = 0
+
+    def write(self, samples):
+        # copies samples (anything supporting the buffer protocol) into the buffer, returns number of written samples
+        samples = np.frombuffer(samples, dtype=np.float32) if not isinstance(samples, np.ndarray) else samples
+        count = len(samples)
+        free = self.free_samples
+        if count > free:
+            self.overruns += 1
+            self.dropped_samples += count - free
+            samples = samples[:free]
+            count = free
+        start = self._write_index % self.capacity
+        first = min(count, self.capacity - start)
+        self._samples[start:start+first] = samples[:first]
+        self._samples[:count-first] = samples[first:count]
+        # publish the samples only after they're written
+        self._write_index += count
+        return count
+
+    @property
+    def free_samples(self):
+        return self.capacity - (self._write_index - self._read_index)
+
+    @property
+    def available_blocks(self):
+        return (self._write_index - self._read_index) // self.block_size
+
+    def _readable(self, max_blocks):
+        count = self.available_blocks
+        if max_blocks is not None:
+            count = min(count, max_blocks)
+        if count == 0:
+            self.underruns += 1
+        return (self._read_index // self.block_size) % len(self._blocks), count
+
+    def peek_blocks(self, max_blocks=None):
+        # views of the complete blocks in the buffer, valid until they're consumed
+        first, count = self._readable(max_blocks)
+        return [ self._blocks[(first + i) % len(self._blocks)] for i in range(count) ]
+
+    def consume(self, count):
+        self._read_index += count * self.block_size
+
+    def read_blocks(self, max_blocks=None, out=None):
+        # copies the complete blocks in the buffer into one array (a row for each block) and consumes them
+        # (into out if given, which must have a row for each block that is read)
+        first, count = self._readable(max_blocks)
+        indices = (first + np.arange(count)) % len(self._blocks)
+        blocks = np.take(self._blocks, indices, axis=0, out=out[:count] if out is not None else None)
+        self.consume(count)
+        return blocks
+
+class SampleHistory:
+    # The last samples of a stream in a circular buffer that stores each sample twice (at i and i + capacity),
+    # so each window of the last capacity samples is a contiguous view of it.
+    def __init__(self, dtype=np.float64):
+        self.dtype = dtype
+        self.capacity = 0
+        self._buffer = None
+        # total number of samples written
+        self.written = 0
+
+    def reserve(self, capacity):
+        if capacity <= self.capacity:
+            return
+        # keep the last samples, windows might still need them
+        count = min(self.written, self.capacity)
+        kept = None
+        if count:
+            start = (self.written - count) % self.capacity
+            kept = self._buffer[start:start+count].copy()
+        self.capacity = capacity
+        self._buffer = np.zeros(2 * capacity, dtype=self.dtype)
+        if kept is not None:
+            self._write(kept, (self.written - count) % capacity)
+
+    def _write(self, samples, position):
+        capacity = self.capacity
+        count = len(samples)
+        first = min(count, capacity - position)
+        for offset in (0, capacity):
+            self._buffer[offset+position:offset+position+first] = samples[:first]
+            self._buffer[offset:offset+count-first] = samples[first:]
+
+    def write(self, samples):
+        # appends samples, at most capacity at once
+        self._write(samples, self.written % self.capacity)
+        self.written += len(samples)
+
+    def window(self, start, length):
+        # view of the samples from total index start on, which must be one of the last capacity samples
+        assert self.written - self.capacity <= start and start + length <= self.written
+        position = start % self.capacity
+        return self._buffer[position:position+length]
+
+class StreamingSTFT:
+    # Short-time Fourier transform of a stream of samples: magnitudes of a window of length samples every hop samples
+    # (hop < length gives overlapping windows). Samples are kept in a SampleHistory, so each window is a contiguous
+    # view of it. All windows completed by a call of process are transformed with one rfft call.
+    def __init__(self, length, hop, window):
+        assert len(window) == length and 0 < hop
+        self.length = length
+        self.hop = hop
+        self.window = window
+        self._history = SampleHistory()
+        # windowed samples of the windows of a process call
+        self._frames = None
+        # end of the next window
+        self._next_end = length
+
+    @property
+    def bins(self):
+        return self.length // 2 + 1
+
+    def process(self, blocks):
+        # appends blocks of samples, returns magnitudes of the windows completed by them as array (windows, bins)
+        count = sum(len(block) for block in blocks)
+        # samples of all windows completed now must fit into the buffer at once
+        history = self._history
+        history.reserve(self.length + count)
+        for block in blocks:
+            history.write(block)
+
+        ends = range(self._next_end, history.written + 1, self.hop)
+        if len(ends) == 0:
+            return np.zeros((0, self.bins))
+        self._next_end = ends[-1] + self.hop
+        if self._frames is None or len(self._frames) < len(ends):
+            self._frames = np.zeros((len(ends), self.length))
+        frames = self._frames[:len(ends)]
+        for frame, end in zip(frames, ends):
+            np.multiply(history.window(end - self.length, self.length), self.window, out=frame)
+        return np.abs(np.fft.rfft(frames, axis=1))
+
+class BandPlan:
+    # Maps count bins to bands with gamma-spaced bin ranges (band i has bins [first[i], last[i])), see
+    # https://dlbeer.co.nz/articles/fftvis.html for the gamma formula. The means of all bands are computed with
+    # one np.add.reduceat call. Bands without bins are NaN, like the mean of an empty slice.
+    def __init__(self, bins, count, gamma):
+        self.bins = bins
+        self.count = count
+        self.gamma = gamma
+
+        positions = (np.arange(count + 1) / count) ** (1 / gamma) * bins
+        # (int truncation like before, positions are not negative)
+        edges = positions.astype(np.int64)
+        self.first = edges[:-1]
+        self.last = edges[1:]
+        self.sizes = self.last - self.first
+        self.empty = self.sizes == 0
+        # reduceat takes one index per band and sums up to the next index, empty bands get a dummy index
+        # (reduceat would return the element at the index for them)
+        self._indices = np.minimum(self.first, max(bins - 1, 0))
+        # frequency of a band is the one of its last bin (index -1 of empty leading bands wraps around, like before)
+        self.frequency_indices = self.last - 1
+
+    def apply(self, magnitudes):
+        # returns the mean magnitude of each band
+        assert len(magnitudes) == self.bins
+        if self.bins == 0:
+            return np.full(self.count, np.nan, dtype=np.float32)
+        sums = np.add.reduceat(magnitudes, self._indices)
+        with np.errstate(invalid="ignore", divide="ignore"):
+            means = sums / self.sizes
+        means[self.empty] = np.nan
+        return means.astype(np.float32)
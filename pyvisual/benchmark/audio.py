@@ -0,0 +1,177 @@
+#!/usr/bin/env python3
+
+# Measures the delivery of audio blocks from a synthetic producer thread (in place of the pulseaudio thread)
+# to a consumer reading blocks each frame (see audio.util.SampleRingBuffer).
+# - throughput: producer writes fragments as fast as possible, compared with copying fragments element-wise
+#   and reassembling blocks from fragment lists (as done before)
+# - jitter: producer writes fragments in real time, consumer reads at 60 fps, measures latency of blocks
+# Usage: python3 -m pyvisual.benchmark.audio [sample rate]
+
+import sys
+import time
+import ctypes
+import threading
+
+import numpy as np
+
+from pyvisual.audio.util import SampleRingBuffer
+
+BLOCK_SIZE = 1024
+FRAGMENT_SIZE = 256
+# (samples stay exact float32 values)
+THROUGHPUT_SAMPLES = 2 ** 23
+JITTER_SECONDS = 3.0
+FPS = 60.0
+
+def create_fragments(count, rng):
+    # fragments of varying sizes as pulseaudio delivers them, samples are their global index
+    sizes = rng.integers(FRAGMENT_SIZE // 2, FRAGMENT_SIZE * 2, size=count)
+    ends = np.cumsum(sizes)
+    samples = np.arange(ends[-1], dtype=np.float32)
+    return np.split(samples, ends[:-1])
+
+def fragment_view(address, count):
+    # view on samples at a pointer, as PulseAudioContext reads them
+    return np.frombuffer((ctypes.c_float * count).from_address(address), dtype=np.float32)
+
+def reassemble_lists(pointers, block_size):
+    # previous way: copying samples from the pointer element-wise, keeping fragments in lists and concatenating them to blocks
+    todo = []
+    todo_index = []
+    available = 0
+    blocks = []
+    for address, count in pointers:
+        fragment = np.array(np.fromiter(ctypes.cast(address, ctypes.POINTER(ctypes.c_float)), dtype=np.float32, count=count))
+        todo.append(fragment)
+        todo_index.append(0)
+        available += len(fragment)
+        while available >= block_size:
+            parts = []
+            needed = block_size
+            while needed > 0:
+                array, index = todo[0], todo_index[0]
+                part = array[index:index+needed]
+                parts.append(part)
+                needed -= len(part)
+                if index + len(part) == len(array):
+                    todo.pop(0)
+                    todo_index.pop(0)
+                else:
+                    todo_index[0] = index + len(part)
+            blocks.append(np.concatenate(parts))
+            available -= block_size
+    return blocks
+
+def measure_throughput(fragments):
+    # fragments are read from pointers like the ones pulseaudio passes
+    pointers = [ (fragment.ctypes.data, len(fragment)) for fragment in fragments ]
+    ring = SampleRingBuffer(BLOCK_SIZE)
+    def produce_all():
+        for address, count in pointers:
+            fragment = fragment_view(address, count)
+            while len(fragment):
+                free = ring.free_samples
+                if free == 0:
+                    time.sleep(0)
+                    continue
+                written = ring.write(fragment[:free])
+                fragment = fragment[written:]
+
+    total = sum(len(fragment) for fragment in fragments)
+    consumed = 0
+    valid = True
+    start = time.perf_counter()
+    producer = threading.Thread(target=produce_all)
+    producer.start()
+    while consumed + BLOCK_SIZE <= total:
+        blocks = ring.read_blocks()
+        if len(blocks) == 0:
+            time.sleep(0)
+            continue
+        valid = valid and blocks[0, 0] == consumed and blocks[-1, -1] == consumed + blocks.size - 1
+        consumed += blocks.size
+    elapsed = time.perf_counter() - start
+    producer.join()
+
+    # same thread, blocks read after each fragment
+    ring = SampleRingBuffer(BLOCK_SIZE)
+    blocks = []
+    start = time.perf_counter()
+    for address, count in pointers:
+        ring.write(fragment_view(address, count))
+        if ring.available_blocks:
+            blocks.append(ring.read_blocks())
+    serial_elapsed = time.perf_counter() - start
+    valid = valid and np.array_equal(np.concatenate(blocks).ravel(), np.arange(consumed, dtype=np.float32))
+
+    start = time.perf_counter()
+    blocks = reassemble_lists(pointers, BLOCK_SIZE)
+    list_elapsed = time.perf_counter() - start
+    valid = valid and np.array_equal(np.concatenate(blocks), np.arange(consumed, dtype=np.float32))
+    return consumed / elapsed, consumed / serial_elapsed, consumed / list_elapsed, valid
+
+def measure_jitter(sample_rate, rng):
+    ring = SampleRingBuffer(BLOCK_SIZE)
+    fragments = create_fragments(int(sample_rate * JITTER_SECONDS / FRAGMENT_SIZE) + 1, rng)
+    # time when each sample count was written
+    write_counts = []
+    write_times = []
+    running = True
+    def produce():
+        start = time.perf_counter()
+        written = 0
+        for fragment in fragments:
+            if not running:
+                break
+            # wait until the fragment would be complete in real time
+            delay = start + (written + len(fragment)) / sample_rate - time.perf_counter()
+            if delay > 0:
+                time.sleep(delay)
+            # (recorded before the samples are visible to the consumer)
+            written += len(fragment)
+            write_counts.append(written)
+            write_times.append(time.perf_counter())
+            ring.write(fragment)
+
+    producer = threading.Thread(target=produce)
+    producer.start()
+    latencies = []
+    blocks_per_frame = []
+    read_samples = 0
+    next_frame = time.perf_counter()
+    while producer.is_alive():
+        next_frame += 1.0 / FPS
+        delay = next_frame - time.perf_counter()
+        if delay > 0:
+            time.sleep(delay)
+        blocks = ring.read_blocks()
+        now = time.perf_counter()
+        blocks_per_frame.append(len(blocks))
+        counts = np.array(write_counts)
+        for block in blocks:
+            read_samples += len(block)
+            # block was complete with the write that reached its last sample
+            i = np.searchsorted(counts, read_samples)
+            latencies.append(now - write_times[i])
+    running = False
+    producer.join()
+    return np.array(latencies) * 1000.0, np.array(blocks_per_frame), ring
+
+if __name__ == "__main__":
+    sample_rate = int(sys.argv[1]) if len(sys.argv) > 1 else 44100
+    rng = np.random.default_rng(0)
+
+    fragments = create_fragments(THROUGHPUT_SAMPLES // FRAGMENT_SIZE, rng)
+    ring_rate, serial_rate, list_rate, valid = measure_throughput(fragments)
+    print("=== Throughput (%d samples in fragments of ~%d) ===" % (sum(len(f) for f in fragments), FRAGMENT_SIZE))
+    print("%-20s %8.1f Msamples/s" % ("ring buffer", ring_rate / 1e6))
+    print("%-20s %8.1f Msamples/s" % ("ring buffer serial", serial_rate / 1e6))
+    print("%-20s %8.1f Msamples/s" % ("fragment lists", list_rate / 1e6))
+    print("Same samples: %s" % valid)
+
+    latencies, blocks_per_frame, ring = measure_jitter(sample_rate, rng)
+    print("=== Jitter (%d Hz, %d fps, %.1f s) ===" % (sample_rate, FPS, JITTER_SECONDS))
+    print("block latency: %.2f ms mean, %.2f ms std, %.2f ms p95, %.2f ms max" % (latencies.mean(), latencies.std(),
+        np.percentile(latencies, 95), latencies.max()))
+    print("blocks per frame: %.2f mean, %.2f std" % (blocks_per_frame.mean(), blocks_per_frame.std()))
+    print("overruns: %d (%d samples), underruns: %d" % (ring.overruns, ring.dropped_samples, ring.underruns))
@@ -0,0 +1,111 @@
+#!/usr/bin/env python3
+
+# Compares processing all samples of a frame at once (AudioData with one contiguous frame buffer)
+# with processing each block of a frame (as done before, with a list of blocks) for a filter -> abs chain,
+# both without a graph, and the AudioFilter -> AbsAudio nodes in a graph (including graph overhead).
+# Usage: python3 -m pyvisual.benchmark.audio_nodes [sample rate] [channels]
+
+import pyximport; pyximport.install()
+
+import sys
+import time
+import math
+
+import numpy as np
+from scipy import signal
+
+import pyvisual.node as node_meta
+from pyvisual.audio import util
+from pyvisual.editor.graph import NodeGraph
+from pyvisual.node.io.audio import AudioData
+
+FRAMES = 600
+FPS = 60.0
+ORDER = 5
+CUTOFF = 50.0
+
+def create_frames(sample_rate, channels, rng):
+    # blocks of about one frame (like InputPulseAudio chooses them), sometimes one more or less per frame
+    block_size = 2 ** int(math.log2(sample_rate / FPS))
+    blocks_per_frame = sample_rate / FPS / block_size
+    frames = []
+    for frame in range(FRAMES):
+        count = int(blocks_per_frame * (frame + 1)) - int(blocks_per_frame * frame) + rng.integers(-1, 2)
+        audio = AudioData(sample_rate, block_size, channels)
+        audio.blocks = rng.standard_normal((max(0, count), block_size) + ((channels,) if channels > 1 else ()))
+        frames.append(audio)
+    return frames
+
+def run_previous(frames):
+    # filter and abs node as they were, a list of new blocks each frame
+    audio = frames[0]
+    filters = [ util.Filter(signal.butter, ORDER, CUTOFF, audio.sample_rate, {"btype" : "low", "analog" : False})
+            for channel in range(audio.channels) ]
+    outputs = []
+    start = time.perf_counter()
+    for audio in frames:
+        filtered = []
+        for block in audio.blocks:
+            if audio.channels == 1:
+                filtered.append(filters[0].process(block))
+            else:
+                filtered.append(np.stack([ f.process(block[:, i]) for i, f in enumerate(filters) ], axis=1))
+        outputs.append([ np.abs(block) for block in filtered ])
+    elapsed = time.perf_counter() - start
+    return elapsed / len(frames), outputs
+
+def run_frames(frames):
+    # what the nodes do now, an output frame buffer reused each frame
+    audio = frames[0]
+    audio_filter = util.Filter(signal.butter, ORDER, CUTOFF, audio.sample_rate, {"btype" : "low", "analog" : False})
+    filtered = AudioData(audio.sample_rate, audio.block_size, audio.channels)
+    output = AudioData(audio.sample_rate, audio.block_size, audio.channels)
+    outputs = []
+    start = time.perf_counter()
+    for audio in frames:
+        filtered.resize(len(audio))
+        filtered.frames[:] = audio_filter.process(audio.frames)
+        np.abs(filtered.blocks, out=output.resize(len(filtered)))
+        outputs.append(output.blocks.copy())
+    elapsed = time.perf_counter() - start
+    return elapsed / len(frames), outputs
+
+def run_nodes(frames):
+    graph = NodeGraph()
+    audio_filter = graph.create_node(node_meta.NodeSpec.from_name("AudioFilter"),
+            values={"i_order" : ORDER, "i_cutoff" : CUTOFF})
+    abs_audio = graph.create_node(node_meta.NodeSpec.from_name("AbsAudio"))
+    graph.create_connection(audio_filter, "o_output", abs_audio, "i_input")
+    outputs = []
+    elapsed = 0.0
+    for audio in frames:
+        audio_filter.get_input("input").value = audio
+        start = time.perf_counter()
+        graph.evaluate()
+        elapsed += time.perf_counter() - start
+        outputs.append(abs_audio.get_output("output").value.blocks.copy())
+    graph.stop()
+    return elapsed / len(frames), outputs
+
+def same_outputs(outputs0, outputs1):
+    for blocks0, blocks1 in zip(outputs0, outputs1):
+        if len(blocks0) != len(blocks1):
+            return False
+        if len(blocks0) and not np.allclose(np.array(blocks0), blocks1, rtol=1e-4, atol=1e-5):
+            return False
+    return True
+
+if __name__ == "__main__":
+    sample_rate = int(sys.argv[1]) if len(sys.argv) > 1 else 44100
+    channels = int(sys.argv[2]) if len(sys.argv) > 2 else 1
+    frames = create_frames(sample_rate, channels, np.random.default_rng(0))
+    samples = sum(len(audio.frames) for audio in frames) / len(frames)
+    print("=== %d Hz, %d channels, blocks of %d, %.0f samples/frame ===" % (sample_rate, channels,
+        frames[0].block_size, samples))
+    previous_time, previous_outputs = run_previous(frames)
+    frame_time, frame_outputs = run_frames(frames)
+    node_time, node_outputs = run_nodes(frames)
+    print("%-20s %8.1f us/frame" % ("blocks", previous_time * 1e6))
+    print("%-20s %8.1f us/frame" % ("frame buffer", frame_time * 1e6))
+    print("%-20s %8.1f us/frame" % ("nodes", node_time * 1e6))
+    print("Same results: %s" % (same_outputs(previous_outputs, frame_outputs) and same_outputs(previous_outputs, node_outputs)))
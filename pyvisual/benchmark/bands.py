@@ -0,0 +1,87 @@
+#!/usr/bin/env python3
+
+# Compares the QuantizeFFT node (band plan, see audio.util.BandPlan) with its previous implementation
+# (frequency mask and a loop over the bands) on random spectra for different band counts.
+# Usage: python3 -m pyvisual.benchmark.bands [fft length]
+
+import pyximport; pyximport.install()
+
+import sys
+import time
+import warnings
+
+import numpy as np
+
+import pyvisual.node as node_meta
+from pyvisual.editor.graph import NodeGraph
+from pyvisual.node.io.audio import FFTData
+
+FRAMES = 600
+SAMPLE_RATE = 44100
+COUNTS = [16, 128, 512]
+GAMMA = 2.0
+MIN_FREQ = 20.0
+MAX_FREQ = 16000.0
+
+def previous_quantize(fft, count, gamma, min_freq, max_freq):
+    # QuantizeFFT node as it was, without node inputs
+    mask = (fft.frequencies > min_freq) & (fft.frequencies <= max_freq)
+    filtered_fft = FFTData(fft.magnitudes[mask], fft.frequencies[mask], fft.bin_resolution)
+
+    magnitudes = np.zeros((count,), dtype=np.float32)
+    frequencies = np.zeros((count,), dtype=np.float32)
+    for i in range(count):
+        first_index = int(((i / count) ** (1 / gamma)) * len(filtered_fft.magnitudes))
+        last_index = int((((i+1) / count) ** (1 / gamma)) * len(filtered_fft.magnitudes))
+        magnitudes[i] = filtered_fft.magnitudes[first_index:last_index].mean()
+        frequencies[i] = filtered_fft.frequencies[last_index - 1]
+    return FFTData(magnitudes, frequencies, fft.bin_resolution)
+
+def create_spectra(length, rng):
+    bins = length // 2 + 1
+    bin_resolution = SAMPLE_RATE / length
+    frequencies = np.arange(bins) * bin_resolution
+    return [ FFTData(rng.random(bins), frequencies, bin_resolution) for i in range(FRAMES) ]
+
+def run_previous(spectra, count):
+    outputs = []
+    start = time.perf_counter()
+    with warnings.catch_warnings():
+        # (mean of empty bands)
+        warnings.simplefilter("ignore", RuntimeWarning)
+        for fft in spectra:
+            outputs.append(previous_quantize(fft, count, GAMMA, MIN_FREQ, MAX_FREQ))
+    return (time.perf_counter() - start) / len(spectra), outputs
+
+def run_node(spectra, count):
+    graph = NodeGraph()
+    node = graph.create_node(node_meta.NodeSpec.from_name("QuantizeFFT"),
+            values={"i_count" : count, "i_gamma" : GAMMA, "i_min_freq" : MIN_FREQ, "i_max_freq" : MAX_FREQ})
+    outputs = []
+    elapsed = 0.0
+    for fft in spectra:
+        node.get_input("input").value = fft
+        start = time.perf_counter()
+        graph.evaluate()
+        elapsed += time.perf_counter() - start
+        outputs.append(node.get_output("output").value)
+    graph.stop()
+    return elapsed / len(spectra), outputs
+
+def same_outputs(outputs0, outputs1):
+    for output0, output1 in zip(outputs0, outputs1):
+        if not np.allclose(output0.magnitudes, output1.magnitudes, equal_nan=True):
+            return False
+        if not np.array_equal(output0.frequencies, output1.frequencies):
+            return False
+    return True
+
+if __name__ == "__main__":
+    length = int(sys.argv[1]) if len(sys.argv) > 1 else 4096
+    spectra = create_spectra(length, np.random.default_rng(0))
+    print("=== %d bins, gamma %.1f, %.0f - %.0f Hz ===" % (len(spectra[0]), GAMMA, MIN_FREQ, MAX_FREQ))
+    for count in COUNTS:
+        previous_time, previous_outputs = run_previous(spectra, count)
+        node_time, outputs = run_node(spectra, count)
+        print("%4d bands: previous %8.1f us/frame, node %8.1f us/frame, same results: %s" % (count,
+            previous_time * 1e6, node_time * 1e6, same_outputs(previous_outputs, outputs)))
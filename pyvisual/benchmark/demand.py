@@ -0,0 +1,138 @@
+#!/usr/bin/env python3
+
+# Compares evaluation with and without demand driven skipping (see Graph.demand_driven) in all evaluation modes:
+# all nodes, dirty scheduling, worker threads, and dirty scheduling with worker threads.
+# A ChooseTexture selects one of several shader chains, each chain is driven by a parameter node that is
+# evaluated in parallel. Shader nodes are stand-ins doing numpy work instead of rendering (no OpenGL context needed).
+# Reports the time per frame and the shader nodes evaluated per frame, and checks that each mode shows
+# the same textures as evaluating all nodes without skipping.
+# Usage: python3 -m pyvisual.benchmark.demand [chains] [chain length]
+
+import pyximport; pyximport.install()
+
+import sys
+import time
+
+import numpy as np
+
+import pyvisual.node as node_meta
+from pyvisual.node import dtype
+from pyvisual.node.base import Node
+from pyvisual.editor.graph import NodeGraph
+
+FRAMES = 300
+# frames between switching to another chain
+SWITCH_INTERVAL = 30
+WORKER_THREADS = 2
+
+class DemandBenchmarkParameter(Node):
+    # changes each frame, evaluated in worker threads
+    class Meta:
+        outputs = [
+            {"name" : "output", "dtype" : dtype.float},
+        ]
+
+    PARALLEL_EVALUATION = True
+
+    def __init__(self):
+        super().__init__(always_evaluate=True)
+        self._frame = 0
+        self._x = np.linspace(0.0, 1.0, 4096)
+
+    def _evaluate(self):
+        self._frame += 1
+        self.set("output", float(np.sin(self._x * self._frame).sum()))
+
+class DemandBenchmarkShader(Node):
+    # stand-in of a shader node, its output texture is a tuple of its id and its inputs
+    class Meta:
+        inputs = [
+            {"name" : "input", "dtype" : dtype.tex2d},
+            {"name" : "parameter", "dtype" : dtype.float},
+            {"name" : "enabled", "dtype" : dtype.bool, "dtype_args" : {"default" : True}},
+        ]
+        outputs = [
+            {"name" : "output", "dtype" : dtype.tex2d},
+        ]
+
+    USES_OPENGL = True
+
+    def __init__(self):
+        super().__init__()
+        self.evaluations = 0
+        self._pixels = np.linspace(0.0, 1.0, 256 * 256).reshape(256, 256)
+
+    def _evaluate(self):
+        self.evaluations += 1
+        np.sin(self._pixels * self.get("parameter"))
+        self.set("output", (self.id, self.get("parameter"), self.get("input")))
+
+class DemandBenchmarkOutput(Node):
+    class Meta:
+        inputs = [
+            {"name" : "input", "dtype" : dtype.tex2d},
+        ]
+
+    USES_OPENGL = True
+
+    def __init__(self):
+        super().__init__(always_evaluate=True)
+        self.shown = []
+
+    def _evaluate(self):
+        self.shown.append(self.get("input"))
+
+def create_graph(chains, length):
+    graph = NodeGraph()
+    spec = node_meta.NodeSpec.from_name
+    choose = graph.create_node(spec("ChooseTexture"), values={"i_count" : chains})
+    output = graph.create_node(spec("DemandBenchmarkOutput"))
+    # (ChooseTexture creates its ports in its first evaluation)
+    graph.evaluate()
+    shaders = []
+    for i in range(chains):
+        parameter = graph.create_node(spec("DemandBenchmarkParameter"))
+        chain = []
+        for j in range(length):
+            shader = graph.create_node(spec("DemandBenchmarkShader"))
+            graph.create_connection(parameter, "o_output", shader, "i_parameter")
+            if chain:
+                graph.create_connection(chain[-1], "o_output", shader, "i_input")
+            chain.append(shader)
+        # (the enabled flag is connected last, it closes a cycle and the chain is evaluated before ChooseTexture)
+        graph.create_connection(chain[-1], "o_output", choose, "i_in%d" % i)
+        graph.create_connection(choose, "o_enabled%d" % i, chain[0], "i_enabled")
+        shaders.extend(chain)
+    graph.create_connection(choose, "o_out", output, "i_input")
+    return graph, choose, output, shaders
+
+def run(chains, length, dirty_scheduling, worker_threads, demand_driven):
+    graph, choose, output, shaders = create_graph(chains, length)
+    graph.dirty_scheduling = dirty_scheduling
+    graph.worker_threads = worker_threads
+    graph.demand_driven = demand_driven
+    evaluations = sum([ shader.evaluations for shader in shaders ])
+
+    start = time.perf_counter()
+    for frame in range(FRAMES):
+        if frame % SWITCH_INTERVAL == 0:
+            choose.get_input("index").value = frame // SWITCH_INTERVAL % chains
+        graph.evaluate()
+    elapsed = time.perf_counter() - start
+    evaluations = sum([ shader.evaluations for shader in shaders ]) - evaluations
+    graph.stop()
+    return elapsed / FRAMES, evaluations / FRAMES, output.shown
+
+if __name__ == "__main__":
+    chains = int(sys.argv[1]) if len(sys.argv) > 1 else 8
+    length = int(sys.argv[2]) if len(sys.argv) > 2 else 4
+    print("=== %d chains of %d shaders ===" % (chains, length))
+    reference = None
+    for name, dirty_scheduling, worker_threads in (("all nodes", False, 0), ("dirty scheduling", True, 0),
+            ("worker threads", False, WORKER_THREADS), ("dirty, worker threads", True, WORKER_THREADS)):
+        for demand_driven in (False, True):
+            frame_time, evaluations, shown = run(chains, length, dirty_scheduling, worker_threads, demand_driven)
+            if reference is None:
+                reference = shown
+            print("%-36s %8.3f ms/frame, %5.1f shaders/frame, same textures: %s" % (name + (", demand driven" if demand_driven else ""),
+                frame_time * 1000.0, evaluations, shown == reference))
@@ -0,0 +1,134 @@
+#!/usr/bin/env python3
+
+# Runs the recording sinks (see util.encoder) headless on random frames in a temporary directory: frames per second
+# each sink writes, whether the written files read back to the frames, and segment rotation by time and size.
+# Also compares the bytes downloaded per frame (rgba / rgb24 / yuv420) and the error of the yuv420 conversion.
+# The ffmpeg sink is skipped if ffmpeg isn't installed.
+# Usage: python3 -m pyvisual.benchmark.encoder [frames]
+
+import os
+import shutil
+import sys
+import tempfile
+import time
+
+import numpy as np
+from PIL import Image
+
+from pyvisual.util import encoder
+
+SIZE = (1920, 1080)
+FPS = 60.0
+
+def create_frames(count, format, rng):
+    # smooth frames (gradients with noise) like rendered content, chroma subsampling loses little on these
+    w, h = SIZE
+    y, x = np.mgrid[0:h, 0:w].astype(np.float32)
+    frames = []
+    for i in range(count):
+        rgb = np.stack([x / w * 255.0, y / h * 255.0, np.full_like(x, (i * 37) % 256)], axis=2)
+        rgb += rng.normal(0.0, 2.0, size=rgb.shape)
+        rgb = np.clip(rgb, 0, 255).astype(np.uint8)
+        if format == "rgba":
+            rgb = np.concatenate([rgb, np.full((h, w, 1), 255, dtype=np.uint8)], axis=2)
+        elif format == "yuv420":
+            rgb = encoder.rgb_to_yuv420(rgb)
+        frames.append(rgb)
+    return frames
+
+def read_y4m(path):
+    # returns the frames of a y4m file as yuv420 frames
+    data = open(path, "rb").read()
+    header, data = data.split(b"\n", 1)
+    w, h = SIZE
+    frame_bytes = w * h * 3 // 2
+    frames = []
+    while data:
+        assert data.startswith(b"FRAME\n")
+        planes = np.frombuffer(data[6:6 + frame_bytes], dtype=np.uint8)
+        y = planes[:w * h].reshape(h, w)
+        u = planes[w * h:w * h * 5 // 4].reshape(h // 2, w // 2)
+        v = planes[w * h * 5 // 4:].reshape(h // 2, w // 2)
+        frames.append(np.concatenate([y, np.concatenate([u, v], axis=1)]))
+        data = data[6 + frame_bytes:]
+    return header.decode("ascii"), frames
+
+def run_sink(directory, backend, format, frames, **options):
+    path = os.path.join(directory, "%s_%s%s" % (backend, format, encoder.SINKS[backend].EXTENSION))
+    sink = encoder.create_sink(backend, path, SIZE, FPS, format, **options)
+    start = time.perf_counter()
+    for frame in frames:
+        sink.write(frame)
+    sink.close()
+    elapsed = time.perf_counter() - start
+    return path, len(frames) / elapsed
+
+def check_sink(backend, format, path, frames):
+    if backend == "raw":
+        data = np.fromfile(path, dtype=np.uint8)
+        return np.array_equal(data, np.concatenate([ frame.ravel() for frame in frames ]))
+    if backend == "y4m":
+        header, written = read_y4m(path)
+        if format != "yuv420":
+            frames = [ encoder.rgb_to_yuv420(frame) for frame in frames ]
+        return header.startswith("YUV4MPEG2 W%d H%d" % SIZE) and len(written) == len(frames) \
+                and all(np.array_equal(a, b) for a, b in zip(written, frames))
+    if backend == "png":
+        names = sorted(os.listdir(path))
+        if format == "yuv420":
+            frames = [ encoder.yuv420_to_rgb(frame, SIZE) for frame in frames ]
+        return len(names) == len(frames) and all(np.array_equal(np.asarray(Image.open(os.path.join(path, name))), frame)
+                for name, frame in zip(names, frames))
+    return os.path.getsize(path) > 0
+
+def check_segments(directory, frames):
+    # 1 / 3 seconds per segment, and segments of at most ~2 frames
+    path = os.path.join(directory, "segments.raw")
+    sink = encoder.SegmentedSink("raw", path, SIZE, FPS, "rgba", max_seconds=1.0 / 3.0)
+    for frame in frames:
+        sink.write(frame)
+    sink.close()
+    per_segment = int(FPS / 3.0)
+    by_time = [ os.path.getsize(p) // frames[0].nbytes for p in sink.paths ]
+    expected = [ per_segment ] * (len(frames) // per_segment) + ([ len(frames) % per_segment ] if len(frames) % per_segment else [])
+
+    path = os.path.join(directory, "segments_size.y4m")
+    sink = encoder.SegmentedSink("y4m", path, SIZE, FPS, "rgba", max_bytes=2 * SIZE[0] * SIZE[1] * 3 // 2)
+    for frame in frames[:10]:
+        sink.write(frame)
+    sink.close()
+    by_size = [ len(read_y4m(p)[1]) for p in sink.paths ]
+    return by_time, by_time == expected, by_size, by_size == [2] * 5
+
+if __name__ == "__main__":
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 60
+    rng = np.random.default_rng(0)
+    w, h = SIZE
+
+    print("=== Bytes per %dx%d frame ===" % SIZE)
+    for format in encoder.FRAME_FORMATS:
+        nbytes = int(np.prod(encoder.frame_shape(SIZE, format)))
+        print("%-8s %8.2f MB, %6.1f MB/s at %d fps, %3.0f%% less than rgba" % (format, nbytes / 2**20,
+            nbytes * FPS / 2**20, FPS, 100.0 * (1.0 - nbytes / (w * h * 4))))
+    rgb = create_frames(1, "rgb24", rng)[0]
+    restored = encoder.yuv420_to_rgb(encoder.rgb_to_yuv420(rgb), SIZE)
+    error = np.abs(restored.astype(np.int32) - rgb.astype(np.int32))
+    print("yuv420 round trip error: %.2f mean, %d max" % (error.mean(), error.max()))
+
+    directory = tempfile.mkdtemp(prefix="pyvisual_encoder_")
+    try:
+        print("=== Sinks (%d frames) ===" % count)
+        backends = [ "raw", "y4m", "png" ] + ([ "ffmpeg" ] if shutil.which("ffmpeg") else [])
+        for backend in backends:
+            for format in encoder.SINKS[backend].FORMATS:
+                frames = create_frames(count, format, rng)
+                options = {"preset" : "veryfast"} if backend == "ffmpeg" else {}
+                path, fps = run_sink(directory, backend, format, frames, **options)
+                print("%-8s %-8s %7.1f fps, same frames: %s" % (backend, format, fps, check_sink(backend, format, path, frames)))
+
+        by_time, time_valid, by_size, size_valid = check_segments(directory, create_frames(count, "rgba", rng))
+        print("=== Segments ===")
+        print("by time: frames per segment %s, valid: %s" % (by_time, time_valid))
+        print("by size: frames per segment %s, valid: %s" % (by_size, size_valid))
+    finally:
+        shutil.rmtree(directory)
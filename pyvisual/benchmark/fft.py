@@ -0,0 +1,126 @@
+#!/usr/bin/env python3
+
+# Compares the FFT node (streaming STFT, see audio.util.StreamingSTFT) with its previous implementation
+# (concatenating every 4 blocks, complex fft and smoothing over a list of spectra) on random audio,
+# and measures the node with overlapping windows (more spectra per frame).
+# Usage: python3 -m pyvisual.benchmark.fft [block size]
+
+import pyximport; pyximport.install()
+
+import sys
+import time
+
+import numpy as np
+
+import pyvisual.node as node_meta
+from pyvisual.editor.graph import NodeGraph
+from pyvisual.node.io.audio import AudioData
+from pyvisual.node.op.audio import WINDOW_FN, create_gauss_kernel
+
+FRAMES = 600
+SAMPLE_RATE = 44100
+SMOOTH_COUNT = 8
+SMOOTH_SIGMA = 1.0
+
+class PreviousFFT:
+    # FFT node as it was, without node inputs
+    def __init__(self):
+        self._blocks = []
+        self._last_magnitudes = []
+        self._last_magnitudes_size = None
+        self._last_magnitudes_kernel = create_gauss_kernel(SMOOTH_COUNT, SMOOTH_SIGMA)
+        self.output = None
+
+    def _process_fft(self, blocks, samplerate):
+        samples = np.concatenate(blocks)
+        M = len(samples)
+        window = WINDOW_FN[0](M)
+        samples = samples * window
+
+        magnitudes = np.abs(np.fft.fft(samples, axis=0)[:M // 2 + 1:-1])
+        if len(magnitudes) != self._last_magnitudes_size:
+            self._last_magnitudes_size = len(magnitudes)
+            self._last_magnitudes = []
+        self._last_magnitudes.append(magnitudes)
+
+        while len(self._last_magnitudes) > SMOOTH_COUNT:
+            self._last_magnitudes.pop(0)
+        if len(self._last_magnitudes) < SMOOTH_COUNT:
+            return
+
+        last_magnitudes = np.array(self._last_magnitudes)
+        self.output = np.sum(last_magnitudes * self._last_magnitudes_kernel, axis=0)
+
+    def evaluate(self, audio):
+        N = 4
+        self._blocks.extend(audio.blocks)
+        generated_fft = False
+        while len(self._blocks) >= N:
+            fft_blocks = self._blocks[:N]
+            for i in range(N):
+                self._blocks.pop(0)
+            self._process_fft(fft_blocks, audio.sample_rate)
+            generated_fft = True
+        if not generated_fft and len(self._last_magnitudes) != 0:
+            self._last_magnitudes.append(self._last_magnitudes[-1])
+
+def create_frames(block_size, rng):
+    # about one block per frame at 60 fps, with some jitter
+    frames = []
+    for frame in range(FRAMES):
+        audio = AudioData(SAMPLE_RATE, block_size)
+        for i in range(rng.integers(0, 3)):
+            audio.append(rng.standard_normal(block_size))
+        frames.append(audio)
+    return frames
+
+def run_previous(frames):
+    node = PreviousFFT()
+    outputs = []
+    start = time.perf_counter()
+    for audio in frames:
+        node.evaluate(audio)
+        outputs.append(node.output)
+    return (time.perf_counter() - start) / len(frames), outputs
+
+def run_node(frames, overlap):
+    graph = NodeGraph()
+    node = graph.create_node(node_meta.NodeSpec.from_name("FFT"),
+            values={"i_smooth_count" : SMOOTH_COUNT, "i_smooth_sigma" : SMOOTH_SIGMA, "i_overlap" : overlap})
+    outputs = []
+    elapsed = 0.0
+    for audio in frames:
+        node.get_input("input").value = audio
+        start = time.perf_counter()
+        graph.evaluate()
+        elapsed += time.perf_counter() - start
+        fft = node.get_output("output").value
+        outputs.append(fft.magnitudes if fft is not None else None)
+    spectra = sum(len(audio.blocks) for audio in frames) * frames[0].block_size / node._stft.hop
+    graph.stop()
+    return elapsed / len(frames), spectra / len(frames), outputs
+
+def same_outputs(outputs0, outputs1):
+    for output0, output1 in zip(outputs0, outputs1):
+        if (output0 is None) != (output1 is None):
+            return False
+        if output0 is not None and not np.allclose(output0, output1, rtol=1e-9, atol=1e-9):
+            return False
+    return True
+
+if __name__ == "__main__":
+    block_size = int(sys.argv[1]) if len(sys.argv) > 1 else 1024
+    frames = create_frames(block_size, np.random.default_rng(0))
+
+    previous_time, previous_outputs = run_previous(frames)
+    # (previous implementation computed a spectrum every 4 blocks)
+    previous_spectra = sum(len(audio.blocks) for audio in frames) / 4 / len(frames)
+    print("%-24s %8.3f ms/frame, %5.2f spectra/frame, %7.1f us/spectrum" % ("previous", previous_time * 1000.0,
+        previous_spectra, previous_time * 1e6 / previous_spectra))
+    for overlap in (0.0, 0.5, 0.75, 0.875):
+        frame_time, spectra, outputs = run_node(frames, overlap)
+        line = "%-24s %8.3f ms/frame, %5.2f spectra/frame, %7.1f us/spectrum" % ("overlap %.3f" % overlap,
+            frame_time * 1000.0, spectra, frame_time * 1e6 / spectra)
+        if overlap == 0.0:
+            line += ", same results: %s" % same_outputs(previous_outputs, outputs)
+        print(line)
@@ -0,0 +1,107 @@
+#!/usr/bin/env python3
+
+# Compares audio.util.Filter as cascade of second order sections (sosfilt, default) with the transfer function
+# form (lfilter, as before) and several SOS filters on the same input run together by a FilterBank.
+# - stability: step responses of Butterworth filters over orders, cutoffs and sample rates, a filter fails
+#   if its response isn't finite or a lowpass doesn't settle at 1 (highpass at 0)
+# - throughput: filters of different orders / cutoffs applied to the same frames of samples
+# Usage: python3 -m pyvisual.benchmark.filters [sample rate] [filters]
+
+import pyximport; pyximport.install()
+
+import sys
+import time
+
+import numpy as np
+from scipy import signal
+
+from pyvisual.audio import util
+
+ORDERS = [1, 2, 4, 5, 8, 10]
+# (cutoff, filter type), including the cutoffs of AudioAnalyzer
+CUTOFFS = [(2.5, "low"), (5.0, "high"), (50.0, "low"), (1000.0, "low"), (1000.0, "high")]
+SAMPLE_RATES = [5000, 44100, 48000]
+STEP_SECONDS = 4.0
+TOLERANCE = 1e-3
+
+FRAMES = 300
+FPS = 60.0
+
+def create_filter(order, cutoff, btype, sample_rate, sos):
+    return util.Filter(signal.butter, order, cutoff, sample_rate, {"btype" : btype, "analog" : False}, sos=sos)
+
+def step_error(audio_filter, sample_rate, btype):
+    # error of the step response at the end, filtered in blocks of a frame
+    samples = np.ones(int(sample_rate * STEP_SECONDS))
+    # start at 0 (the filter assumes a steady state for the first sample)
+    samples[0] = 0.0
+    block_size = int(sample_rate / FPS)
+    last = None
+    with np.errstate(all="ignore"):
+        for i in range(0, len(samples), block_size):
+            last = audio_filter.process(samples[i:i+block_size])[-1]
+    if not np.isfinite(last):
+        return np.inf
+    return abs(last - (1.0 if btype == "low" else 0.0))
+
+def measure_stability():
+    failed = { False : [], True : [] }
+    count = 0
+    for sample_rate in SAMPLE_RATES:
+        for order in ORDERS:
+            for cutoff, btype in CUTOFFS:
+                count += 1
+                for sos in (False, True):
+                    error = step_error(create_filter(order, cutoff, btype, sample_rate, sos), sample_rate, btype)
+                    if not error < TOLERANCE:
+                        failed[sos].append((sample_rate, order, cutoff, btype, error))
+    return count, failed
+
+def create_filters(count, sample_rate, sos):
+    filters = []
+    for i in range(count):
+        cutoff, btype = CUTOFFS[i % len(CUTOFFS)]
+        filters.append(create_filter(ORDERS[i % len(ORDERS)], cutoff, btype, sample_rate, sos))
+    return filters
+
+def measure_throughput(sample_rate, count, rng):
+    frame_size = int(sample_rate / FPS)
+    frames = [ rng.standard_normal(frame_size).astype(np.float32) for i in range(FRAMES) ]
+    times = {}
+    outputs = {}
+    for name in ("lfilter", "sosfilt", "filter bank"):
+        filters = create_filters(count, sample_rate, name != "lfilter")
+        bank = util.FilterBank()
+        for audio_filter in filters:
+            if name == "filter bank":
+                bank.add(audio_filter)
+        results = []
+        start = time.perf_counter()
+        with np.errstate(all="ignore"):
+            for version, samples in enumerate(frames):
+                if name == "filter bank":
+                    results.append([ bank.process(audio_filter, samples, version) for audio_filter in filters ])
+                else:
+                    results.append([ audio_filter.process(samples) for audio_filter in filters ])
+        times[name] = (time.perf_counter() - start) / FRAMES
+        outputs[name] = results
+    same = all(np.allclose(a, b, rtol=1e-9, atol=1e-9)
+            for frame0, frame1 in zip(outputs["sosfilt"], outputs["filter bank"]) for a, b in zip(frame0, frame1))
+    return frame_size, times, same
+
+if __name__ == "__main__":
+    sample_rate = int(sys.argv[1]) if len(sys.argv) > 1 else 48000
+    count = int(sys.argv[2]) if len(sys.argv) > 2 else 8
+
+    total, failed = measure_stability()
+    print("=== Stability (step response error < %g, %d filters) ===" % (TOLERANCE, total))
+    for sos, name in ((False, "lfilter"), (True, "sosfilt")):
+        print("%-8s %3d failed" % (name, len(failed[sos])))
+        for sample_rate_, order, cutoff, btype, error in failed[sos]:
+            print("    %5d Hz, order %2d, %s %6.1f Hz: error %g" % (sample_rate_, order, btype, cutoff, error))
+
+    frame_size, times, same = measure_throughput(sample_rate, count, np.random.default_rng(0))
+    print("=== Throughput (%d Hz, %d filters, %d samples/frame) ===" % (sample_rate, count, frame_size))
+    for name, frame_time in times.items():
+        print("%-12s %8.1f us/frame, %6.1f Msamples/s" % (name, frame_time * 1e6, frame_size * count / frame_time / 1e6))
+    print("Compiled kernel: %s, same results as sosfilt: %s" % (util.sosfilt_bank is not None, same))
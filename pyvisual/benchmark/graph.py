@@ -0,0 +1,140 @@
+#!/usr/bin/env python3
+
+# Compares evaluation of all nodes with dirty scheduling (see Graph.dirty_scheduling)
+# on synthetic graphs of float operations where only a few inputs change each frame.
+# Also measures the cost of an edit (reconnecting a node) until the next frame is evaluated,
+# with the incrementally updated node order and with sorting all nodes again after each edit.
+# Usage: python3 -m pyvisual.benchmark.graph [node count ...]
+
+import pyximport; pyximport.install()
+
+import random
+import sys
+import time
+
+import pyvisual.node as node_meta
+from pyvisual.editor.graph import NodeGraph
+
+FRAMES = 300
+EDITS = 300
+VERIFY_FRAMES = 50
+PATCH_SIZE = 20
+# fraction of input nodes that are changed each frame
+CHANGE_FRACTION = 0.02
+
+def create_graph(count, seed=0):
+    # graph consists of independent patches, each with an input node and a few operations
+    rng = random.Random(seed)
+    input_spec = node_meta.NodeSpec.from_name("InputFloat")
+    op_spec = node_meta.NodeSpec.from_name("BinaryOpFloat")
+    edge_spec = node_meta.NodeSpec.from_name("Edge")
+
+    graph = NodeGraph()
+    # available outputs of current patch as tuples (node, port id)
+    outputs = []
+    while len(graph.nodes) < count:
+        if len(graph.nodes) % PATCH_SIZE == 0:
+            node = graph.create_node(input_spec)
+            outputs = [(node, "o_output")]
+            continue
+
+        # a few nodes that are evaluated every frame
+        if rng.random() < 0.02:
+            node = graph.create_node(edge_spec)
+            src_node, src_port_id = rng.choice(outputs)
+            graph.create_connection(src_node, src_port_id, node, "i_value")
+            outputs.append((node, "o_rising"))
+            continue
+
+        # add, sub, min, max
+        op = rng.choice([0, 1, 4, 5])
+        node = graph.create_node(op_spec, values={"i_op" : op})
+        for dst_port_id in ("i_a", "i_b"):
+            src_node, src_port_id = rng.choice(outputs)
+            graph.create_connection(src_node, src_port_id, node, dst_port_id)
+        outputs.append((node, "o_out"))
+    return graph
+
+def change_inputs(graph, rng):
+    inputs = [ node for node in graph.nodes.values() if node.spec.name == "InputFloat" ]
+    count = max(1, int(len(inputs) * CHANGE_FRACTION))
+    for node in rng.sample(inputs, count):
+        node.get_output("output").value = rng.random()
+
+def snapshot(graph):
+    values = []
+    for node_id, node in sorted(graph.nodes.items()):
+        for port_id, value in sorted(node.values.items()):
+            if port_id.startswith("o_"):
+                values.append((node_id, port_id, value.value))
+    return values
+
+def verify(count):
+    full_graph = create_graph(count)
+    dirty_graph = create_graph(count)
+    dirty_graph.dirty_scheduling = True
+    full_rng = random.Random(1)
+    dirty_rng = random.Random(1)
+    for frame in range(VERIFY_FRAMES):
+        change_inputs(full_graph, full_rng)
+        change_inputs(dirty_graph, dirty_rng)
+        full_graph.evaluate()
+        dirty_graph.evaluate()
+        if snapshot(full_graph) != snapshot(dirty_graph):
+            return False
+    return True
+
+def measure(count, dirty_scheduling):
+    graph = create_graph(count)
+    graph.dirty_scheduling = dirty_scheduling
+    rng = random.Random(1)
+    # first evaluation evaluates all nodes anyways
+    graph.evaluate()
+
+    elapsed = 0.0
+    evaluated = 0
+    for frame in range(FRAMES):
+        change_inputs(graph, rng)
+        start = time.perf_counter()
+        evaluated += len(graph.evaluate())
+        elapsed += time.perf_counter() - start
+    graph.stop()
+    return elapsed / FRAMES, evaluated / FRAMES
+
+def measure_edits(count, full_sort):
+    graph = create_graph(count)
+    rng = random.Random(1)
+    graph.evaluate()
+
+    ops = [ node for node in graph.nodes.values() if node.spec.name == "BinaryOpFloat" ]
+    inputs = [ node for node in graph.nodes.values() if node.spec.name == "InputFloat" ]
+    elapsed = 0.0
+    for edit in range(EDITS):
+        # reconnect an input of a random operation to an input node
+        node = rng.choice(ops)
+        dst_port_id = rng.choice(("i_a", "i_b"))
+        src_node = rng.choice(inputs)
+        start = time.perf_counter()
+        for dst_port_id_, connected_node, src_port_id in list(graph.connections_to[node]):
+            if dst_port_id_ == dst_port_id:
+                graph.remove_connection(connected_node, src_port_id, node, dst_port_id)
+        graph.create_connection(src_node, "o_output", node, dst_port_id)
+        if full_sort:
+            graph.reset_sorted_instances()
+        graph.sorted_instances
+        elapsed += time.perf_counter() - start
+        graph.evaluate()
+    graph.stop()
+    return elapsed / EDITS
+
+if __name__ == "__main__":
+    counts = [ int(arg) for arg in sys.argv[1:] ] or [1000, 5000]
+    for count in counts:
+        print("=== %d nodes ===" % count)
+        print("Same results: %s" % verify(count))
+        for name, dirty_scheduling in (("all nodes", False), ("dirty scheduling", True)):
+            frame_time, evaluated = measure(count, dirty_scheduling)
+            print("%-20s %8.3f ms/frame, %7.1f nodes evaluated/frame" % (name, frame_time * 1000.0, evaluated))
+        for name, full_sort in (("full sort", True), ("incremental order", False)):
+            edit_time = measure_edits(count, full_sort)
+            print("%-20s %8.3f ms/edit" % (name, edit_time * 1000.0))
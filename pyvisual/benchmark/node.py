@@ -0,0 +1,69 @@
+#!/usr/bin/env python3
+
+# Measures the per node overhead of evaluating scalar nodes and of accessing their ports.
+# Usage: python3 -m pyvisual.benchmark.node [node count]
+
+import pyximport; pyximport.install()
+
+import sys
+import time
+
+import pyvisual.node as node_meta
+from pyvisual import util
+from pyvisual.editor.graph import NodeGraph
+
+FRAMES = 200
+ACCESSES = 200000
+
+def create_graph(node_name, count):
+    # a chain of nodes of one type, fed by an LFO so that each node is evaluated every frame
+    graph = NodeGraph()
+    lfo = graph.create_node(node_meta.NodeSpec.from_name("LFO"))
+    spec = node_meta.NodeSpec.from_name(node_name)
+    src_node, src_port_id = lfo, "o_output"
+    for i in range(count):
+        node = graph.create_node(spec)
+        input_port_id, output_port_id = {
+            "BinaryOpFloat" : ("i_a", "o_out"),
+            "LFO" : ("i_phase", "o_output"),
+            "Edge" : ("i_value", "o_rising"),
+        }.get(node_name, ("i_input", "o_output"))
+        graph.create_connection(src_node, src_port_id, node, input_port_id)
+        src_node, src_port_id = node, output_port_id
+    return graph
+
+def measure_evaluate(node_name, count):
+    graph = create_graph(node_name, count)
+    graph.evaluate()
+    start = time.perf_counter()
+    for frame in range(FRAMES):
+        util.time.global_time.clock.tick()
+        graph.evaluate()
+    elapsed = time.perf_counter() - start
+    graph.stop()
+    return elapsed / (FRAMES * (count + 1))
+
+def measure_access():
+    graph = NodeGraph()
+    node = graph.create_node(node_meta.NodeSpec.from_name("BinaryOpFloat"))
+    graph.evaluate()
+
+    timings = []
+    for fn in (lambda: node.get("a"), lambda: node.get_input("a").value, lambda: node.set("out", 1.0)):
+        start = time.perf_counter()
+        for i in range(ACCESSES):
+            fn()
+        timings.append((time.perf_counter() - start) / ACCESSES)
+    graph.stop()
+    return timings
+
+if __name__ == "__main__":
+    # same times for each run
+    util.time.global_time.clock = util.time.VirtualClock()
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 1000
+    for node_name in ("BinaryOpFloat", "LFO", "Edge", "FloatLambda"):
+        print("%-20s %8.3f us/node" % (node_name, measure_evaluate(node_name, count) * 1e6))
+    get_time, get_input_time, set_time = measure_access()
+    print("%-20s %8.3f us" % ("get", get_time * 1e6))
+    print("%-20s %8.3f us" % ("get_input().value", get_input_time * 1e6))
+    print("%-20s %8.3f us" % ("set", set_time * 1e6))
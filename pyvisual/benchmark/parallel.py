@@ -0,0 +1,101 @@
+#!/usr/bin/env python3
+
+# Compares serial and parallel evaluation (see Graph.worker_threads) on a headless audio analysis graph:
+# several branches filter the same audio input and compute FFTs / sampled SSBOs of it.
+# Parallel evaluation is measured with all nodes and with dirty scheduling (see Graph.dirty_scheduling).
+# Usage: python3 -m pyvisual.benchmark.parallel [worker thread count ...]
+
+import pyximport; pyximport.install()
+
+import sys
+import time
+
+import numpy as np
+
+import pyvisual.node as node_meta
+from pyvisual.editor.graph import NodeGraph
+from pyvisual.node.io.audio import AudioData
+
+FRAMES = 200
+BRANCHES = 8
+SAMPLE_RATE = 44100
+BLOCK_SIZE = 1024
+BLOCKS_PER_FRAME = 2
+
+def create_graph():
+    graph = NodeGraph()
+    spec = node_meta.NodeSpec.from_name
+    # audio is passed to the graph as manual input value of this node
+    source = graph.create_node(spec("AbsAudio"))
+    outputs = []
+    for i in range(BRANCHES):
+        audio_filter = graph.create_node(spec("AudioFilter"), values={"i_order" : 8, "i_cutoff" : 200.0 + 2000.0 * i})
+        graph.create_connection(source, "o_output", audio_filter, "i_input")
+
+        fft = graph.create_node(spec("FFT"))
+        graph.create_connection(audio_filter, "o_output", fft, "i_input")
+        weighting = graph.create_node(spec("AWeightingFFT"))
+        graph.create_connection(fft, "o_output", weighting, "i_input")
+        quantize = graph.create_node(spec("QuantizeFFT"), values={"i_count" : 64})
+        graph.create_connection(weighting, "o_output", quantize, "i_input")
+
+        sample = graph.create_node(spec("SampleAudioSSBO"), values={"i_size" : 4096})
+        graph.create_connection(audio_filter, "o_output", sample, "i_input")
+        resample = graph.create_node(spec("ResampleSSBO"))
+        graph.create_connection(sample, "o_output", resample, "i_ssbo")
+        outputs.extend([quantize, resample])
+    return graph, source, outputs
+
+def create_audio(rng):
+    audio = AudioData(SAMPLE_RATE, BLOCK_SIZE)
+    for i in range(BLOCKS_PER_FRAME):
+        audio.append(rng.standard_normal(BLOCK_SIZE))
+    return audio
+
+def snapshot(outputs):
+    values = []
+    for node in outputs:
+        value = node.get_output("output" if node.spec.name == "QuantizeFFT" else "ssbo").value
+        if value is None:
+            values.append(None)
+        elif hasattr(value, "magnitudes"):
+            values.append(np.array(value.magnitudes))
+        else:
+            values.append(np.array(value))
+    return values
+
+def run(worker_threads, dirty_scheduling=False, frames=FRAMES):
+    graph, source, outputs = create_graph()
+    graph.worker_threads = worker_threads
+    graph.dirty_scheduling = dirty_scheduling
+    rng = np.random.default_rng(0)
+
+    elapsed = 0.0
+    snapshots = []
+    for frame in range(frames):
+        source.get_input("input").value = create_audio(rng)
+        start = time.perf_counter()
+        graph.evaluate()
+        elapsed += time.perf_counter() - start
+        snapshots.append(snapshot(outputs))
+    graph.stop()
+    return elapsed / frames, snapshots
+
+def same_snapshots(snapshots0, snapshots1):
+    for values0, values1 in zip(snapshots0, snapshots1):
+        for value0, value1 in zip(values0, values1):
+            if (value0 is None) != (value1 is None):
+                return False
+            if value0 is not None and not np.array_equal(value0, value1, equal_nan=True):
+                return False
+    return True
+
+if __name__ == "__main__":
+    thread_counts = [ int(arg) for arg in sys.argv[1:] ] or [2, 4]
+    serial_time, serial_snapshots = run(0)
+    print("%-27s %8.3f ms/frame" % ("serial", serial_time * 1000.0))
+    for dirty_scheduling in (False, True):
+        for worker_threads in thread_counts:
+            frame_time, snapshots = run(worker_threads, dirty_scheduling)
+            name = "%d worker threads%s" % (worker_threads, ", dirty" if dirty_scheduling else "")
+            print("%-27s %8.3f ms/frame, same results: %s" % (name, frame_time * 1000.0, same_snapshots(serial_snapshots, snapshots)))
@@ -0,0 +1,129 @@
+#!/usr/bin/env python3
+
+# Measures loading a scene with some instances of each filter shader (like BaseShader builds their programs):
+# - previous: a gloo.Program per instance, compiled with a throwaway draw
+# - cache cold: programs shared by instances with the same sources (see util.program_cache), no program binaries yet
+# - cache binaries: a new cache (like in the next run) loading the program binaries saved before
+# - cache switch back: loading the scene again after it has been unloaded (programs are still linked)
+# "submit" is the time spent starting the compilation, "ready" the time until all programs can be used
+# (nodes render with their previous program until then if the driver compiles in parallel).
+# Requires an OpenGL context (a hidden window is created).
+# Usage: python3 -m pyvisual.benchmark.programs [instances]
+
+import shutil
+import sys
+import tempfile
+import time
+
+import numpy as np
+from glumpy import app, gl, gloo
+from glumpy.gloo.texture import Texture3D
+
+from pyvisual import assets
+from pyvisual.util import program_cache
+
+dummy = np.zeros((1, 1, 4), dtype=np.uint8).view(gloo.Texture2D)
+dummy3d = np.zeros((1, 1, 1, 4), dtype=np.uint8).view(Texture3D)
+
+def filter_sources():
+    # sources of the filters with default preprocessor values (without advanced filtering)
+    vertex = assets.load_shader(path="common/passthrough.vert")
+    sources = []
+    for path in sorted(assets.glob_paths("shader/filter/*.frag")):
+        if path.endswith("basefilter.frag"):
+            continue
+        fragment = "\n" + assets.load_shader(path=path.replace("shader/", "", 1))
+        defines = ""
+        for gltype, name, kwargs in assets.parse_shader_preprocessor_inputs(fragment):
+            value = kwargs.get("default", 0)
+            defines += "#define %s %s\n" % (name, value if gltype == "float" else int(value))
+        sources.append((vertex, defines + fragment))
+    return sources
+
+def setup(program):
+    program["iPosition"] = [(-1,-1), (-1,+1), (+1,-1), (+1,+1)]
+    program["iTexCoord"] = [( 0, 1), ( 0, 0), ( 1, 1), ( 1, 0)]
+    for uniform, gtype in program.all_uniforms:
+        if gtype == gl.GL_SAMPLER_2D:
+            program[uniform] = dummy
+        elif gtype == gl.GL_SAMPLER_3D:
+            program[uniform] = dummy3d
+
+def load_previous(scene):
+    programs = []
+    start = time.perf_counter()
+    for vertex, fragment in scene:
+        program = gloo.Program(vertex, fragment, version="430", count=4)
+        setup(program)
+        try:
+            program.draw(gl.GL_TRIANGLE_STRIP)
+        except (RuntimeError, ValueError):
+            # (shader error, printed by glumpy)
+            pass
+        programs.append(program)
+    gl.glFinish()
+    elapsed = time.perf_counter() - start
+    return programs, elapsed, elapsed
+
+def load_cached(scene, cache):
+    programs = []
+    start = time.perf_counter()
+    for vertex, fragment in scene:
+        program = program_cache.CachedProgram(vertex, fragment, version="430", count=4, cache=cache)
+        setup(program)
+        program.compile()
+        programs.append(program)
+    submitted = time.perf_counter() - start
+    # (nodes poll once per frame)
+    while not all([ program.poll() for program in programs ]):
+        time.sleep(0.001)
+    for program in programs:
+        if program.error is None:
+            program.draw(gl.GL_TRIANGLE_STRIP)
+    gl.glFinish()
+    return programs, submitted, time.perf_counter() - start
+
+def unload(programs):
+    for program in programs:
+        program.delete()
+
+if __name__ == "__main__":
+    instances = int(sys.argv[1]) if len(sys.argv) > 1 else 10
+    window = app.Window(visible=False)
+    window.activate()
+    fbo = gloo.FrameBuffer(color=[np.zeros((64, 64, 4), dtype=np.uint8).view(gloo.Texture2D)])
+    fbo.activate()
+    gl.glViewport(0, 0, 64, 64)
+
+    sources = filter_sources()
+    scene = [ source for source in sources for i in range(instances) ]
+    print("=== %d filters x %d instances, %s ===" % (len(sources), instances, gl.glGetString(gl.GL_RENDERER).decode()))
+    def report(name, submitted, ready, cache=None):
+        counts = "" if cache is None else ", %d compiled, %d loaded, %d cached" % (cache.compiled, cache.loaded, cache.hits)
+        print("%-20s submit %8.1f ms, ready %8.1f ms%s" % (name, submitted * 1000.0, ready * 1000.0, counts))
+
+    programs, submitted, ready = load_previous(scene)
+    report("previous", submitted, ready)
+    unload(programs)
+
+    directory = tempfile.mkdtemp(prefix="pyvisual_programs_")
+    try:
+        cache = program_cache.ProgramCache(path=directory, keep_unused=len(sources))
+        programs, submitted, ready = load_cached(scene, cache)
+        print("parallel compilation: %s, failed programs: %d" % (cache.parallel, sum([ program.error is not None for program in programs ]) // instances))
+        report("cache cold", submitted, ready, cache)
+        unload(programs)
+
+        cache.compiled = cache.loaded = cache.hits = 0
+        programs, submitted, ready = load_cached(scene, cache)
+        report("cache switch back", submitted, ready, cache)
+        unload(programs)
+        cache.clear()
+
+        cache = program_cache.ProgramCache(path=directory, keep_unused=len(sources))
+        programs, submitted, ready = load_cached(scene, cache)
+        report("cache binaries", submitted, ready, cache)
+        unload(programs)
+        cache.clear()
+    finally:
+        shutil.rmtree(directory)
@@ -0,0 +1,120 @@
+#!/usr/bin/env python3
+
+# Measures the time the render thread spends per recorded frame, writing 1080p RGB frames to an encoder process
+# at 60 fps: previous way (copying the mapped pixel buffer, tobytes and a blocking write to the pipe) compared with
+# handing the mapped frames to a FrameWriter thread (see util.readback). Pixel buffers are simulated by arrays
+# (no OpenGL), the encoder is a process reading stdin at a given rate (in MB/s, 0 for as fast as possible).
+# Usage: python3 -m pyvisual.benchmark.recorder [encoder MB/s]
+
+import queue
+import subprocess
+import sys
+import time
+
+import numpy as np
+
+from pyvisual.util import readback
+
+SIZE = (1920, 1080)
+FPS = 60.0
+FRAMES = 300
+
+ENCODER = """
+import sys, time
+rate = float(sys.argv[1]) * 2**20
+stdin = sys.stdin.buffer
+start = time.perf_counter()
+total = 0
+while True:
+    data = stdin.read(2**20)
+    if not data:
+        break
+    total += len(data)
+    if rate > 0.0:
+        delay = start + total / rate - time.perf_counter()
+        if delay > 0.0:
+            time.sleep(delay)
+"""
+
+class SimulatedReadback:
+    # ring of "pixel buffers" (arrays) that the GPU has finished right away, like TextureReadback.read
+    def __init__(self, shape, count=readback.READBACK_COUNT):
+        self.count = count
+        self._buffers = [ np.zeros(shape, dtype=np.uint8) for i in range(count) ]
+        self._free = list(range(count))
+        self._released = queue.SimpleQueue()
+        self.frames = 0
+        self.dropped = 0
+
+    def read(self, texture):
+        while not self._released.empty():
+            self._free.append(self._released.get())
+        index = self.frames
+        self.frames += 1
+        if not self._free:
+            self.dropped += 1
+            return []
+        slot = self._free.pop()
+        self._buffers[slot][...] = texture
+        return [ readback.ReadbackFrame(self, slot, self._buffers[slot], index) ]
+
+def start_encoder(rate):
+    return subprocess.Popen([sys.executable, "-c", ENCODER, str(rate)], stdin=subprocess.PIPE, bufsize=-1)
+
+def run_frames(record_frame, frames):
+    # calls record_frame at 60 fps, returns render thread times
+    times = []
+    next_frame = time.perf_counter()
+    for frame in frames:
+        next_frame += 1.0 / FPS
+        delay = next_frame - time.perf_counter()
+        if delay > 0:
+            time.sleep(delay)
+        start = time.perf_counter()
+        record_frame(frame)
+        times.append(time.perf_counter() - start)
+    return np.array(times) * 1000.0
+
+def run_previous(frames, rate):
+    process = start_encoder(rate)
+    mapped = np.zeros_like(frames[0])
+    def record_frame(frame):
+        # (the copy out of the pixel buffer simulates the read of the previous frame)
+        mapped[...] = frame
+        data = np.frombuffer(mapped, dtype=np.uint8).copy().reshape(mapped.shape)
+        process.stdin.write(data.tobytes())
+    times = run_frames(record_frame, frames)
+    process.stdin.close()
+    process.wait()
+    return times, 0
+
+def run_writer(frames, rate):
+    process = start_encoder(rate)
+    pbos = SimulatedReadback(frames[0].shape)
+    # (the copy into the arrays simulates the download by the GPU)
+    writer = readback.FrameWriter(process.stdin.write, max_queued=pbos.count)
+    writer.start()
+    def record_frame(texture):
+        for frame in pbos.read(texture):
+            writer.put(frame)
+    times = run_frames(record_frame, frames)
+    writer.stop()
+    process.stdin.close()
+    process.wait()
+    return times, pbos.dropped + writer.dropped, writer.max_queue_depth
+
+if __name__ == "__main__":
+    rate = float(sys.argv[1]) if len(sys.argv) > 1 else 0.0
+    rng = np.random.default_rng(0)
+    w, h = SIZE
+    frames = [ rng.integers(0, 256, size=(h, w, 3), dtype=np.uint8) for i in range(4) ] * (FRAMES // 4)
+
+    print("=== %dx%d RGB at %d fps, encoder %s ===" % (w, h, FPS, "%.0f MB/s" % rate if rate > 0.0 else "unlimited"))
+    def report(name, times, dropped, extra=""):
+        missed = np.sum(times > 1000.0 / FPS)
+        print("%-10s %6.2f ms mean, %6.2f ms p99, %6.2f ms max, %3d frames over budget, %3d dropped%s" % (name,
+            times.mean(), np.percentile(times, 99), times.max(), missed, dropped, extra))
+    times, dropped = run_previous(frames, rate)
+    report("previous", times, dropped)
+    times, dropped, max_queue_depth = run_writer(frames, rate)
+    report("writer", times, dropped, ", max. queued %d" % max_queue_depth)
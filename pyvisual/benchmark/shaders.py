@@ -0,0 +1,108 @@
+#!/usr/bin/env python3
+
+# Measures loading every shader under assets/shader with its #include's expanded and parsing its node inputs
+# (uniforms / preprocessor values): reading and expanding each time (as done before) compared with the cached
+# ShaderAssets (see assets.py), once and for a scene in which each shader is used by some nodes.
+# Also checks that the sources are the same and that changing a file invalidates exactly the files including it.
+# Usage: python3 -m pyvisual.benchmark.shaders [instances]
+
+import os
+import re
+import sys
+import time
+
+from pyvisual import assets
+
+EXTENSIONS = (".frag", ".vert", ".glsl")
+INCLUDE = re.compile(r"#include <(.*)>")
+
+def shader_paths():
+    paths = []
+    for directory, _, names in os.walk(assets.SHADER_PATH):
+        for name in names:
+            if name.endswith(EXTENSIONS):
+                paths.append(os.path.relpath(os.path.join(directory, name), assets.SHADER_PATH))
+    return sorted(paths)
+
+def load_previous(path):
+    # (assets.load_shader as it was before)
+    def preprocess(source):
+        lines = []
+        for line in source.split("\n"):
+            line = line.strip()
+            if not "#include" in line:
+                lines.append(line)
+                continue
+            lines.extend(preprocess(open(assets.get_shader_path(line[len("#include <"):-1])).read()).split("\n"))
+        return "\n".join(lines)
+    return preprocess(open(assets.get_shader_path(path)).read())
+
+def parse_previous(source):
+    # (the parsers as they were before, without cache)
+    return assets._parse_uniform_inputs.__wrapped__(source), assets._parse_preprocessor_inputs.__wrapped__(source)
+
+def parse_cached(source):
+    return assets.parse_shader_uniform_inputs("", source), assets.parse_shader_preprocessor_inputs(source)
+
+def load_all(paths, load, parse, instances=1):
+    sources = {}
+    failed = 0
+    start = time.perf_counter()
+    for i in range(instances):
+        for path in paths:
+            try:
+                source = load(path)
+            except (assets.ShaderError, OSError):
+                failed += 1
+                continue
+            parse(source)
+            sources[path] = source
+    return sources, time.perf_counter() - start, failed // instances
+
+def includes_of(path, paths=None):
+    # files included by a file (directly or not), found by reading the files
+    paths = set() if paths is None else paths
+    for include in INCLUDE.findall(open(assets.get_shader_path(path)).read()):
+        full_path = os.path.normpath(assets.get_shader_path(include))
+        if not full_path in paths:
+            paths.add(full_path)
+            includes_of(include, paths)
+    return paths
+
+if __name__ == "__main__":
+    instances = int(sys.argv[1]) if len(sys.argv) > 1 else 10
+    paths = shader_paths()
+
+    print("=== %d shader files ===" % len(paths))
+    previous, previous_time, failed = load_all(paths, load_previous, parse_previous)
+    print("%-24s %8.2f ms (%d failed)" % ("previous", previous_time * 1000.0, failed))
+    shader_assets = assets.shader_assets = assets.ShaderAssets()
+    cached, cold_time, failed = load_all(paths, assets.load_shader, parse_cached)
+    print("%-24s %8.2f ms, %d files read" % ("cached, cold", cold_time * 1000.0, shader_assets.reads))
+    cached, warm_time, failed = load_all(paths, assets.load_shader, parse_cached)
+    print("%-24s %8.2f ms" % ("cached, warm", warm_time * 1000.0))
+    print("same sources: %s" % (previous == cached))
+
+    print("=== scene, %d nodes per shader ===" % instances)
+    previous, previous_time, failed = load_all(paths, load_previous, parse_previous, instances)
+    print("%-24s %8.2f ms" % ("previous", previous_time * 1000.0))
+    shader_assets = assets.shader_assets = assets.ShaderAssets()
+    assets._parse_uniform_inputs.cache_clear()
+    assets._parse_preprocessor_inputs.cache_clear()
+    cached, cached_time, failed = load_all(paths, assets.load_shader, parse_cached, instances)
+    print("%-24s %8.2f ms, %d files read" % ("cached", cached_time * 1000.0, shader_assets.reads))
+
+    print("=== invalidation ===")
+    valid = True
+    loaded = [ path for path in paths if path in cached ]
+    for library in [ path for path in paths if path.startswith("lib" + os.sep) ]:
+        full_path = os.path.normpath(assets.get_shader_path(library))
+        expected = { os.path.normpath(assets.get_shader_path(path)) for path in loaded if full_path in includes_of(path) }
+        versions = { path : shader_assets.version(path) for path in loaded }
+        invalidated = shader_assets.invalidate(library) - {full_path}
+        changed = { os.path.normpath(assets.get_shader_path(path)) for path in loaded if shader_assets.version(path) != versions[path] } - {full_path}
+        valid = valid and invalidated == expected and changed == expected
+        print("%-24s invalidates %2d files" % (library, len(invalidated)))
+        for path in loaded:
+            shader_assets.load(path)
+    print("invalidated exactly the files including them: %s" % valid)
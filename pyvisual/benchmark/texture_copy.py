@@ -0,0 +1,58 @@
+#!/usr/bin/env python3
+
+# Measures the cost of snapshotting a texture (one hold of HoldTexture) by copying it on the GPU
+# (see util.render_target.TextureSnapshot) compared with reading it back and uploading it again (as done before).
+# Times include glFinish, so they are the time until the copy is complete.
+# Requires an OpenGL context (a hidden window is created).
+# Usage: python3 -m pyvisual.benchmark.texture_copy [holds]
+
+import sys
+import time
+
+import numpy as np
+from glumpy import app, gl, gloo
+
+from pyvisual.util import render_target
+
+SIZES = [(1280, 720), (1920, 1080), (3840, 2160)]
+
+def create_texture(size, rng):
+    w, h = size
+    texture = rng.integers(0, 256, size=(h, w, 4), dtype=np.uint8).view(gloo.Texture2D)
+    texture.activate()
+    texture.deactivate()
+    return texture
+
+def hold_cpu(texture):
+    t = texture.get().copy().view(gloo.Texture2D)
+    t.activate()
+    t.deactivate()
+    return t
+
+def measure(hold, texture, holds):
+    held = []
+    start = time.perf_counter()
+    for i in range(holds):
+        held.append(hold(texture))
+        gl.glFinish()
+    return (time.perf_counter() - start) / holds, held[-1]
+
+if __name__ == "__main__":
+    holds = int(sys.argv[1]) if len(sys.argv) > 1 else 30
+    window = app.Window(visible=False)
+    window.activate()
+    gl.glPixelStorei(gl.GL_UNPACK_ALIGNMENT, 1)
+    gl.glPixelStorei(gl.GL_PACK_ALIGNMENT, 1)
+
+    rng = np.random.default_rng(0)
+    print("glCopyImageSubData: %s" % bool(gl.glCopyImageSubData))
+    for size in SIZES:
+        texture = create_texture(size, rng)
+        snapshot = render_target.TextureSnapshot(render_target.RenderTargetPool())
+        cpu_time, cpu_texture = measure(hold_cpu, texture, holds)
+        gpu_time, gpu_texture = measure(snapshot.take, texture, holds)
+        same = np.array_equal(cpu_texture.get(), gpu_texture.get())
+        print("%4dx%4d: readback + upload %8.3f ms/hold, gpu copy %8.3f ms/hold, same texture: %s" % (size[0], size[1],
+            cpu_time * 1000.0, gpu_time * 1000.0, same))
+        snapshot.release()
+        snapshot.pool.clear()
@@ -0,0 +1,151 @@
+#!/usr/bin/env python3
+
+# Measures switching through a folder of large images at 60 fps, like LoadTextures with "next" events:
+# - previous: decoding and uploading the image in the render thread in the frame it's chosen
+# - loader: decoding in threads, uploading in slices of at most UPLOAD_BYTES_PER_FRAME per frame (see util.texture_loader)
+# - loader, prefetch: the next image is loaded ahead as well
+# - cache: switching through the images a second time, with a texture cache for all / half of them
+# Reports the time spent in the render thread per frame (including waiting for the GPU) and after how many frames
+# a chosen image is shown (the previous one is shown until then). Also checks that the uploaded textures are the same.
+# Images are written to a temporary directory.
+# Requires an OpenGL context (a hidden window is created).
+# Usage: python3 -m pyvisual.benchmark.textures [images] [width] [height]
+
+import os
+import shutil
+import sys
+import tempfile
+import time
+
+import numpy as np
+from PIL import Image
+from glumpy import app, gl, gloo
+
+from pyvisual.util import texture_loader
+
+FPS = 60.0
+# frames between two "next" events
+NEXT_INTERVAL = 20
+
+def write_images(directory, count, width, height):
+    paths = []
+    y, x = np.mgrid[0:height, 0:width]
+    for i in range(count):
+        data = np.stack([ (x * (i + 1) // 7) % 256, (y * (i + 2) // 5) % 256, ((x + y) // (i + 1)) % 256 ], axis=-1).astype(np.uint8)
+        path = os.path.join(directory, "image%02d.jpg" % i)
+        Image.fromarray(data).save(path, quality=90)
+        paths.append(path)
+    return paths
+
+def load_previous(path):
+    # (LoadTextures._load_texture as it was before)
+    texture = np.array(Image.open(path)).view(gloo.Texture2D)
+    texture.activate()
+    texture.deactivate()
+    return texture
+
+def run(paths, step):
+    # step(frame, next_index) returns the shown index, next_index is set in frames with a "next" event
+    frame_times = []
+    shown_after = []
+    chosen_frame = None
+    chosen = None
+    next_frame = time.perf_counter()
+    for frame in range(len(paths) * NEXT_INTERVAL):
+        next_frame += 1.0 / FPS
+        delay = next_frame - time.perf_counter()
+        if delay > 0:
+            time.sleep(delay)
+        start = time.perf_counter()
+        next_index = None
+        if frame % NEXT_INTERVAL == 0:
+            next_index = chosen = frame // NEXT_INTERVAL
+            chosen_frame = frame
+        shown = step(frame, next_index)
+        gl.glFinish()
+        frame_times.append(time.perf_counter() - start)
+        if chosen_frame is not None and shown == chosen:
+            shown_after.append(frame - chosen_frame)
+            chosen_frame = None
+    return np.array(frame_times) * 1000.0, np.array(shown_after)
+
+def run_previous(paths):
+    textures = []
+    def step(frame, next_index):
+        if next_index is not None:
+            textures.append(load_previous(paths[next_index]))
+        return len(textures) - 1
+    times, shown_after = run(paths, step)
+    return times, shown_after, textures
+
+def run_loader(paths, prefetch, loader):
+    textures = []
+    requests = {}
+    shown = []
+    def step(frame, next_index):
+        if next_index is not None:
+            requests[next_index] = loader.load(paths[next_index])
+            if prefetch and next_index + 1 < len(paths):
+                loader.prefetch(paths[next_index + 1])
+        for index, request in list(requests.items()):
+            if request.done:
+                del requests[index]
+                textures.append(request.texture)
+                # (the one shown before stays in the cache while it has space)
+                if shown:
+                    loader.release(shown.pop())
+                shown.append(request)
+        loader.end_frame()
+        return len(textures) - 1
+    times, shown_after = run(paths, step)
+    for request in shown:
+        loader.release(request)
+    return times, shown_after, textures
+
+def same_textures(textures, paths):
+    for texture, path in zip(textures, paths):
+        if not np.array_equal(texture.get(), texture_loader.decode_image(path)):
+            return False
+    return len(textures) == len(paths)
+
+if __name__ == "__main__":
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 6
+    width = int(sys.argv[2]) if len(sys.argv) > 2 else 3840
+    height = int(sys.argv[3]) if len(sys.argv) > 3 else 2160
+    window = app.Window(visible=False)
+    window.activate()
+
+    directory = tempfile.mkdtemp(prefix="pyvisual_textures_")
+    try:
+        paths = write_images(directory, count, width, height)
+        print("=== %d images %dx%d, next every %d frames, %s ===" % (count, width, height, NEXT_INTERVAL, gl.glGetString(gl.GL_RENDERER).decode()))
+        def report(name, times, shown_after, extra=""):
+            print("%-18s %7.2f ms/frame mean, %7.2f ms max, %3d frames over %.1f ms, shown after %4.1f frames%s" % (name,
+                times.mean(), times.max(), (times > 1000.0 / FPS).sum(), 1000.0 / FPS, shown_after.mean(), extra))
+
+        times, shown_after, textures = run_previous(paths)
+        report("previous", times, shown_after)
+        for texture in textures:
+            texture.delete()
+
+        for prefetch in (False, True):
+            loader = texture_loader.TextureLoader()
+            times, shown_after, textures = run_loader(paths, prefetch, loader)
+            report("loader, prefetch" if prefetch else "loader", times, shown_after,
+                ", %d prefetch hits, same textures: %s" % (loader.prefetch_hits, same_textures(textures, paths)))
+            if not prefetch:
+                loader.clear()
+
+        def report_cache(name, loader):
+            # (switching through the images once more)
+            loader.hits = loader.misses = 0
+            times, shown_after, textures = run_loader(paths, True, loader)
+            report(name, times, shown_after, ", %3.0f%% hits, %4.0f MB cached, %d evictions" % (loader.hit_rate * 100.0,
+                loader.cached_bytes / 2**20, loader.evictions))
+            loader.clear()
+        report_cache("cache, all fit", loader)
+        loader = texture_loader.TextureLoader(cache_bytes=count // 2 * width * height * 3)
+        run_loader(paths, True, loader)
+        report_cache("cache, half fit", loader)
+    finally:
+        shutil.rmtree(directory)
@@ -0,0 +1,109 @@
+#!/usr/bin/env python3
+
+# Measures decoding of a video (written to a temporary mp4 file first) as PlayVideo does it, as fast as possible:
+# - forward: reading and converting frames one after another (as done before) compared with the decode pipeline
+#   (see node.io.video.DecodePipeline: decoding thread, conversion thread and prefetch queues)
+# - reverse: seeking back two frames after each frame (as done before) compared with decoding segments forward
+#   and playing them back in reverse
+# Frames of the pipeline are compared with frames decoded forward.
+# Usage: python3 -m pyvisual.benchmark.video [frames] [width] [height]
+
+import os
+import shutil
+import sys
+import tempfile
+import time
+
+import cv2
+import numpy as np
+
+from pyvisual.node.io.video import DecodePipeline, END_OF_VIDEO
+
+FPS = 30
+
+def write_video(path, frames, size, rng):
+    w, h = size
+    writer = cv2.VideoWriter(path, cv2.VideoWriter_fourcc(*"mp4v"), FPS, size)
+    y, x = np.mgrid[0:h, 0:w]
+    for i in range(frames):
+        frame = np.stack([(x + i * 4) % 256, (y + i * 2) % 256, np.full_like(x, (i * 16) % 256)], axis=2).astype(np.uint8)
+        cv2.putText(frame, str(i), (w // 8, h // 2), cv2.FONT_HERSHEY_SIMPLEX, h / 100.0, (255, 255, 255), max(1, h // 50))
+        writer.write(frame)
+    writer.release()
+
+def decode_forward(path):
+    video = cv2.VideoCapture(path)
+    frames = []
+    frame_rgba = None
+    start = time.perf_counter()
+    while True:
+        grabbed, frame = video.read()
+        if not grabbed:
+            break
+        frame_rgba = cv2.cvtColor(frame, cv2.COLOR_BGR2RGBA)
+        frames.append(frame_rgba)
+    return frames, time.perf_counter() - start
+
+def decode_reverse_previous(path, count):
+    video = cv2.VideoCapture(path)
+    video.set(cv2.CAP_PROP_POS_FRAMES, count - 1)
+    start = time.perf_counter()
+    decoded = 0
+    for i in range(count):
+        grabbed, frame = video.read()
+        index = int(video.get(cv2.CAP_PROP_POS_FRAMES))
+        video.set(cv2.CAP_PROP_POS_FRAMES, index - 2)
+        if not grabbed:
+            break
+        cv2.cvtColor(frame, cv2.COLOR_BGR2RGBA)
+        decoded += 1
+    return decoded, time.perf_counter() - start
+
+def decode_pipeline(path, count, direction, expected):
+    video = cv2.VideoCapture(path)
+    h, w = expected[0].shape[:2]
+    start = time.perf_counter()
+    pipeline = DecodePipeline(video, count, (h, w, 4))
+    pipeline.decoder.loop = False
+    pipeline.restart(0 if direction > 0 else count - 1, direction)
+    indices = []
+    same = True
+    while True:
+        frame = pipeline.next_frame()
+        if frame is None:
+            time.sleep(0.0001)
+            continue
+        index, buffer = frame
+        if index is END_OF_VIDEO:
+            break
+        indices.append(index)
+        same = same and np.array_equal(buffer, expected[index])
+        pipeline.buffers.put(buffer)
+    elapsed = time.perf_counter() - start
+    decoded, seeks = pipeline.decoder.decoded, pipeline.decoder.seeks
+    pipeline.stop()
+    step = 1 if direction > 0 else -1
+    in_order = indices == list(range(count))[::step]
+    return len(indices), elapsed, same and in_order, decoded, seeks
+
+if __name__ == "__main__":
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 300
+    size = (int(sys.argv[2]), int(sys.argv[3])) if len(sys.argv) > 3 else (1280, 720)
+    rng = np.random.default_rng(0)
+    directory = tempfile.mkdtemp(prefix="pyvisual_video_")
+    try:
+        path = os.path.join(directory, "video.mp4")
+        write_video(path, count, size, rng)
+        expected, forward_time = decode_forward(path)
+        count = len(expected)
+
+        print("=== %d frames of %dx%d (mp4v) ===" % ((count,) + size))
+        print("%-20s %7.1f fps" % ("forward previous", count / forward_time))
+        frames, elapsed, valid, decoded, seeks = decode_pipeline(path, count, 1, expected)
+        print("%-20s %7.1f fps, %d decoded, %d seeks, same frames: %s" % ("forward pipeline", frames / elapsed, decoded, seeks, valid))
+        frames, elapsed = decode_reverse_previous(path, count)
+        print("%-20s %7.1f fps" % ("reverse previous", frames / elapsed))
+        frames, elapsed, valid, decoded, seeks = decode_pipeline(path, count, -1, expected)
+        print("%-20s %7.1f fps, %d decoded, %d seeks, same frames: %s" % ("reverse pipeline", frames / elapsed, decoded, seeks, valid))
+    finally:
+        shutil.rmtree(directory)
@@ -0,0 +1,119 @@
+#!/usr/bin/env python3
+
+# Measures checking shader files for changes in the render thread, like each shader node does each frame
+# (has_changed of its vertex and fragment source), for some seconds at 60 fps: one FileWatcher per source
+# stat'ing its file once per second (as done before) compared with the file watch service (see watch.py),
+# with inotify and with the polling thread, whose changes the root graph takes once per frame. Also measures how long it takes to notice a changed (included) file.
+# Files are written to a temporary directory in assets/shader.
+# Usage: python3 -m pyvisual.benchmark.watch [nodes] [seconds]
+
+import os
+import shutil
+import sys
+import time
+
+import numpy as np
+
+from pyvisual import assets, watch
+
+FPS = 60.0
+FILES = 20
+
+class PreviousFileWatcher:
+    # (assets.FileWatcher as it was before)
+    CHECK_INTERVAL = 1.0
+
+    stats = 0
+
+    def __init__(self, path):
+        self.path = path
+        self.last_check = 0
+
+    def has_changed(self):
+        t = time.time()
+        if t - self.CHECK_INTERVAL > self.last_check:
+            last_check = self.last_check
+            self.last_check = t
+            try:
+                PreviousFileWatcher.stats += 1
+                return os.path.getmtime(self.path) > last_check
+            except FileNotFoundError:
+                return False
+        return False
+
+def write_files(directory):
+    paths = []
+    open(os.path.join(directory, "lib.glsl"), "w").write("float lib() { return 1.0; }\n")
+    for i in range(FILES):
+        path = os.path.join(directory, "shader%d.frag" % i)
+        open(path, "w").write("#include <%s/lib.glsl>\nvoid main() {}\n" % os.path.basename(directory))
+        paths.append(path)
+    return paths
+
+def run_frames(check, seconds):
+    times = []
+    next_frame = time.perf_counter()
+    for i in range(int(seconds * FPS)):
+        next_frame += 1.0 / FPS
+        delay = next_frame - time.perf_counter()
+        if delay > 0:
+            time.sleep(delay)
+        start = time.perf_counter()
+        check()
+        times.append(time.perf_counter() - start)
+    return np.array(times) * 1000.0
+
+def run_previous(paths, nodes, seconds):
+    watchers = [ PreviousFileWatcher(paths[i % len(paths)]) for i in range(nodes * 2) ]
+    def check():
+        for watcher in watchers:
+            watcher.has_changed()
+    return run_frames(check, seconds), PreviousFileWatcher.stats
+
+def run_service(paths, nodes, seconds, use_inotify):
+    watch.file_watch = watch.FileWatchService(use_inotify=use_inotify)
+    assets.shader_assets = assets.ShaderAssets()
+    sources = [ assets.FileShaderSource(paths[i % len(paths)]) for i in range(nodes * 2) ]
+    for source in sources:
+        source.data
+    def check():
+        # (see RootGraph._begin_frame)
+        assets.shader_assets.check_changes()
+        for source in sources:
+            source.has_changed
+    times = run_frames(check, seconds)
+    return times, sources
+
+def change_latency(directory, sources):
+    # time until the sources notice a change of the file they include
+    lib = os.path.join(directory, "lib.glsl")
+    open(lib, "w").write("float lib() { return 2.0; }\n")
+    start = time.perf_counter()
+    while not all([ source.has_changed for source in sources ]):
+        time.sleep(0.001)
+        assets.shader_assets.check_changes()
+        if time.perf_counter() - start > 5.0:
+            return None
+    return time.perf_counter() - start
+
+if __name__ == "__main__":
+    nodes = int(sys.argv[1]) if len(sys.argv) > 1 else 500
+    seconds = float(sys.argv[2]) if len(sys.argv) > 2 else 3.0
+    directory = os.path.join(assets.SHADER_PATH, "benchmark_watch")
+    os.makedirs(directory, exist_ok=True)
+    try:
+        paths = write_files(directory)
+        print("=== %d nodes (%d sources, %d files), %.0f s at %d fps ===" % (nodes, nodes * 2, FILES, seconds, FPS))
+        def report(name, times, extra=""):
+            print("%-10s %7.3f ms/frame mean, %7.3f ms max%s" % (name, times.mean(), times.max(), extra))
+
+        times, stats = run_previous(paths, nodes, seconds)
+        report("previous", times, ", %d stats in the render thread" % stats)
+        for use_inotify in (True, False):
+            times, sources = run_service(paths, nodes, seconds, use_inotify)
+            latency = change_latency(directory, sources)
+            report(watch.file_watch.backend, times, ", %d paths watched, change noticed after %s" % (watch.file_watch.watched_paths,
+                "%.0f ms" % (latency * 1000.0) if latency is not None else "-"))
+            watch.file_watch.stop()
+    finally:
+        shutil.rmtree(directory)
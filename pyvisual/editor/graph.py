@@ -1,11 +1,15 @@
 import json
-import time
 from collections import defaultdict, OrderedDict
+from concurrent.futures import ThreadPoolExecutor
 
 import pyvisual.node.base as node_meta
-from glumpy import gl
 from pyvisual.node import dtype
+from pyvisual.editor.graph_order import TopologicalOrder
+from pyvisual.editor.profiler import Profiler
+from pyvisual import assets
+from pyvisual.util import render_target, texture_loader
 from pyvisual.node.value import ConnectedValue
+from pyvisual.node import core
 
 class NodeGraphListener:
     def changed_ui_data(self, graph, ui_data):
@@ -26,20 +30,24 @@ class NodeGraphListener:
     def removed_connection(self, graph, src_node, src_port_id, dst_node, dst_port_id):
         pass
 
-class DFSChangedListener(NodeGraphListener):
-    def __init__(self, callback):
-        self.callback = callback
+    def changed_input_nodes(self, graph, node):
+        pass
+
+# keeps the topological order of the instances of a graph up to date
+class InstanceOrderListener(NodeGraphListener):
+    def __init__(self, graph):
+        self.graph = graph
 
     def created_node(self, graph, node, ui_data):
-        self.callback()
+        self.graph.update_sorted_instances(added=node)
     def removed_node(self, graph, node):
-        self.callback()
-    def changed_node_ui_data(self, graph, node, ui_data):
-        self.callback()
+        self.graph.update_sorted_instances(removed=node)
     def created_connection(self, graph, src_node, src_port_id, dst_node, dst_port_id):
-        self.callback()
+        self.graph.update_sorted_instances(changed=dst_node)
     def removed_connection(self, graph, src_node, src_port_id, dst_node, dst_port_id):
-        self.callback()
+        self.graph.update_sorted_instances(changed=dst_node)
+    def changed_input_nodes(self, graph, node):
+        self.graph.update_sorted_instances(changed=node)
 
 # prepare for serialization
 def format_port_spec(port_spec):
@@ -61,12 +69,38 @@ def unformat_port_spec(port_spec):
     return port_spec
 
 class Graph:
-    def __init__(self, evaluate_all=False):
+    def __init__(self, dirty_scheduling=False, worker_threads=0, pool_render_targets=False, demand_driven=False):
         self.parent = self
-        self.stats = defaultdict(lambda: [])
-        self.evaluate_all = evaluate_all
-
-        self._sorted_instances = None
+        # per node timings of evaluations with record_stats, created on first use
+        self._profiler = None
+        # whether to visit only dirty nodes during evaluation instead of all nodes, see _evaluate_dirty
+        self.dirty_scheduling = dirty_scheduling
+        # number of threads evaluating nodes in parallel (0 evaluates all nodes serially), see _evaluate_parallel
+        self.worker_threads = worker_threads
+        self._worker_pool = None
+        self._worker_pool_size = 0
+        # sorted instances as tuples (instance, parallel, parallel instances it depends on), see _evaluate_parallel
+        self._parallel_instances = None
+        # whether render targets of render nodes are recycled during evaluation, see render_target_plan
+        self.pool_render_targets = pool_render_targets
+        self._render_target_pool = None
+        self._render_target_plan = None
+        # whether OpenGL nodes whose outputs aren't read this frame are skipped, see update_demand
+        self.demand_driven = demand_driven
+        # nodes selecting their inputs (see Node.SELECTS_INPUTS), the inputs they demanded last frame,
+        # and the skipped instances / sorted instances without them
+        self._selectors = None
+        self._demand_key = None
+        self._skipped_instances = frozenset()
+        self._demanded_instances = None
+
+        # topological order of instances, created on first use and updated with each edit
+        self._order = None
+        # sorted instances as tuples (instance, dirty flag, always visit), see _evaluate_dirty
+        self._scheduled_instances = None
+        self._scheduled_from = None
+        # instances visited by the last dirty evaluation, these are the only ones that need a reset
+        self._visited_instances = None
 
     @property
     def instances(self):
@@ -75,56 +109,388 @@ class Graph:
 
     @property
     def sorted_instances(self):
-        if self._sorted_instances is None:
-            self._sort_instances()
-        return self._sorted_instances
-
-    def _sort_instances(self):
-        instances = self.instances
-        visited_instances = set()
-        sorted_instances = list()
-        circular = False
-
-        def dfs(instance):
-            nonlocal visited_instances, circular
-            if instance in visited_instances:
-                return
-            visited_instances.add(instance)
-            # Some nodes should be executed as early as possible, even before the nodes providing their input values.
-            # See DelayFloat why.
-            if not instance.FORCE_EARLY_EXECUTION:
-                for instance_before in instance.input_nodes:
-                    #if instance_before in visited_instances:
-                    #    circular = True
-                    if not self.evaluate_all and instance_before.graph != self:
+        if self._order is None:
+            self._order = TopologicalOrder()
+            self._order.add_nodes(self.instances)
+        return self._order.nodes
+
+    @property
+    def scheduled_instances(self):
+        sorted_instances = self.sorted_instances
+        if self._scheduled_instances is None or self._scheduled_from is not sorted_instances:
+            self._scheduled_instances = [ (instance, instance.dirty_flag, instance.always_visit) for instance in sorted_instances ]
+            self._scheduled_from = sorted_instances
+        return self._scheduled_instances
+
+    @property
+    def parallel_instances(self):
+        if self._parallel_instances is None:
+            instances = self.sorted_instances
+            index = { instance : i for i, instance in enumerate(instances) }
+            # instances that must be evaluated before an instance: its input nodes
+            # and the other way round for input nodes that come later (early executed nodes, cycles)
+            before = defaultdict(list)
+            for instance in instances:
+                for input_node in instance.input_nodes:
+                    i = index.get(input_node)
+                    if i is None or input_node is instance:
                         continue
-                    dfs(instance_before)
-            instance.dfs_index = len(sorted_instances)
-            sorted_instances.append(instance)
+                    if i < index[instance]:
+                        before[instance].append(input_node)
+                    else:
+                        before[input_node].append(instance)
+
+            parallel_instances = []
+            for instance in instances:
+                parallel = instance.PARALLEL_EVALUATION and not instance.USES_OPENGL
+                dependencies = [ other for other in before[instance] if other.PARALLEL_EVALUATION and not other.USES_OPENGL ]
+                parallel_instances.append((instance, parallel, dependencies))
+            self._parallel_instances = parallel_instances
+        return self._parallel_instances
 
-        for instance in instances:
-            dfs(instance)
-        self._sorted_instances = sorted_instances
+    @property
+    def render_target_pool(self):
+        if self._render_target_pool is None:
+            self._render_target_pool = render_target.RenderTargetPool()
+        return self._render_target_pool
+
+    @property
+    def render_target_plan(self):
+        # lifetimes of the render targets of render nodes (see Node.POOLED_RENDER_TARGET) as dictionary
+        # instance -> list of tuples (render node, nodes reading its texture) whose targets can be returned
+        # to the pool after the instance has been evaluated. a target lives from its render node
+        # to the last node (in sorted order) reading it. the target of a render node stays pinned if
+        # - nothing reads it (the editor might show it, or it's the output of a subgraph)
+        # - a node keeping its input textures reads it (see Node.RETAINS_INPUT_TEXTURES)
+        # - a node evaluated earlier reads it (early executed nodes, cycles), or a node of another graph
+        if self._render_target_plan is None:
+            instances = self.sorted_instances
+            index = { instance : i for i, instance in enumerate(instances) }
+            pool = self.render_target_pool
+            plan = defaultdict(list)
+            for i, instance in enumerate(instances):
+                if not instance.POOLED_RENDER_TARGET:
+                    continue
+                readers = set()
+                for src_port_id, dst_node, dst_port_id in instance.graph.connections_from.get(instance, []):
+                    if instance.ports[src_port_id]["dtype"] == dtype.tex2d:
+                        readers.add(dst_node)
+                reader_indices = [ index.get(reader, -1) for reader in readers ]
+                pinned = not readers or min(reader_indices) <= i \
+                        or any(reader.RETAINS_INPUT_TEXTURES for reader in readers)
+                instance.set_render_target_pool(None if pinned else pool)
+                if not pinned:
+                    plan[instances[max(reader_indices)]].append((instance, list(readers)))
+            self._render_target_plan = dict(plan)
+        return self._render_target_plan
+
+    def update_demand(self):
+        # an OpenGL node (a shader chain for example) is skipped if all nodes reading its outputs are skipped
+        # or don't read the inputs it's connected to this frame (see Node.demanded_inputs, ChooseTexture
+        # reads only the selected texture). nodes without readers (Renderer, recorders, outputs of subgraphs),
+        # stateful nodes (see Node.ALWAYS_DEMANDED) with the nodes they read and all other nodes are always evaluated.
+        # demand is determined before the evaluation, by the inputs nodes demanded after their last evaluation.
+        # it's computed again only if these change
+        instances = self.sorted_instances
+        if self._selectors is None or self._demanded_instances is None:
+            self._selectors = [ instance for instance in instances if instance.SELECTS_INPUTS ]
+            self._demand_key = None
+        selected = { selector : selector.demanded_inputs() for selector in self._selectors }
+        key = tuple(frozenset(ports) if ports is not None else None for ports in selected.values())
+        if key == self._demand_key and self._demanded_instances is not None:
+            return
+
+        index = { instance : i for i, instance in enumerate(instances) }
+        demanded = set()
+        for i in range(len(instances) - 1, -1, -1):
+            instance = instances[i]
+            connections = instance.graph.connections_from.get(instance)
+            if not instance.USES_OPENGL or instance.FORCE_EARLY_EXECUTION or instance.ALWAYS_DEMANDED or not connections:
+                demanded.add(instance)
+                continue
+            for src_port_id, dst_node, dst_port_id in connections:
+                # readers evaluated before (cycles) or outside of this graph are considered to read it
+                if index.get(dst_node, -1) <= i:
+                    demanded.add(instance)
+                    break
+                if dst_node not in demanded:
+                    continue
+                ports = selected.get(dst_node)
+                if ports is None or dst_port_id in ports:
+                    demanded.add(instance)
+                    break
+
+        skipped = frozenset(instance for instance in instances if instance not in demanded)
+        # skipped nodes missed changes of their inputs, they render again once demanded
+        for instance in self._skipped_instances.difference(skipped):
+            instance.force_evaluate()
+        self._skipped_instances = skipped
+        self._demanded_instances = [ instance for instance in instances if instance not in skipped ]
+        self._demand_key = key
+
+    @property
+    def skipped_instances(self):
+        # OpenGL nodes skipped by the last evaluation, see update_demand
+        return self._skipped_instances
+
+    def _release_render_targets(self, releases):
+        for instance, readers in releases:
+            texture = instance.render_target_texture
+            if texture is None:
+                continue
+            # readers passing the texture on (disabled shaders for example) and the editor showing it keep it
+            if render_target.is_previewed(texture):
+                continue
+            if any(any(value.value is texture for value in reader.output_values or []) for reader in readers):
+                continue
+            instance.release_fbo()
+            # its output texture is invalid now, the node renders again next frame
+            instance.force_evaluate()
+
+    def update_sorted_instances(self, added=None, removed=None, changed=None):
+        # dependencies between parallel instances, readers of render targets and readers of nodes
+        # might change without changing the order
+        self._parallel_instances = None
+        self._render_target_plan = None
+        self._demanded_instances = None
+        self._selectors = None
+        # graphs that are not evaluated (yet) don't keep an order
+        if self._order is None:
+            return
+        if added is not None:
+            self._order.add_node(added)
+        if removed is not None:
+            self._order.remove_node(removed)
+        if changed is not None:
+            self._order.update_inputs(changed)
 
     def reset_sorted_instances(self):
-        self._sorted_instances = None
+        # sorts all instances again on next use
+        self._order = None
+        self._scheduled_instances = None
+        self._parallel_instances = None
+        self._render_target_plan = None
+        self._demanded_instances = None
+        self._selectors = None
 
-    def evaluate(self, reset_instances=True, record_stats=False):
-        instances = self.sorted_instances
+    @property
+    def profiler(self):
+        if self._profiler is None:
+            self._profiler = Profiler()
+        return self._profiler
+
+    def _evaluate_instance(self, instance, record_stats):
+        if record_stats:
+            return self._profiler.evaluate(instance)
+        return instance.evaluate()
+
+    def _evaluate_all(self, record_stats, releases, skipped):
+        instances = self._demanded_instances if skipped else self.sorted_instances
         # check that we're evaluating only our own instances
         # (commented because of performance paranoia)
         #assert len(instances) == len(self.instances)
+        if not record_stats and not releases:
+            return core.evaluate_instances(instances)
         active_instances = set()
         for instance in instances:
-            if record_stats:
-                start = time.time()
-            if instance.evaluate():
+            if self._evaluate_instance(instance, record_stats):
                 active_instances.add(instance)
+            if releases and instance in releases:
+                self._release_render_targets(releases[instance])
+        return active_instances
+
+    def _visit_dirty(self, instance, record_stats):
+        # evaluates a visited instance and marks the nodes connected to its changed outputs dirty,
+        # returns whether it was evaluated and the marked nodes that come before it
+        evaluated = self._evaluate_instance(instance, record_stats)
+        instance.dirty_flag.dirty = False
+        connections = instance.graph.connections_from.get(instance)
+        if not connections:
+            return evaluated, ()
+        late_instances = []
+        values = instance.values
+        for src_port_id, dst_node, dst_port_id in connections:
+            value = values.get(src_port_id)
+            if value is not None and value.has_changed():
+                dst_node.dirty_flag.dirty = True
+                # dst node comes before this node (early executed nodes, cyclic connections)
+                # reset it with the others, it's visited again next frame
+                if dst_node.dfs_index < instance.dfs_index:
+                    late_instances.append(dst_node)
+        return evaluated, late_instances
+
+    def _evaluate_dirty(self, record_stats, releases, skipped):
+        # visits only the nodes that might need an evaluation:
+        # - dirty nodes, i.e. one of their values has changed since their last visit
+        #   (manual values, connections, outputs set from outside, forced evaluation)
+        # - nodes that must be visited every frame (see Node.always_visit)
+        # when a visited node has changed outputs, the connected nodes are marked dirty
+        # as the nodes are visited in sorted order, these are usually visited later in this frame
+        active_instances = set()
+        visited_instances = []
+        late_instances = set()
+        for instance, dirty_flag, always_visit in self.scheduled_instances:
+            if not dirty_flag.dirty and not always_visit:
+                continue
+            # (stays dirty until it's demanded again)
+            if skipped and instance in skipped:
+                continue
+            evaluated, late = self._visit_dirty(instance, record_stats)
+            if evaluated:
+                active_instances.add(instance)
+            visited_instances.append(instance)
+            late_instances.update(late)
+            if releases and instance in releases:
+                self._release_render_targets(releases[instance])
+
+        if late_instances:
+            visited_instances.extend(late_instances.difference(visited_instances))
+        self._visited_instances = visited_instances
+        return active_instances
+
+    def _evaluate_parallel(self, record_stats, releases, skipped):
+        # evaluates nodes that support it (see Node.PARALLEL_EVALUATION) in worker threads,
+        # all other nodes (OpenGL nodes especially) are evaluated in this thread in sorted order.
+        # a parallel node is submitted when the nodes before it are evaluated,
+        # a node depending on a parallel node waits for it. as parallel nodes only work on their own
+        # state and values, the results are the same as with serial evaluation
+        pool = self._get_worker_pool()
+
+        active_instances = set()
+        futures = {}
+        def wait(instances):
+            for instance in instances:
+                future = futures.pop(instance, None)
+                if future is not None and future.result():
+                    active_instances.add(instance)
+
+        def evaluate_parallel(instance, dependency_futures):
+            for future in dependency_futures:
+                future.result()
+            return self._evaluate_instance(instance, record_stats)
+
+        try:
+            for instance, parallel, dependencies in self.parallel_instances:
+                if skipped and instance in skipped:
+                    continue
+                if parallel:
+                    # dependencies that are not running anymore are already evaluated
+                    dependency_futures = [ futures[dependency] for dependency in dependencies if dependency in futures ]
+                    futures[instance] = pool.submit(evaluate_parallel, instance, dependency_futures)
+                    continue
+                if dependencies:
+                    wait(dependencies)
+                if self._evaluate_instance(instance, record_stats):
+                    active_instances.add(instance)
+                if releases and instance in releases:
+                    self._release_render_targets(releases[instance])
+        finally:
+            # also waits for all workers when a node failed
+            wait(list(futures.keys()))
+        return active_instances
+
+    def _evaluate_dirty_parallel(self, record_stats, releases, skipped):
+        # dirty scheduling (see _evaluate_dirty) with parallel nodes evaluated in worker threads (see _evaluate_parallel)
+        # whether a node is dirty is known only after the nodes it depends on are evaluated:
+        # nodes depending on running parallel nodes check it after waiting for them, parallel ones in the worker.
+        # visited parallel nodes mark the nodes connected to them dirty in the worker, before their future is done
+        pool = self._get_worker_pool()
+
+        active_instances = set()
+        visited_instances = []
+        late_instances = set()
+        futures = {}
+        def visited(instance, evaluated, late):
+            if evaluated:
+                active_instances.add(instance)
+            visited_instances.append(instance)
+            late_instances.update(late)
+
+        def wait(instances):
+            for instance in instances:
+                future = futures.pop(instance, None)
+                if future is None:
+                    continue
+                result = future.result()
+                if result is not None:
+                    visited(instance, *result)
+
+        def visit_parallel(instance, dependency_futures):
+            for future in dependency_futures:
+                future.result()
+            if not instance.dirty_flag.dirty and not instance.always_visit:
+                return None
+            return self._visit_dirty(instance, record_stats)
+
+        try:
+            for instance, parallel, dependencies in self.parallel_instances:
+                if skipped and instance in skipped:
+                    continue
+                if parallel:
+                    dependency_futures = [ futures[dependency] for dependency in dependencies if dependency in futures ]
+                    if dependency_futures or instance.dirty_flag.dirty or instance.always_visit:
+                        futures[instance] = pool.submit(visit_parallel, instance, dependency_futures)
+                    continue
+                if dependencies:
+                    wait(dependencies)
+                if not instance.dirty_flag.dirty and not instance.always_visit:
+                    continue
+                visited(instance, *self._visit_dirty(instance, record_stats))
+                if releases and instance in releases:
+                    self._release_render_targets(releases[instance])
+        finally:
+            # also waits for all workers when a node failed
+            wait(list(futures.keys()))
+
+        if late_instances:
+            visited_instances.extend(late_instances.difference(visited_instances))
+        self._visited_instances = visited_instances
+        return active_instances
+
+    def _get_worker_pool(self):
+        if self._worker_pool is None or self._worker_pool_size != self.worker_threads:
+            self._stop_worker_pool()
+            self._worker_pool = ThreadPoolExecutor(max_workers=self.worker_threads, thread_name_prefix="graph-worker")
+            self._worker_pool_size = self.worker_threads
+        return self._worker_pool
+
+    def _stop_worker_pool(self):
+        if self._worker_pool is not None:
+            self._worker_pool.shutdown()
+            self._worker_pool = None
+
+    def evaluate(self, reset_instances=True, record_stats=False):
+        self._begin_frame()
+        if record_stats:
+            self.profiler.begin_frame()
+        # render targets to return to the pool after evaluating some instances
+        releases = self.render_target_plan if self.pool_render_targets else None
+        skipped = None
+        if self.demand_driven:
+            self.update_demand()
+            skipped = self._skipped_instances
+        elif self._skipped_instances:
+            # demand driven evaluation was turned off, skipped nodes render again
+            for instance in self._skipped_instances:
+                instance.force_evaluate()
+            self._skipped_instances = frozenset()
+        try:
+            if self.dirty_scheduling and self.worker_threads > 0:
+                active_instances = self._evaluate_dirty_parallel(record_stats, releases, skipped)
+            elif self.dirty_scheduling:
+                active_instances = self._evaluate_dirty(record_stats, releases, skipped)
+            elif self.worker_threads > 0:
+                active_instances = self._evaluate_parallel(record_stats, releases, skipped)
+            else:
+                active_instances = self._evaluate_all(record_stats, releases, skipped)
+        finally:
+            if self._render_target_pool is not None:
+                self._render_target_pool.end_frame()
+                if record_stats:
+                    self._profiler.set_counters("render targets", self._render_target_pool.stats())
+            self._end_frame(record_stats)
             if record_stats:
-                if instance.USES_OPENGL:
-                    gl.glFinish()
-                end = time.time()
-                self.stats[instance].append(end - start)
+                self._profiler.end_frame()
 
         # reset evaluation status and set all inputs/outputs unchanged!
         # if you want to evaluate outputs (for example Module node wants this),
@@ -133,12 +499,23 @@ class Graph:
             self.reset_instances()
         return active_instances
 
+    def _begin_frame(self):
+        # called before each evaluation, see _end_frame
+        pass
+
+    def _end_frame(self, record_stats):
+        # called after each evaluation, also if a node failed
+        # subgraphs of modules are evaluated during the frame of the root graph, see RootGraph._end_frame
+        pass
+
     def reset_instances(self):
-        instances = self.instances
-        for instance in instances:
-            instance._after_evaluate()
-        for instance in instances:
-            instance.reset_evaluated()
+        instances = self.sorted_instances
+        # with dirty scheduling only visited nodes can have changed values
+        # (any other change would have marked a node dirty, and it's visited next frame)
+        if self.dirty_scheduling and self._visited_instances is not None:
+            instances = self._visited_instances
+            self._visited_instances = None
+        core.reset_instances(instances)
 
     # apply a function to each instance
     # instances are sorted by key before (to ensure same results with randomization and seeds involved)
@@ -149,69 +526,50 @@ class Graph:
             fn(instance)
 
     def get_stats(self):
-        collected_stats = {}
-        total = 0.0
-        for instance, timings in self.stats.items():
-            min_time = min(timings)
-            max_time = max(timings)
-            tot_time = sum(timings)
-            avg_time = tot_time / len(timings)
-            total += tot_time
-            collected_stats[instance] = {"min" : min_time, "max" : max_time, "tot" : tot_time, "avg" : avg_time, "count" : 1}
-        for instance, values in collected_stats.items():
-            values["rel"] = values["tot"] / total
-
-        def sort_and_cum(collected_stats):
-            grouped_stats = []
-            for key, values in collected_stats.items():
-                grouped_stats.append((key, values))
-            grouped_stats.sort(key = lambda p: p[1]["tot"], reverse=True)
-
-            cum = 1.0
-            for key, values in grouped_stats:
-                cum -= values["rel"]
-                values["cum"] = cum
-            return grouped_stats
-
-        by_instance = sort_and_cum(collected_stats)
-
-        by_node_type = {}
-        def merge_values(values0, values1):
-            return {
-                "min" : min(values0["min"], values1["min"]),
-                "max" : max(values0["max"], values1["max"]),
-                "tot" : values0["tot"] + values1["tot"],
-                "avg" : values0["avg"] + values1["avg"],
-                "rel" : values0["rel"] + values1["rel"],
-                "count" : values0["count"] + values1["count"],
-            }
-        for instance, values in collected_stats.items():
-            node_type = instance.spec.name
-            if node_type in by_node_type:
-                by_node_type[node_type] = merge_values(by_node_type[node_type], values)
-            else:
-                by_node_type[node_type] = values
-        by_node_type = sort_and_cum(by_node_type)
+        # stats of the last evaluations with record_stats, see Profiler.get_stats
+        return self.profiler.get_stats(self.instances)
 
-        self.stats = defaultdict(lambda: [])
-        return by_instance, by_node_type 
+    def export_trace(self, path):
+        # writes the last evaluations with record_stats as Chrome trace
+        self.profiler.export_chrome_trace(path)
 
     def stop(self):
         for instance in self.instances:
             instance.stop()
+        self._stop_worker_pool()
+        if self._profiler is not None:
+            self._profiler.stop()
+            self._profiler = None
+        if self._render_target_pool is not None:
+            self._render_target_pool.clear()
 
 class RootGraph(Graph):
-    def __init__(self, graphs=[]):
-        super().__init__(evaluate_all=True)
+    def __init__(self, graphs=[], dirty_scheduling=False, worker_threads=0, pool_render_targets=False, demand_driven=False):
+        super().__init__(dirty_scheduling=dirty_scheduling, worker_threads=worker_threads, pool_render_targets=pool_render_targets,
+                demand_driven=demand_driven)
 
         self._graphs = []
         for graph in graphs:
             self.append(graph)
 
+    def _begin_frame(self):
+        # takes the changed files once per frame, shader sources and file watchers only compare versions then
+        assets.shader_assets.check_changes()
+
+    def _end_frame(self, record_stats):
+        # (the pool of texture snapshots and the texture loader are shared by all graphs,
+        # the pool is aged and the upload budget is spent once per frame)
+        render_target.snapshot_pool.end_frame()
+        texture_loader.texture_loader.end_frame()
+        if record_stats:
+            self._profiler.set_counters("textures", texture_loader.texture_loader.stats())
+
     def append(self, graph):
         graph.parent = self
-        graph.listeners.append(DFSChangedListener(lambda: self.reset_sorted_instances()))
+        graph.listeners.append(InstanceOrderListener(self))
         self._graphs.append(graph)
+        if self._order is not None:
+            self._order.add_nodes(graph.instances)
 
     @property
     def instances(self):
@@ -228,7 +586,7 @@ class NodeGraph(Graph):
             self.parent = parent
 
         self.listeners = []
-        self.listeners.append(DFSChangedListener(lambda: self.reset_sorted_instances()))
+        self.listeners.append(InstanceOrderListener(self))
 
         self.ui_data = {}
         self.node_id_counter = 0
@@ -556,6 +914,11 @@ class NodeGraph(Graph):
         for listener in self.listeners:
             listener.removed_connection(self, src_node, src_port_id, dst_node, dst_port_id)
 
+    def changed_input_nodes(self, node):
+        # for nodes that depend on other nodes without a connection (see GetVar)
+        for listener in self.listeners:
+            listener.changed_input_nodes(self, node)
+
     def clear(self):
         for instance in list(self.nodes.values()):
             self.remove_node(instance)
@@ -0,0 +1,166 @@
+# Topological order of graph nodes that is updated incrementally on edits.
+# Nodes are ordered so that the input nodes of a node come before it. Instead of sorting
+# all nodes again after each edit, adding a dependency reorders only the nodes between
+# its two ends (dynamic topological sort by Pearce and Kelly). Removing a dependency or a
+# node never invalidates the order.
+# The position of each node is stored as its dfs_index. Positions are unique and increasing,
+# but not contiguous (removed nodes leave holes until the positions are compacted).
+# Dependencies that would close a cycle (set/get var nodes might do that) are not ordered,
+# they are retried whenever another dependency is removed.
+class TopologicalOrder:
+    def __init__(self):
+        # position -> node, None for removed nodes
+        self._slots = []
+        self._holes = 0
+        # node -> set of ordered input / output nodes
+        self._inputs = {}
+        self._outputs = {}
+        # node -> set of input nodes that would close a cycle (only nodes that have some)
+        self._cyclic_inputs = {}
+        self._nodes = None
+
+    def __contains__(self, node):
+        return node in self._inputs
+
+    def __len__(self):
+        return len(self._inputs)
+
+    @property
+    def nodes(self):
+        # sorted list of nodes, a new list is created only after the order has changed
+        if self._nodes is None:
+            self._nodes = [ node for node in self._slots if node is not None ]
+        return self._nodes
+
+    def add_nodes(self, nodes):
+        nodes = list(nodes)
+        for node in nodes:
+            self._add_node(node)
+        # input nodes might have been added after the nodes depending on them
+        for node in nodes:
+            self.update_inputs(node)
+
+    def add_node(self, node):
+        self._add_node(node)
+        self.update_inputs(node)
+
+    def _add_node(self, node):
+        if node in self._inputs:
+            return
+        node.dfs_index = len(self._slots)
+        self._slots.append(node)
+        self._inputs[node] = set()
+        self._outputs[node] = set()
+        self._nodes = None
+
+    def remove_node(self, node):
+        if node not in self._inputs:
+            return
+        for src in list(self._inputs[node]):
+            self._remove_edge(src, node)
+        for dst in list(self._outputs[node]):
+            self._remove_edge(node, dst)
+        self._cyclic_inputs.pop(node, None)
+        for cyclic_inputs in self._cyclic_inputs.values():
+            cyclic_inputs.discard(node)
+        del self._inputs[node]
+        del self._outputs[node]
+
+        self._slots[node.dfs_index] = None
+        self._holes += 1
+        if self._holes > len(self._slots) // 2:
+            self._compact()
+        self._nodes = None
+        self._retry_cyclic_inputs()
+
+    def update_inputs(self, node):
+        # call this when the input nodes of a node have changed
+        if node not in self._inputs:
+            return
+        # Some nodes should be executed as early as possible, even before the nodes providing their input values.
+        # See DelayFloat why.
+        inputs = set()
+        if not node.FORCE_EARLY_EXECUTION:
+            inputs = set( src for src in node.input_nodes if src is not node and src in self._inputs )
+
+        cyclic_inputs = self._cyclic_inputs.pop(node, set())
+        cyclic_inputs.intersection_update(inputs)
+        removed = self._inputs[node].difference(inputs)
+        for src in removed:
+            self._remove_edge(src, node)
+        for src in inputs.difference(self._inputs[node], cyclic_inputs):
+            if not self._add_edge(src, node):
+                cyclic_inputs.add(src)
+        if cyclic_inputs:
+            self._cyclic_inputs[node] = cyclic_inputs
+        if removed:
+            self._retry_cyclic_inputs()
+
+    def _remove_edge(self, src, dst):
+        self._inputs[dst].discard(src)
+        self._outputs[src].discard(dst)
+
+    def _add_edge(self, src, dst):
+        # adds dependency src -> dst, returns False if it would close a cycle
+        lower = dst.dfs_index
+        upper = src.dfs_index
+        if lower > upper:
+            self._inputs[dst].add(src)
+            self._outputs[src].add(dst)
+            return True
+
+        # nodes reachable from dst that are placed before src
+        forward = [dst]
+        visited = {dst}
+        stack = [dst]
+        while stack:
+            node = stack.pop()
+            for output in self._outputs[node]:
+                if output is src:
+                    return False
+                if output not in visited and output.dfs_index < upper:
+                    visited.add(output)
+                    forward.append(output)
+                    stack.append(output)
+
+        # nodes reaching src that are placed after dst
+        backward = [src]
+        visited = {src}
+        stack = [src]
+        while stack:
+            node = stack.pop()
+            for input in self._inputs[node]:
+                if input not in visited and input.dfs_index > lower:
+                    visited.add(input)
+                    backward.append(input)
+                    stack.append(input)
+
+        # move the backward nodes in front of the forward nodes,
+        # reusing their positions and keeping their relative order
+        key = lambda node: node.dfs_index
+        forward.sort(key=key)
+        backward.sort(key=key)
+        nodes = backward + forward
+        positions = sorted(node.dfs_index for node in nodes)
+        for node, position in zip(nodes, positions):
+            node.dfs_index = position
+            self._slots[position] = node
+        self._nodes = None
+
+        self._inputs[dst].add(src)
+        self._outputs[src].add(dst)
+        return True
+
+    def _retry_cyclic_inputs(self):
+        for node, cyclic_inputs in list(self._cyclic_inputs.items()):
+            for src in list(cyclic_inputs):
+                if self._add_edge(src, node):
+                    cyclic_inputs.discard(src)
+            if not cyclic_inputs:
+                del self._cyclic_inputs[node]
+
+    def _compact(self):
+        self._slots = [ node for node in self._slots if node is not None ]
+        for position, node in enumerate(self._slots):
+            node.dfs_index = position
+        self._holes = 0
@@ -28,7 +28,7 @@ import pyvisual.editor.widget as node_widget
 from glumpy import app, gloo, gl, glm
 from glumpy.ext import glfw
 from pyvisual import assets, util
-from pyvisual.editor import glumpy_imgui
+from pyvisual.editor import glumpy_imgui, profiler
 from pyvisual.editor.graph import RootGraph, NodeGraph, NodeGraphListener
 from pyvisual.editor.graph_traits import GraphTraits
 from pyvisual.node.io.texture import Renderer
@@ -145,6 +145,7 @@ _colors = {
     node_dtype.base_vec4 : _red,
     node_dtype.base_mat4 : _purpol,
     node_dtype.base_tex2d : _light_blue,
+    node_dtype.base_tex3d : _light_blue,
     node_dtype.base_audio : _orange,
 }
 def get_connection_color(dtype):
@@ -716,7 +717,7 @@ class UINode:
         upper_left = self.ui_graph.local_to_screen(actual_pos)
         lower_right = t_add(upper_left, self.size_with_padding)
         with draw_on_channel(draw_list, CHANNEL_NODE_BACKGROUND):
-            if self.instance._last_evaluated > time.time() - 0.2:
+            if self.instance._last_evaluated > util.time.clock_time() - 0.2:
                 size = imgui.get_text_line_height()
                 offset = 4
                 a = lower_right[0] - size + offset, upper_left[1] - offset
@@ -2259,15 +2260,46 @@ time_count = 0
 profile_time_count = 0
 
 PROFILE_STATS = "--profile-nodes" in sys.argv
+# path of a Chrome trace of the last profiled frames, written with the performance stats
+PROFILE_TRACE = None
+if "--profile-trace" in sys.argv:
+    PROFILE_TRACE = sys.argv[sys.argv.index("--profile-trace") + 1]
+    PROFILE_STATS = True
 
 if "--paused" in sys.argv:
     util.time.global_time.paused = True
 
+# advance time by a fixed step each frame instead of using real time (see util.time.VirtualClock)
+if "--virtual-clock" in sys.argv:
+    # (glumpy runs with 60 fps per default)
+    util.time.global_time.set_clock(util.time.VirtualClock(fps=60.0))
+
+# evaluate only nodes whose inputs have changed (see Graph.dirty_scheduling)
+if "--dirty-scheduling" in sys.argv:
+    editor.root_graph.dirty_scheduling = True
+
+# recycle render targets of render nodes during evaluation (see Graph.render_target_plan)
+if "--pool-render-targets" in sys.argv:
+    editor.root_graph.pool_render_targets = True
+
+# skip shader chains whose outputs aren't read this frame (see Graph.update_demand)
+if "--demand-driven" in sys.argv:
+    editor.root_graph.demand_driven = True
+
+# evaluate nodes that support it in worker threads (see Graph._evaluate_parallel)
+if "--worker-threads" in sys.argv:
+    editor.root_graph.worker_threads = int(sys.argv[sys.argv.index("--worker-threads") + 1])
+
+# bytes of loaded textures that are kept in memory (see util.texture_loader)
+if "--texture-cache-mb" in sys.argv:
+    util.texture_loader.texture_loader.cache_bytes = int(sys.argv[sys.argv.index("--texture-cache-mb") + 1]) * 2**20
+
 @window.event
 def on_draw(event):
     global editor_time, imgui_render_time, processing_time, time_count, profile_time_count
 
     # evaluate nodes
+    util.time.global_time.clock.tick()
     start = time.time()
     #profile.enable()
     editor.root_graph.evaluate(record_stats=PROFILE_STATS)
@@ -2307,20 +2339,15 @@ def on_draw(event):
     if PROFILE_STATS:
         profile_time_count += 1
         if profile_time_count >= 60*5:
-            import tabulate
             stats_by_instance, stats_by_node_type = editor.root_graph.get_stats()
             print("=== Performance stats ===")
-            total_average = 0.0
-            rows = []
-            for node, values in stats_by_node_type[:25]:
-                rows.append([node, "%d" % values["count"], "%.2f" % (values["avg"] * 1000000.0), "%.2f%%" % (values["rel"] * 100.0), "%.2f%%" % (values["cum"] * 100.0)])
-                total_average += values["avg"]
-            for node, values in stats_by_node_type[25:]:
-                total_average += values["avg"]
-            print(tabulate.tabulate(rows, headers=["Node type", "count", "avg time (micros)", "rel time", "inv cum time"]))
+            total_average = sum([ values["avg"] for node, values in stats_by_node_type ])
+            print(profiler.format_stats_table(stats_by_node_type, editor.root_graph.profiler.counters))
             print("=== ===")
             print("Total average time per frame: %.2f ms" % (total_average * 1000))
             print("=== ===")
+            if PROFILE_TRACE is not None:
+                editor.root_graph.export_trace(PROFILE_TRACE)
             profile_time_count = 0
 
 @window.event
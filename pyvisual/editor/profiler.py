@@ -0,0 +1,282 @@
+# Per node profiling of graph evaluation (see Graph.evaluate(record_stats=True)).
+# CPU time of a node is measured with perf_counter_ns around its evaluation. For OpenGL nodes
+# the GPU time is measured with timestamp queries before and after the evaluation (unlike
+# GL_TIME_ELAPSED queries these may nest). Query results are read a few frames later, when the GPU
+# has finished them, so profiling doesn't stall the GPU after each node like glFinish would.
+# Timings are kept in fixed-size ring buffers per node, stats are computed over the last
+# HISTORY_SIZE evaluations. The last TRACE_FRAMES frames can be exported as Chrome trace JSON
+# (open with chrome://tracing or ui.perfetto.dev).
+
+import json
+import os
+import threading
+import time
+from collections import deque
+
+import numpy as np
+from glumpy import gl
+
+HISTORY_SIZE = 600
+TRACE_FRAMES = 120
+PERCENTILES = [50, 95, 99]
+# frames that may pass before query results are read, waits for the GPU if there are more
+MAX_PENDING_FRAMES = 4
+QUERY_BATCH = 64
+# thread id of gpu events in traces
+GPU_TID = 0
+
+def _scalar(value):
+    # PyOpenGL returns query results as (one element) arrays
+    return int(np.ravel(value)[0])
+
+class RingBuffer:
+    def __init__(self, size, dtype=np.int64):
+        self.values = np.zeros(size, dtype=dtype)
+        self.index = 0
+        self.count = 0
+
+    def append(self, value):
+        self.values[self.index] = value
+        self.index = (self.index + 1) % len(self.values)
+        if self.count < len(self.values):
+            self.count += 1
+
+    @property
+    def samples(self):
+        # samples in no particular order
+        return self.values[:self.count]
+
+class NodeTimings:
+    def __init__(self, history_size):
+        # nanoseconds
+        self.cpu = RingBuffer(history_size)
+        self.gpu = RingBuffer(history_size)
+
+def summarize(samples):
+    # stats in seconds of timings in nanoseconds
+    if len(samples) == 0:
+        return None
+    samples = samples * 1e-9
+    p50, p95, p99 = np.percentile(samples, PERCENTILES)
+    tot_time = float(samples.sum())
+    return {"min" : float(samples.min()), "max" : float(samples.max()), "tot" : tot_time, "avg" : tot_time / len(samples),
+            "p50" : float(p50), "p95" : float(p95), "p99" : float(p99), "samples" : len(samples)}
+
+def format_stats_table(stats_by_node_type, counters=None, max_rows=25):
+    # text table of the stats by node type (see Graph.get_stats) in micros, followed by the counters
+    # (see Profiler.counters), printed by the editor and the offline renderer
+    import tabulate
+    rows = []
+    for node, values in stats_by_node_type[:max_rows]:
+        gpu_values = values["gpu"]
+        rows.append([node, "%d" % values["count"], "%.2f" % (values["avg"] * 1000000.0),
+            "%.2f / %.2f / %.2f" % (values["p50"] * 1000000.0, values["p95"] * 1000000.0, values["p99"] * 1000000.0),
+            "%.2f" % (gpu_values["avg"] * 1000000.0) if gpu_values is not None else "",
+            "%.2f%%" % (values["rel"] * 100.0), "%.2f%%" % (values["cum"] * 100.0)])
+    lines = [tabulate.tabulate(rows, headers=["Node type", "count", "avg time (micros)", "p50 / p95 / p99 (micros)", "gpu time (micros)", "rel time", "inv cum time"])]
+    for name, values in (counters or {}).items():
+        lines.append("%s: %s" % (name, ", ".join("%s %.1f" % (key, value) for key, value in values.items())))
+    return "\n".join(lines)
+
+class Profiler:
+    def __init__(self, history_size=HISTORY_SIZE, trace_frames=TRACE_FRAMES):
+        self.history_size = history_size
+        self._timings = {}
+        # nodes might be evaluated in worker threads (see Graph._evaluate_parallel)
+        self._lock = threading.Lock()
+
+        self._frame = 0
+        self._frame_start = None
+        # trace events of the current frame and the last frames
+        self._frame_events = []
+        self._trace = deque(maxlen=trace_frames)
+
+        self._free_queries = []
+        # queries of the current frame as tuples (instance, start query, end query)
+        self._frame_queries = []
+        # frames with queries that are not read yet as tuples (trace events, queries)
+        self._pending = deque()
+        # difference between cpu (perf_counter_ns) and gpu clock, synchronized each frame
+        self._gpu_offset = None
+        self._gpu_synced = False
+        # name -> dictionary of numbers of the last frame, see set_counters
+        self.counters = {}
+
+    def _node_timings(self, instance):
+        timings = self._timings.get(instance)
+        if timings is None:
+            with self._lock:
+                timings = self._timings.setdefault(instance, NodeTimings(self.history_size))
+        return timings
+
+    def begin_frame(self):
+        self._read_queries(wait=False)
+        self._frame_events = []
+        self._frame_queries = []
+        self._gpu_synced = False
+        self._frame_start = time.perf_counter_ns()
+
+    def end_frame(self):
+        end = time.perf_counter_ns()
+        self._frame_events.append(self._event("frame %d" % self._frame, "frame", threading.get_ident(), self._frame_start, end - self._frame_start))
+        if self._frame_queries:
+            self._pending.append((self._frame_events, self._frame_queries))
+        self._trace.append(self._frame_events)
+        self._frame += 1
+
+    def set_counters(self, name, values):
+        # other measurements of the current frame (render target memory for example), also shown as counters in traces
+        self.counters[name] = dict(values)
+        self._frame_events.append({"name" : name, "ph" : "C", "ts" : time.perf_counter_ns() / 1000.0, "tid" : threading.get_ident(), "args" : dict(values)})
+
+    def evaluate(self, instance):
+        uses_opengl = instance.USES_OPENGL
+        if uses_opengl:
+            start_query = self._query_timestamp()
+        start = time.perf_counter_ns()
+        evaluated = instance.evaluate()
+        end = time.perf_counter_ns()
+        if uses_opengl:
+            self._frame_queries.append((instance, start_query, self._query_timestamp()))
+
+        self._node_timings(instance).cpu.append(end - start)
+        self._frame_events.append(self._event(self._event_name(instance), "cpu", threading.get_ident(), start, end - start))
+        return evaluated
+
+    def _query_timestamp(self):
+        if not self._gpu_synced:
+            gpu_time = _scalar(gl.glGetInteger64v(gl.GL_TIMESTAMP))
+            self._gpu_offset = time.perf_counter_ns() - gpu_time
+            self._gpu_synced = True
+        if not self._free_queries:
+            self._free_queries.extend(np.ravel(gl.glGenQueries(QUERY_BATCH)).tolist())
+        query = self._free_queries.pop()
+        gl.glQueryCounter(query, gl.GL_TIMESTAMP)
+        return query
+
+    def _read_queries(self, wait):
+        while self._pending:
+            frame_events, queries = self._pending[0]
+            # queries finish in order, if the last one is available all are
+            if not wait and len(self._pending) <= MAX_PENDING_FRAMES:
+                if not _scalar(gl.glGetQueryObjectiv(queries[-1][2], gl.GL_QUERY_RESULT_AVAILABLE)):
+                    break
+            self._pending.popleft()
+            for instance, start_query, end_query in queries:
+                start = _scalar(gl.glGetQueryObjectui64v(start_query, gl.GL_QUERY_RESULT))
+                end = _scalar(gl.glGetQueryObjectui64v(end_query, gl.GL_QUERY_RESULT))
+                self._node_timings(instance).gpu.append(end - start)
+                frame_events.append(self._event(self._event_name(instance), "gpu", GPU_TID, start + self._gpu_offset, end - start))
+                self._free_queries.append(start_query)
+                self._free_queries.append(end_query)
+
+    def _event_name(self, instance):
+        return "%s #%d" % (instance.spec.name, instance.id)
+
+    def _event(self, name, category, tid, start, duration):
+        # complete event, times in microseconds
+        return {"name" : name, "cat" : category, "ph" : "X", "ts" : start / 1000.0, "dur" : duration / 1000.0, "tid" : tid}
+
+    def get_stats(self, instances=None):
+        # returns stats by instance and stats by node type as lists of tuples (key, values) sorted by total time
+        # values are the cpu time stats (see summarize) with relative / inverse cumulative time and the gpu time stats as "gpu"
+        # instances not given here (removed nodes) are dropped from the stats
+        self._read_queries(wait=False)
+        with self._lock:
+            if instances is not None:
+                instances = set(instances)
+                for instance in list(self._timings.keys()):
+                    if instance not in instances:
+                        del self._timings[instance]
+            timings = list(self._timings.items())
+
+        collected_stats = {}
+        samples_by_node_type = {}
+        total = 0.0
+        for instance, node_timings in timings:
+            values = summarize(node_timings.cpu.samples)
+            if values is None:
+                continue
+            values["count"] = 1
+            values["gpu"] = summarize(node_timings.gpu.samples)
+            total += values["tot"]
+            collected_stats[instance] = values
+            cpu_samples, gpu_samples = samples_by_node_type.setdefault(instance.spec.name, ([], []))
+            cpu_samples.append(node_timings.cpu.samples)
+            gpu_samples.append(node_timings.gpu.samples)
+        for instance, values in collected_stats.items():
+            values["rel"] = values["tot"] / total if total > 0.0 else 0.0
+
+        def sort_and_cum(collected_stats):
+            grouped_stats = []
+            for key, values in collected_stats.items():
+                grouped_stats.append((key, values))
+            grouped_stats.sort(key = lambda p: p[1]["tot"], reverse=True)
+
+            cum = 1.0
+            for key, values in grouped_stats:
+                cum -= values["rel"]
+                values["cum"] = cum
+            return grouped_stats
+
+        by_instance = sort_and_cum(collected_stats)
+
+        # percentiles of a node type are over the evaluations of all its nodes,
+        # avg is the time all its nodes take per evaluation
+        by_node_type = {}
+        for instance, values in collected_stats.items():
+            node_type = instance.spec.name
+            if node_type in by_node_type:
+                type_values = by_node_type[node_type]
+                type_values["avg"] += values["avg"]
+                type_values["rel"] += values["rel"]
+                type_values["count"] += 1
+                if values["gpu"] is not None:
+                    type_values["gpu"]["avg"] += values["gpu"]["avg"]
+                continue
+            cpu_samples, gpu_samples = samples_by_node_type[node_type]
+            type_values = summarize(np.concatenate(cpu_samples))
+            type_values["avg"] = values["avg"]
+            type_values["rel"] = values["rel"]
+            type_values["count"] = 1
+            type_values["gpu"] = summarize(np.concatenate(gpu_samples))
+            if type_values["gpu"] is not None:
+                type_values["gpu"]["avg"] = values["gpu"]["avg"] if values["gpu"] is not None else 0.0
+            by_node_type[node_type] = type_values
+        by_node_type = sort_and_cum(by_node_type)
+        return by_instance, by_node_type
+
+    def export_chrome_trace(self, path):
+        # writes the events of the last frames in Chrome's trace event format
+        self._read_queries(wait=True)
+        pid = os.getpid()
+        events = []
+        thread_names = {GPU_TID : "GPU"}
+        for thread in threading.enumerate():
+            thread_names[thread.ident] = thread.name
+        for tid, name in thread_names.items():
+            events.append({"name" : "thread_name", "ph" : "M", "pid" : pid, "tid" : tid, "args" : {"name" : name}})
+        for frame_events in self._trace:
+            for event in frame_events:
+                event = dict(event)
+                event["pid"] = pid
+                events.append(event)
+        with open(path, "w") as f:
+            json.dump({"traceEvents" : events, "displayTimeUnit" : "ms"}, f)
+
+    def reset(self):
+        with self._lock:
+            self._timings = {}
+        self._trace.clear()
+        self.counters = {}
+
+    def stop(self):
+        # releases the query objects (requires the OpenGL context)
+        queries = self._free_queries
+        for frame_events, frame_queries in self._pending:
+            for instance, start_query, end_query in frame_queries:
+                queries.extend((start_query, end_query))
+        if queries:
+            gl.glDeleteQueries(len(queries), np.array(queries, dtype=np.uint32))
+        self._free_queries = []
+        self._pending.clear()
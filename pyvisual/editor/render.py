@@ -0,0 +1,188 @@
+#!/usr/bin/env python3
+
+# Renders saved scenes without the editor and its windows:
+# loads session / background graphs, evaluates them at a fixed virtual frame rate (see util.time.VirtualClock)
+# and writes the output texture (last Renderer node) of each frame.
+# Usage: python3 -m pyvisual.editor.render --frames 600 --output frames/%05d.png
+#   --output pattern with %d writes one image per frame (format by extension),
+#   any other path gets raw RGBA frames appended, - writes raw RGBA frames to stdout.
+#   --context egl/osmesa renders with an offscreen context (no display required with GLFW 3.4+).
+
+import os
+import sys
+import argparse
+
+CONTEXT_APIS = ["window", "egl", "osmesa"]
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Render saved scenes without the editor.")
+    parser.add_argument("--session", default="session.json", help="session graph to render")
+    parser.add_argument("--background", default="background.json", help="background graph, ignored if it doesn't exist")
+    parser.add_argument("--frames", type=int, default=300, help="number of frames to render")
+    parser.add_argument("--fps", type=float, default=60.0, help="virtual frame rate")
+    parser.add_argument("--start", type=float, default=0.0, help="virtual time of first frame in seconds")
+    parser.add_argument("--seed", type=int, default=0, help="seed for random generators")
+    parser.add_argument("--output", default=None, help="output path or pattern, nothing is written if not set")
+    parser.add_argument("--var", action="append", default=[], metavar="NAME=VALUE",
+            help="override a system variable, e.g. ref_highres_height=540")
+    parser.add_argument("--context", choices=CONTEXT_APIS, default="window", help="how to create the OpenGL context")
+    parser.add_argument("--pool-render-targets", action="store_true", help="recycle render targets of render nodes during evaluation")
+    parser.add_argument("--demand-driven", action="store_true", help="skip render nodes whose outputs aren't read (unselected inputs of ChooseTexture)")
+    parser.add_argument("--texture-cache-mb", type=int, default=None, help="budget in MB of cached textures, unused ones are deleted above it")
+    parser.add_argument("--profile-nodes", action="store_true", help="print performance stats of nodes at the end")
+    parser.add_argument("--profile-trace", default=None, metavar="PATH", help="write a Chrome trace of the last profiled frames")
+    return parser.parse_known_args()[0]
+
+args = parse_args()
+
+# the OpenGL platform must be chosen before anything imports PyOpenGL
+if args.context != "window":
+    os.environ.setdefault("PYOPENGL_PLATFORM", args.context)
+
+import pyximport; pyximport.install()
+
+import random
+import time
+import numpy as np
+from PIL import Image
+
+import imgui
+from glumpy import app, gl
+from glumpy.ext import glfw
+
+# GLFW hints, see glfw3.h
+GLFW_PLATFORM = 0x00050003
+GLFW_PLATFORM_NULL = 0x00060005
+GLFW_CONTEXT_CREATION_API = 0x0002200B
+GLFW_CONTEXT_APIS = {
+    "egl" : 0x00036002,
+    "osmesa" : 0x00036003,
+}
+
+def create_context(context):
+    if context != "window":
+        # without display the null platform of GLFW 3.4 is needed (must be hinted before initialization)
+        if not os.environ.get("DISPLAY") and not os.environ.get("WAYLAND_DISPLAY") and hasattr(glfw._glfw, "glfwInitHint"):
+            glfw._glfw.glfwInitHint(GLFW_PLATFORM, GLFW_PLATFORM_NULL)
+        glfw.glfwInit()
+        glfw.glfwWindowHint(GLFW_CONTEXT_CREATION_API, GLFW_CONTEXT_APIS[context])
+
+    window = app.Window(title="pyvisual render", visible=False)
+    window.activate()
+    # same initialization as glumpy's app does
+    gl.glPixelStorei(gl.GL_UNPACK_ALIGNMENT, 1)
+    gl.glPixelStorei(gl.GL_PACK_ALIGNMENT, 1)
+    gl.glEnable(gl.GL_VERTEX_PROGRAM_POINT_SIZE)
+    gl.glEnable(gl.GL_BLEND)
+    gl.glBlendFunc(gl.GL_SRC_ALPHA, gl.GL_ONE_MINUS_SRC_ALPHA)
+    return window
+
+# node types require an OpenGL and imgui context
+window = create_context(args.context)
+imgui.create_context()
+
+import pyvisual.node as node_meta
+# import this later than all node types (widget is required by pyvisual.node.io.system_var)
+import pyvisual.editor.widget as node_widget
+from pyvisual import util
+from pyvisual.editor import profiler
+from pyvisual.editor.graph import RootGraph, NodeGraph
+from pyvisual.editor.graph_traits import GraphTraits
+from pyvisual.node.io import system_var
+
+class FrameWriter:
+    def __init__(self, output):
+        self.output = output
+        self._file = None
+        if output == "-":
+            self._file = sys.stdout.buffer
+        elif output is not None and "%" not in output:
+            self._file = open(output, "wb")
+
+    def write(self, index, image):
+        if self.output is None:
+            return
+        if self._file is not None:
+            self._file.write(np.ascontiguousarray(image).tobytes())
+            return
+        path = self.output % index
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        Image.fromarray(image).save(path)
+
+    def close(self):
+        if self._file is not None and self._file is not sys.stdout.buffer:
+            self._file.close()
+
+def set_variables(assignments):
+    for assignment in assignments:
+        name, _, serialized_value = assignment.partition("=")
+        if name not in system_var.VARIABLES:
+            print("### Warning: Unknown system variable %s. Ignoring it." % name, file=sys.stderr)
+            continue
+        value = system_var.values[name]
+        value.value = type(value.value)(serialized_value)
+    system_var.notify_change()
+
+def print_stats(root_graph):
+    stats_by_instance, stats_by_node_type = root_graph.get_stats()
+    print(profiler.format_stats_table(stats_by_node_type, root_graph.profiler.counters), file=sys.stderr)
+
+def render(args):
+    random.seed(args.seed)
+    np.random.seed(args.seed)
+
+    clock = util.time.VirtualClock(fps=args.fps, start_time=args.start)
+    util.time.global_time.set_clock(clock, current_time=args.start)
+    if args.texture_cache_mb is not None:
+        util.texture_loader.texture_loader.cache_bytes = args.texture_cache_mb * 2**20
+
+    root_graph = RootGraph(pool_render_targets=args.pool_render_targets, demand_driven=args.demand_driven)
+    graph_traits = GraphTraits()
+    for path in (args.session, args.background):
+        graph = NodeGraph()
+        graph_traits.add_graph(graph)
+        root_graph.append(graph)
+        if os.path.isfile(path):
+            graph.load_file(path)
+        elif path == args.session:
+            print("### Error: Session file %s not found." % path, file=sys.stderr)
+            return 1
+    set_variables(args.var)
+
+    profile = args.profile_nodes or args.profile_trace is not None
+    writer = FrameWriter(args.output)
+    frame_times = []
+    try:
+        for frame in range(args.frames):
+            if frame != 0:
+                clock.tick()
+            start = time.perf_counter()
+            root_graph.evaluate(record_stats=profile)
+            texture = graph_traits.output_texture
+            if texture is None:
+                print("### Warning: No output texture in frame %d." % frame, file=sys.stderr)
+                continue
+            # reading back the texture waits for the rendering too
+            image = texture.get()
+            frame_times.append(time.perf_counter() - start)
+            writer.write(frame, image)
+        if args.profile_trace is not None:
+            root_graph.export_trace(args.profile_trace)
+        if profile:
+            print_stats(root_graph)
+    finally:
+        writer.close()
+        root_graph.stop()
+
+    if frame_times:
+        frame_times = np.array(frame_times) * 1000.0
+        print("Rendered %d frames: %.2f ms/frame average, %.2f ms median, %.2f ms max" \
+                % (len(frame_times), frame_times.mean(), np.median(frame_times), frame_times.max()), file=sys.stderr)
+    return 0
+
+if __name__ == "__main__":
+    status = render(args)
+    window.close()
+    sys.exit(status)
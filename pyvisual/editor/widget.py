@@ -346,6 +346,8 @@ class Texture(Widget):
 
     def show(self, value, read_only):
         clicked, self.show_texture = imgui.checkbox("Show", self.show_texture)
+        # shown textures must not be recycled by a render target pool
+        util.render_target.set_preview(self, value.value if self.show_texture else None)
         if not self.show_texture:
             return
 
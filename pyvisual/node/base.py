@@ -2,11 +2,12 @@ import clipboard
 import copy
 import imgui
 import json
-import time
 import random
 from collections import OrderedDict
 
-from pyvisual.node.value import SettableValue, ConnectedValue
+from pyvisual.node.value import SettableValue, ConnectedValue, DirtyFlag
+from pyvisual.node.core import NodeCore
+from pyvisual.util.time import clock_time
 
 def find_node_base(bases):
     bases = list(filter(lambda b: issubclass(b, Node), bases))
@@ -184,19 +185,52 @@ class Node(metaclass=NodeMeta):
     # Whether this node does some rendering with OpenGL
     USES_OPENGL = False
 
+    # Whether this node may be evaluated in a worker thread, in parallel to nodes it doesn't depend on.
+    # Such nodes must not use OpenGL and must only work with their own state and values (numpy/scipy work mostly).
+    # Nodes writing to buffers that are uploaded by the OpenGL thread (SSBOs) aren't evaluated in parallel either.
+    # See Graph._evaluate_parallel
+    PARALLEL_EVALUATION = False
+
+    # Whether this node renders its output texture to a render target that can be recycled
+    # once all nodes reading it have been evaluated (see RenderNode and Graph.pool_render_targets)
+    POOLED_RENDER_TARGET = False
+
+    # Whether this node might keep references to its input textures after its evaluation
+    # (Renderer, HoldTexture, DelayTexture...). Render targets of its input nodes are never recycled then.
+    RETAINS_INPUT_TEXTURES = True
+
     # Whether this node contains a subgraph
     HAS_SUBGRAPH = False
 
+    # Whether this node reads only some of its inputs each frame (see demanded_inputs).
+    # OpenGL nodes only feeding inputs that aren't read are skipped with Graph.demand_driven
+    SELECTS_INPUTS = False
+
+    # Whether this node keeps state that must advance each frame (held or delayed textures, frame histories).
+    # It's never skipped with Graph.demand_driven, even if no node reads its outputs this frame
+    ALWAYS_DEMANDED = False
+
     def __init__(self, always_evaluate=False):
         self.always_evaluate = always_evaluate
         self.graph = None
         self.id = -1
         self.dfs_index = -1
+        # whether the node has been evaluated at all, and when last (clock time, which is 0.0 at the start of a virtual clock)
+        self._evaluated = False
         self._last_evaluated = 0.0
         self._force_evaluate = False
+        # set by all values of this node when they change (see Graph.dirty_scheduling)
+        # initially set so the node is evaluated at least once
+        self.dirty_flag = DirtyFlag()
 
         self.initial_manual_values = {}
         self.values = {}
+        # port values resolved by compile_values()
+        self.input_values = None
+        self.output_values = None
+        self._inputs = None
+        self._outputs = None
+        self.core = None
 
         self.input_nodes = set()
         self.base_input_ports = OrderedDict(self.spec.input_ports)
@@ -229,6 +263,13 @@ class Node(metaclass=NodeMeta):
         self.ports.update(self.input_ports)
         self.ports.update(self.output_ports)
 
+        # values are resolved again with the new ports
+        self.input_values = None
+        self.output_values = None
+        self._inputs = None
+        self._outputs = None
+        self.core = None
+
         for port_id in list(self.values.keys()):
             if port_id in self.ports:
                 continue
@@ -296,7 +337,21 @@ class Node(metaclass=NodeMeta):
             if port_id[0] == "i" and value.is_connected():
                 self.input_nodes.add(value.connected_node)
 
+    def compile_values(self):
+        # resolves the values of all ports once (done before the first evaluation and after the ports have changed)
+        # get/set then don't have to build port ids and look them up anymore,
+        # nodes can also access input_values / output_values by index (order of input_ports / output_ports)
+        self.input_values = [ self.get_value(port_id) for port_id in self.input_ports.keys() ]
+        self.output_values = [ self.get_value(port_id) for port_id in self.output_ports.keys() ]
+        self._inputs = { port_id[2:] : value for port_id, value in zip(self.input_ports.keys(), self.input_values) }
+        self._outputs = { port_id[2:] : value for port_id, value in zip(self.output_ports.keys(), self.output_values) }
+        cls = type(self)
+        self.core = NodeCore(self, self.input_values, self.output_values,
+                cls.evaluate is not Node.evaluate, cls._after_evaluate is not Node._after_evaluate)
+
     def have_any_inputs_changed(self):
+        if self.core is not None:
+            return self.core.have_inputs_changed()
         for port_id, value in self.values.items():
             if port_id[0] == "i" and value.has_changed():
                 return True
@@ -310,6 +365,9 @@ class Node(metaclass=NodeMeta):
         return False
 
     def reset_evaluated(self):
+        if self.core is not None:
+            self.core.reset_changed()
+            return
         for value in self.values.values():
             value.reset_changed()
 
@@ -330,11 +388,16 @@ class Node(metaclass=NodeMeta):
             value = ConnectedValue(default_value, keep_value_on_disconnect=dtype.base_type.keep_value_on_disconnect)
         else:
             value = SettableValue(default_value)
+        value.set_dirty_flag(self.dirty_flag)
         return value
 
     def get_input(self, name):
+        if self._inputs is not None and name in self._inputs:
+            return self._inputs[name]
         return self.get_value("".join(["i_", name]))
     def get_output(self, name):
+        if self._outputs is not None and name in self._outputs:
+            return self._outputs[name]
         return self.get_value("".join(["o_", name]))
     def get_value(self, port_id):
         if not port_id in self.values:
@@ -342,17 +405,36 @@ class Node(metaclass=NodeMeta):
         return self.values[port_id]
 
     def get(self, name):
+        inputs = self._inputs
+        if inputs is not None and name in inputs:
+            return inputs[name].value
         return self.get_input(name).value
     def set(self, name, value):
-        output = self.get_output(name)
+        outputs = self._outputs
+        if outputs is not None and name in outputs:
+            output = outputs[name]
+        else:
+            output = self.get_output(name)
         # cache numeric values
         if isinstance(value, (float, int, bool)):
             if abs(output.value - value) > 10e-6:
                 output.value = value
         else:
             output.value = value
+    def demanded_inputs(self):
+        # ids of the input ports the next evaluation reads, None for all of them (see SELECTS_INPUTS)
+        return None
+
     def force_evaluate(self):
         self._force_evaluate = True
+        self.dirty_flag.dirty = True
+
+    @property
+    def always_visit(self):
+        # whether a graph with dirty scheduling must visit this node every frame, even when it's not dirty
+        # nodes overriding evaluate() might check some external state there (shader files for example),
+        # early executed nodes might see changes of their inputs only after they were visited
+        return self.always_evaluate or self.FORCE_EARLY_EXECUTION or type(self).evaluate is not Node.evaluate
 
     @property
     def node_title(self):
@@ -373,10 +455,13 @@ class Node(metaclass=NodeMeta):
         # update a node
         # return True if node needed update
 
-        if self.always_evaluate or self._force_evaluate or self.have_any_inputs_changed() or self._last_evaluated == 0.0:
+        if self.input_values is None:
+            self.compile_values()
+        if self.always_evaluate or self._force_evaluate or self.have_any_inputs_changed() or not self._evaluated:
             self._force_evaluate = False
             self._evaluate()
-            self._last_evaluated = time.time()
+            self._evaluated = True
+            self._last_evaluated = clock_time()
             return True
         return False
 
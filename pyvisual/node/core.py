@@ -0,0 +1,53 @@
+# Hot loops of node evaluation: change detection of node values, evaluating and resetting sorted instances.
+# Compiled in value.pyx, the pure Python versions below are used when the compiled module doesn't provide them.
+
+try:
+    from pyvisual.node.value import NodeCore, evaluate_instances, reset_instances
+except ImportError:
+    class NodeCore:
+        def __init__(self, node, inputs, outputs, custom_evaluate, custom_after_evaluate):
+            self._node = node
+            self._inputs = inputs
+            self._outputs = outputs
+            self.custom_evaluate = custom_evaluate
+            self.custom_after_evaluate = custom_after_evaluate
+
+        def have_inputs_changed(self):
+            for value in self._inputs:
+                if value.has_changed():
+                    return True
+            return False
+
+        def reset_changed(self):
+            for value in self._inputs:
+                value.reset_changed()
+            for value in self._outputs:
+                value.reset_changed()
+
+        def needs_evaluate(self):
+            if self.custom_evaluate:
+                return True
+            node = self._node
+            return node.always_evaluate or node._force_evaluate or self.have_inputs_changed() or not node._evaluated
+
+    def evaluate_instances(instances):
+        active_instances = set()
+        for instance in instances:
+            core = instance.core
+            if core is not None and not core.needs_evaluate():
+                continue
+            if instance.evaluate():
+                active_instances.add(instance)
+        return active_instances
+
+    def reset_instances(instances):
+        for instance in instances:
+            core = instance.core
+            if core is None or core.custom_after_evaluate:
+                instance._after_evaluate()
+        for instance in instances:
+            core = instance.core
+            if core is None:
+                instance.reset_evaluated()
+            else:
+                core.reset_changed()
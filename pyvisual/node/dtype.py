@@ -42,6 +42,7 @@ base_vec2 = BaseType("vec2", *numpy_serializer(), True)
 base_vec4 = BaseType("vec4", *numpy_serializer(), True)
 base_mat4 = BaseType("mat4", *numpy_serializer(), False)
 base_tex2d = BaseType("tex2d", *dummy_serializer(), False)
+base_tex3d = BaseType("tex3d", *dummy_serializer(), False)
 base_ssbo = BaseType("ssbo", *dummy_serializer(), False)
 base_audio = BaseType("audio", *dummy_serializer(), False)
 base_midi = BaseType("midi", *dummy_serializer(), False)
@@ -59,12 +60,14 @@ vec2 = Type("vec2", base_vec2, lambda: np.array([0.0, 0.0], dtype=np.float32))
 color = Type("color", base_vec4, lambda: np.array([0.0, 0.0, 0.0, 1.0], dtype=np.float32))
 mat4 = Type("mat4", base_mat4, lambda: np.eye(4, dtype=np.float32))
 tex2d = Type("tex2d", base_tex2d, lambda: None)
+# frame history (see TextureHistory), a 3d texture with one frame per layer
+tex3d = Type("tex3d", base_tex3d, lambda: None)
 ssbo = Type("ssbo", base_ssbo, lambda: None)
 audio = Type("audio", base_audio, lambda: None)
 midi = Type("midi", base_midi, lambda: [])
 fft = Type("fft", base_fft, lambda: None)
 
 dtypes = {}
-for dtype in (bool, event, int, float, str, assetpath, vec2, color, mat4, tex2d, ssbo, audio, midi, fft):
+for dtype in (bool, event, int, float, str, assetpath, vec2, color, mat4, tex2d, tex3d, ssbo, audio, midi, fft):
     dtypes[dtype.name] = dtype
 
@@ -1,5 +1,6 @@
 import imgui
 import math
+import numpy as np
 from pyvisual.node.base import Node
 from pyvisual.node import dtype
 from pyvisual.audio import pulse, util
@@ -8,16 +9,62 @@ DEFAULT_SAMPLE_RATE = 5000
 DEFAULT_BLOCK_SIZE = 64
 
 class AudioData:
-    def __init__(self, sample_rate, block_size):
-        self.blocks = []
+    # Samples of the blocks of a frame in one contiguous float32 array of shape (blocks, block_size) for mono
+    # and (blocks, block_size, channels) otherwise. The array is preallocated and reused each frame, so nodes
+    # can process all samples of a frame with one vectorized operation (on frames) and must copy samples
+    # they keep for later frames.
+    def __init__(self, sample_rate, block_size, channels=1):
         self.sample_rate = sample_rate
         self.block_size = block_size
+        self.channels = channels
+        self._buffer = np.zeros((0, block_size) + self._channel_shape, dtype=np.float32)
+        self._count = 0
+        # changes whenever the samples are written (resize is called before that)
+        self.version = 0
+
+    @property
+    def _channel_shape(self):
+        return () if self.channels == 1 else (self.channels,)
+
+    def __len__(self):
+        return self._count
+
+    @property
+    def blocks(self):
+        # view of the blocks, a block is a view of its samples
+        return self._buffer[:self._count]
+
+    @blocks.setter
+    def blocks(self, blocks):
+        # (copies blocks)
+        self.resize(len(blocks))[:] = blocks
+
+    @property
+    def frames(self):
+        # view of all samples of the frame in order, of shape (samples,) or (samples, channels)
+        return self.blocks.reshape((-1,) + self._channel_shape)
+
+    def mono(self):
+        # samples of the frame with channels mixed down
+        frames = self.frames
+        return frames if self.channels == 1 else frames.mean(axis=1)
+
+    def resize(self, count):
+        # sets the number of blocks of the frame, returns the blocks to be written
+        # (samples of the previous frame are kept up to the given count)
+        if count > len(self._buffer):
+            buffer = np.zeros((max(count, 2 * len(self._buffer)), self.block_size) + self._channel_shape, dtype=np.float32)
+            buffer[:self._count] = self.blocks
+            self._buffer = buffer
+        self._count = count
+        self.version += 1
+        return self.blocks
 
     def append(self, block):
-        self.blocks.append(block)
+        self.resize(self._count + 1)[-1] = block
 
     def clear(self):
-        self.blocks = []
+        self._count = 0
 
 class FFTData:
     def __init__(self, magnitudes, frequencies, bin_resolution):
@@ -52,15 +99,11 @@ class InputPulseAudio(Node):
         self.create(sr, bs)
 
     def create(self, sample_rate, block_size):
-        self.pulse = pulse.PulseAudioContext(self._process_block, sample_rate=sample_rate, block_size=block_size)
+        # the pulseaudio thread writes samples to its ring buffer, complete blocks are read each frame
+        self.pulse = pulse.PulseAudioContext(sample_rate=sample_rate, block_size=block_size)
         self.output = AudioData(sample_rate=sample_rate, block_size=block_size)
-        self.next_blocks = []
         self.blocks = 0
 
-    def _process_block(self, block):
-        self.next_blocks.append(block)
-        self.blocks += 1
-
     def start(self, graph):
         self.pulse.start()
 
@@ -73,8 +116,11 @@ class InputPulseAudio(Node):
             self.create(sr, bs)
             self.start(None)
 
-        self.output.blocks = self.next_blocks
-        self.next_blocks = []
+        # blocks are copied once from the ring buffer into the frame buffer of the output
+        ring = self.pulse.ring
+        count = ring.available_blocks
+        ring.read_blocks(count, out=self.output.resize(count))
+        self.blocks += count
         self.set("output", self.output)
 
     def stop(self):
@@ -84,6 +130,8 @@ class InputPulseAudio(Node):
     def _show_custom_ui(self):
         imgui.dummy(0, 10)
         imgui.text("Sourced %d blocks" % self.blocks)
+        ring = self.pulse.ring
+        imgui.text("Overruns: %d (%d samples), underruns: %d" % (ring.overruns, ring.dropped_samples, ring.underruns))
 
         sinks = self.pulse.sinks
         current_sink_index = self.pulse.current_sink_index
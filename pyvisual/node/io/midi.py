@@ -142,7 +142,7 @@ class MidiValue(Node):
             return absolute_value(message.value / 127.0)
 
     def _evaluate(self):
-        if self._last_evaluated == 0.0:
+        if not self._evaluated:
             self._update_visible_ports()
 
         midi = self.get("midi")
@@ -4,15 +4,22 @@ import random
 from pyvisual.node.base import Node
 from pyvisual.node import dtype
 from pyvisual import assets
+from pyvisual.util import texture_loader
 import imgui
 from glumpy import gloo, gl, glm
-from PIL import Image
+
+# inputs of the variant of cached textures: height the images are downscaled to (0 for the original size,
+# a system variable like ref_highres_height or ref_lowres_height to match the render resolution), with mipmaps
+TEXTURE_VARIANT_INPUTS = [
+    {"name" : "max_height", "dtype" : dtype.int, "dtype_args" : {"default" : 0, "range" : [0, float("inf")]}, "group" : "additional"},
+    {"name" : "mipmaps", "dtype" : dtype.bool, "dtype_args" : {"default" : 0.0}, "group" : "additional"},
+]
 
 class LoadTexture(Node):
     class Meta:
         inputs = [
             {"name" : "path", "dtype" : dtype.assetpath, "dtype_args" : {"prefix" : "image"}},
-        ]
+        ] + TEXTURE_VARIANT_INPUTS
         outputs = [
             {"name" : "output", "dtype" : dtype.tex2d},
         ]
@@ -21,28 +28,65 @@ class LoadTexture(Node):
         super().__init__()
 
         self.status = None
+        # texture from the texture cache that is shown
+        self._request = None
+        # texture being loaded in the background, the previous one is shown until it's done
+        self._next_request = None
+
+    def _release(self, request):
+        if request is not None:
+            texture_loader.texture_loader.release(request)
+
+    def _load(self, reload=False):
+        # reload: the file is read again, not taken from the texture cache
+        self._release(self._next_request)
+        self._next_request = None
 
-    def _evaluate(self):
         path = self.get("path")
-        print("load texture", path)
         if not path:
+            self._release(self._request)
+            self._request = None
             self.set("output", None)
             self.status = None
             return
+        print("load texture", path)
+        self._next_request = texture_loader.texture_loader.load(os.path.join(assets.ASSET_PATH, path),
+            max_height=self.get("max_height"), mipmaps=self.get("mipmaps"), reload=reload)
 
-        texture = None
-        try:
-            data = np.array(Image.open(os.path.join(assets.ASSET_PATH, path)))
-            texture = data.view(gloo.Texture2D)
-            self.status = None
-        except Exception as e:
+    def evaluate(self):
+        if self._next_request is not None and self._next_request.done:
+            self.force_evaluate()
+        elif self._next_request is None and self._request is not None \
+                and texture_loader.texture_loader.has_changed(self._request):
+            # (the file has changed, the texture is loaded again)
+            self.force_evaluate()
+        return super().evaluate()
+
+    def _evaluate(self):
+        if self.have_inputs_changed("path", "max_height", "mipmaps") or not self._evaluated:
+            self._load()
+        elif self._next_request is None and self._request is not None \
+                and texture_loader.texture_loader.has_changed(self._request):
+            self._load()
+
+        request = self._next_request
+        if request is None or not request.done:
+            return
+        self._next_request = None
+        self._release(self._request)
+        self._request = request
+        if request.error is not None:
             self.set("output", None)
-            self.status = str(e)
+            self.status = request.error
             return
+        self.status = None
+        self.set("output", request.texture)
 
-        texture.activate()
-        texture.deactivate()
-        self.set("output", texture)
+    def stop(self):
+        self._release(self._request)
+        self._release(self._next_request)
+        self._request = None
+        self._next_request = None
 
     def _show_custom_ui(self):
         if self.status:
@@ -53,7 +97,7 @@ class LoadTexture(Node):
 
     def _show_custom_context(self):
         if imgui.button("Reload texture"):
-            self.force_evaluate()
+            self._load(reload=True)
 
 class LoadTextures(Node):
     class Meta:
@@ -61,7 +105,7 @@ class LoadTextures(Node):
             {"name" : "wildcard", "dtype" : dtype.assetpath, "dtype_args" : {"prefix" : "image"}},
             {"name" : "next", "dtype" : dtype.event},
             {"name" : "shuffle", "dtype" : dtype.bool, "dtype_args" : {"default" : 1.0}},
-        ]
+        ] + TEXTURE_VARIANT_INPUTS
         outputs = [
             {"name" : "texture", "dtype" : dtype.tex2d},
             {"name" : "last_texture", "dtype" : dtype.tex2d},
@@ -74,66 +118,135 @@ class LoadTextures(Node):
             "index" : lambda node: random.randint(0, 10000)
         }
 
+    # textures after the current one that are loaded ahead
+    PREFETCH = 2
+
     def __init__(self):
         super().__init__()
 
-        # available textures as tuples (path, glumpy-texture)
-        # glumpy-textures are None until loaded for the first time
-        self.textures = []
+        # paths of the available textures
+        self.paths = []
         # index is set by state
         #self.index = 0
-
-        self.last_texture = None
-
-    def _load_texture(self, path):
-        texture = np.array(Image.open(os.path.join(assets.ASSET_PATH, path))).view(gloo.Texture2D)
-        texture.activate()
-        texture.deactivate()
-        return texture
+        # textures from the texture cache that are loaded (or being loaded) by path:
+        # the current one, the shown ones and the upcoming ones, the others are released
+        # (they stay in the cache while it has space)
+        self._requests = {}
+        # indices of the next textures (drawn ahead when shuffled, so they can be prefetched)
+        self._upcoming = []
+        # paths of textures that couldn't be loaded
+        self._failed = set()
+
+        # paths of the shown texture and the one shown before it, the shown one stays until the current one is loaded
+        self._shown = None
+        self._last_shown = None
+
+    def _load_texture(self, path, prefetch=False):
+        request = self._requests.get(path)
+        if path in self._failed or (request is not None and (prefetch or not request.prefetch)):
+            return
+        if not prefetch:
+            print("Loading %s" % path)
+        # (loaded again when a prefetched texture is needed now, that uploads it first)
+        self._requests[path] = texture_loader.texture_loader.load(os.path.join(assets.ASSET_PATH, path),
+            prefetch=prefetch, max_height=self.get("max_height"), mipmaps=self.get("mipmaps"))
+        if request is not None:
+            texture_loader.texture_loader.release(request)
+
+    def _release_requests(self, keep=()):
+        for path, request in list(self._requests.items()):
+            if not path in keep:
+                texture_loader.texture_loader.release(request)
+                del self._requests[path]
+
+    def _texture(self, path):
+        request = self._requests.get(path)
+        if request is None or request.error is not None:
+            return None
+        return request.texture
+
+    def _draw_index(self, index):
+        if self.get("shuffle") and len(self.paths) > 1:
+            return (index + random.randint(1, len(self.paths) - 1)) % len(self.paths)
+        return (index + 1) % len(self.paths)
+
+    def _next_index(self):
+        if self._upcoming:
+            return self._upcoming.pop(0) % len(self.paths)
+        return self._draw_index(self.index)
 
     # TODO refactor whole mechanism of choosing texture together with state!
     def _set_index(self, index):
-        self.index = index % len(self.textures)
-
-        tt = self.textures[self.index]
-        if tt[1] is None:
-            print("Loading %s" % tt[0])
-            tt[1] = self._load_texture(tt[0])
-        self.set("texture", tt[1])
-        self.set("last_texture", self.last_texture)
+        self.index = index % len(self.paths)
+
+        path = self.paths[self.index]
+        self._load_texture(path)
+        request = self._requests.get(path)
+        if request is not None and request.done:
+            if request.error is not None:
+                self._failed.add(path)
+            elif self._shown != path:
+                self._last_shown = self._shown
+                self._shown = path
+        self.set("texture", self._texture(self._shown))
+        self.set("last_texture", self._texture(self._last_shown))
+
+        while len(self._upcoming) < min(self.PREFETCH, len(self.paths) - 1):
+            self._upcoming.append(self._draw_index(self._upcoming[-1] if self._upcoming else self.index))
+        upcoming = [ self.paths[index] for index in self._upcoming ]
+        for upcoming_path in upcoming:
+            self._load_texture(upcoming_path, prefetch=True)
+        self._release_requests(keep={path, self._shown, self._last_shown, *upcoming})
+
+    def evaluate(self):
+        # shows the current texture once it's loaded
+        if self.paths:
+            path = self.paths[self.index % len(self.paths)]
+            request = self._requests.get(path)
+            if request is not None and request.done and self._shown != path and not path in self._failed:
+                self.force_evaluate()
+        return super().evaluate()
 
     def _evaluate(self):
+        if self.have_inputs_changed("max_height", "mipmaps"):
+            # (other variants of the textures)
+            self._release_requests()
+            self._shown = None
+            self._last_shown = None
         if self.have_inputs_changed("wildcard"):
-            self.textures = []
+            self._upcoming = []
+            self._failed = set()
             wildcard = self.get("wildcard")
-            if wildcard:
-                for i, path in enumerate(sorted(assets.glob_paths(wildcard))):
-                    self.textures.append([path, None])
-
-        if len(self.textures) == 0:
+            self.paths = sorted(assets.glob_paths(wildcard)) if wildcard else []
+        if self.have_inputs_changed("shuffle"):
+            self._upcoming = []
+
+        if len(self.paths) == 0:
+            self._release_requests()
+            self._shown = None
+            self._last_shown = None
             self.set("texture", None)
             self.set("last_texture", None)
             return
 
         self.set("next", self.get("next"))
         if self.get("next"):
-            shuffle = self.get("shuffle")
-            self.last_texture = self.textures[self.index][1]
-            if shuffle and len(self.textures) > 1:
-                index = (self.index + random.randint(1, len(self.textures) - 1)) % len(self.textures)
-            else:
-                index = (self.index + 1) % len(self.textures)
-
-            self.index = index
+            self.index = self._next_index()
 
         self._set_index(self.index)
 
+    def stop(self):
+        self._release_requests()
+        self._shown = None
+        self._last_shown = None
+
     def get_state(self):
         return {"index" : self.index}
 
     def set_state(self, state):
         if "index" in state:
             self.index = state["index"]
+            self._upcoming = []
 
 class DummyTexture(Node):
     class Meta:
@@ -203,6 +316,8 @@ class ChooseTexture(Node):
             "index" : lambda node: random.randint(0, 10000)
         }
 
+    SELECTS_INPUTS = True
+
     def __init__(self):
         self._count = None
 
@@ -239,7 +354,7 @@ class ChooseTexture(Node):
             self._set_next(0)
 
     def _evaluate(self):
-        if self.have_inputs_changed("count") or self._last_evaluated == 0.0:
+        if self.have_inputs_changed("count") or not self._evaluated:
             self._update_custom_ports()
 
         if self._next_index != -1:
@@ -267,6 +382,13 @@ class ChooseTexture(Node):
             out_texture = self.get_output("out")
             in_texture.copy_to(out_texture)
 
+    def demanded_inputs(self):
+        # the current texture, and the next one (it's enabled a frame before it's chosen)
+        if not self._count:
+            return None
+        selected = [ index % self._count for index in (self._current_index, self._next_index) if index != -1 ]
+        return set(self.input_ports.keys()).difference("i_in%d" % i for i in range(self._count) if i not in selected)
+
     def get_state(self):
         return {"index" : self._current_index}
 
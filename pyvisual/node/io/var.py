@@ -72,7 +72,7 @@ class SetVar(Node):
             self.duplicate = False
 
         value = self.get_input("input")
-        if value.has_changed() or self._last_evaluated == 0.0:
+        if value.has_changed() or not self._evaluated:
             self.value = value.value
             self.value_has_changed = True
             # evaluate once more to trigger reset
@@ -142,8 +142,7 @@ class GetVar(Node):
 
         if self.connected_node is not None:
             self.input_nodes.add(self.connected_node)
-        # TODO this is quite a hack
-        self.graph.parent.reset_sorted_instances()
+        self.graph.changed_input_nodes(self)
 
     def evaluate(self, *args, **kwargs):
         if self.connected_node is not None:
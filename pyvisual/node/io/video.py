@@ -1,8 +1,7 @@
 import ctypes
 import os
+import queue
 import random
-import random
-import subprocess
 import threading
 import time
 
@@ -19,18 +18,238 @@ from pyvisual.node.base import Node
 USE_PBO_TRANSFER = True
 PBO_COUNT = 4
 
+# decoded frames queued ahead of the color conversion / converted frames queued ahead of playback
+PREFETCH_FRAMES = 8
+READY_FRAMES = 3
+# playing backwards, segments of that many frames are decoded forward and played back in reverse
+# (fewer if their frames would take more than REVERSE_CACHE_BYTES)
+REVERSE_SEGMENT_FRAMES = 30
+REVERSE_CACHE_BYTES = 256 * 2**20
+# seconds decoding / converting threads wait for queues before checking whether they should stop
+QUEUE_TIMEOUT = 0.05
+
+# queued instead of a frame when a video is over (playing without looping)
+END_OF_VIDEO = None
+
+class VideoDecoder(threading.Thread):
+    # Decodes the frames of a video ahead of playback into a bounded queue of tuples (generation, frame index, BGR frame).
+    # Seeking or changing the direction starts a new generation, frames of older generations are discarded by the
+    # stages after this one. Playing backwards seeks once per segment (see REVERSE_SEGMENT_FRAMES), decodes the
+    # segment forward and queues its frames in reverse order, instead of seeking back before each frame (which
+    # decodes from the last keyframe each time). Segments are aligned to multiples of their length, as
+    # cv2.VideoCapture doesn't tell where keyframes are.
+    def __init__(self, video, frame_count, frame_bytes, output):
+        super().__init__(name="VideoDecoder", daemon=True)
+
+        self._video = video
+        self.frame_count = frame_count
+        self.segment_frames = max(1, min(REVERSE_SEGMENT_FRAMES, REVERSE_CACHE_BYTES // max(1, frame_bytes)))
+        self.output = output
+
+        self._lock = threading.Lock()
+        self.generation = 0
+        self._index = 0
+        self._direction = 1
+        self.loop = True
+        # index of the frame the next read returns
+        self._position = 0
+        self._running = True
+
+        # frames decoded, seeks done
+        self.decoded = 0
+        self.seeks = 0
+
+    def restart(self, index, direction):
+        # continues decoding at frame index in a direction (1 or -1), returns the new generation
+        with self._lock:
+            self.generation += 1
+            self._index = max(0, min(self.frame_count - 1, index)) if self.frame_count > 0 else 0
+            self._direction = direction
+            return self.generation
+
+    def _put(self, generation, index, frame):
+        # returns False if the frame is outdated (restarted or stopped) before there was space in the queue
+        while self._running and generation == self.generation:
+            try:
+                self.output.put((generation, index, frame), timeout=QUEUE_TIMEOUT)
+                return True
+            except queue.Full:
+                pass
+        return False
+
+    def _read(self, index):
+        if index != self._position:
+            self._video.set(cv2.CAP_PROP_POS_FRAMES, index)
+            self.seeks += 1
+        grabbed, frame = self._video.read()
+        self._position = index + 1 if grabbed else -1
+        if grabbed:
+            self.decoded += 1
+        return frame if grabbed else None
+
+    def _advance(self, generation, index):
+        # sets the next frame to decode, unless restarted in the meantime
+        with self._lock:
+            if generation == self.generation:
+                self._index = index
+
+    def _end(self, generation, restart_index):
+        # end of the video in the current direction, returns whether to go on (looping)
+        if self.loop and self.frame_count > 0:
+            self._advance(generation, restart_index)
+            return True
+        self._put(generation, END_OF_VIDEO, None)
+        self._advance(generation, None)
+        return False
+
+    def run(self):
+        while self._running:
+            with self._lock:
+                generation, index, direction = self.generation, self._index, self._direction
+            if index is None:
+                # (over, waiting for a restart)
+                time.sleep(QUEUE_TIMEOUT)
+                continue
+
+            if direction > 0:
+                frame = self._read(index) if self.frame_count <= 0 or index < self.frame_count else None
+                if frame is None:
+                    self._end(generation, 0)
+                    continue
+                if self._put(generation, index, frame):
+                    self._advance(generation, index + 1)
+                continue
+
+            # (the segment of index, frames after index aren't needed)
+            start = (index // self.segment_frames) * self.segment_frames
+            frames = []
+            for i in range(start, index + 1):
+                frame = self._read(i)
+                if frame is None or generation != self.generation or not self._running:
+                    break
+                frames.append(frame)
+            if generation != self.generation:
+                continue
+            for i in range(len(frames) - 1, -1, -1):
+                if not self._put(generation, start + i, frames[i]):
+                    break
+            else:
+                if start == 0:
+                    self._end(generation, self.frame_count - 1)
+                else:
+                    self._advance(generation, start - 1)
+
+    def stop(self):
+        self._running = False
+
+class FrameConverter(threading.Thread):
+    # Converts decoded BGR frames to RGBA into free buffers of a pool and queues them for playback,
+    # frames of outdated generations are dropped.
+    def __init__(self, decoder, input, output, buffers):
+        super().__init__(name="FrameConverter", daemon=True)
+
+        self._decoder = decoder
+        self.input = input
+        self.output = output
+        self.buffers = buffers
+        self._running = True
+
+    def run(self):
+        while self._running:
+            try:
+                generation, index, frame = self.input.get(timeout=QUEUE_TIMEOUT)
+            except queue.Empty:
+                continue
+            if generation != self._decoder.generation:
+                continue
+            buffer = None
+            if index is not END_OF_VIDEO:
+                while self._running and generation == self._decoder.generation:
+                    try:
+                        buffer = self.buffers.get(timeout=QUEUE_TIMEOUT)
+                        break
+                    except queue.Empty:
+                        pass
+                if buffer is None:
+                    continue
+                cv2.cvtColor(frame, cv2.COLOR_BGR2RGBA, dst=buffer)
+            while self._running:
+                try:
+                    self.output.put((generation, index, buffer), timeout=QUEUE_TIMEOUT)
+                    break
+                except queue.Full:
+                    if generation != self._decoder.generation:
+                        if buffer is not None:
+                            self.buffers.put(buffer)
+                        break
+
+    def stop(self):
+        self._running = False
+
+class DecodePipeline:
+    # Decoder and color conversion thread of an opened video, with its queues and RGBA frame buffers.
+    def __init__(self, video, frame_count, shape):
+        h, w, _ = shape
+        self.decoded = queue.Queue(maxsize=PREFETCH_FRAMES)
+        self.ready = queue.Queue(maxsize=READY_FRAMES)
+        # (frames queued, being converted and shown)
+        self.buffers = queue.Queue()
+        for i in range(READY_FRAMES + 2):
+            self.buffers.put(np.zeros(shape, dtype=np.uint8))
+        self.decoder = VideoDecoder(video, frame_count, h * w * 3, self.decoded)
+        self.converter = FrameConverter(self.decoder, self.decoded, self.ready, self.buffers)
+        self.decoder.start()
+        self.converter.start()
+
+    def restart(self, index, direction):
+        generation = self.decoder.restart(index, direction)
+        # (outdated frames in the queue of converted frames free their buffers)
+        while True:
+            try:
+                item_generation, index, buffer = self.ready.get_nowait()
+            except queue.Empty:
+                break
+            if buffer is not None:
+                self.buffers.put(buffer)
+        return generation
+
+    def next_frame(self):
+        # returns the next converted frame of the current generation as tuple (index, buffer), (END_OF_VIDEO, None)
+        # or None if there is none yet (the buffer must be given back to self.buffers after showing it)
+        while True:
+            try:
+                generation, index, buffer = self.ready.get_nowait()
+            except queue.Empty:
+                return None
+            if generation == self.decoder.generation:
+                return index, buffer
+            if buffer is not None:
+                self.buffers.put(buffer)
+
+    def stop(self):
+        self.decoder.stop()
+        self.converter.stop()
+        self.decoder.join()
+        self.converter.join()
+
 class VideoThread(threading.Thread):
+    # Plays a video: shows the frames decoded and converted ahead of time (see DecodePipeline) when they are due.
+    # The shown frame is swapped under frame_lock, readers of frame must hold it.
     def __init__(self, video_path=""):
         super().__init__()
 
         self._video_path = video_path
         self._video_path_changed = True
         self._video = None
+        self._pipeline = None
         self._fps = 30.0
         self._duration = 0.0
+        self._frame_count = 0
         self._is_stream = False
 
         self._clock = app.clock.Clock()
+        # time of global clock when the last frame was due (if that clock isn't real time, see _tick)
+        self._clock_frame_time = None
 
         self._running = True
         self._play = False
@@ -38,13 +257,15 @@ class VideoThread(threading.Thread):
         self._speed = None
         self._seek_time = None
 
-        # read one frame even though video is paused
+        # show one frame even though video is paused
         self._force_read = True
-        # it can happen that video doesn't finish, but reading last frame returns an error
-        # remember that to signalize that video is over
-        self._frame_grabbed = True
+        # video is over (playing without looping)
+        self._over = False
+        # index of the shown frame
+        self._index = 0
 
         # initially set by _update_video
+        self.frame_lock = threading.Lock()
         self.frame = None
         self.frame_changed = False
 
@@ -76,6 +297,13 @@ class VideoThread(threading.Thread):
     @loop.setter
     def loop(self, loop):
         self._loop = loop
+        pipeline = self._pipeline
+        if pipeline is not None:
+            pipeline.decoder.loop = loop and not self._is_stream
+
+    @property
+    def direction(self):
+        return -1 if self._speed is not None and self._speed < 0.0 else 1
 
     @property
     def speed(self):
@@ -87,13 +315,17 @@ class VideoThread(threading.Thread):
             self._force_read = True
             clock_fps = 30.0
 
+        direction = self.direction
         self._speed = speed
         self._clock.set_fps_limit(clock_fps)
+        if self.direction != direction:
+            # frames decoded ahead are in the other direction
+            self._seek_time = self.time
 
     @property
     def time(self):
         if self._video is not None:
-            return self._video.get(cv2.CAP_PROP_POS_MSEC) / 1000.0
+            return self._index / self._fps
         return 0.0
 
     @time.setter
@@ -102,99 +334,140 @@ class VideoThread(threading.Thread):
 
     @property
     def is_over(self):
-        if not self._frame_grabbed:
+        if self._over:
             return True
-        if self._speed < 0.0:
-            return self.time == 0.0
-        return self.time >= self.duration
+        if self._is_stream:
+            return False
+        if self.direction < 0:
+            return self._index == 0
+        return self._index >= self._frame_count - 1
 
     @property
     def duration(self):
         return self._duration
 
+    def _stop_pipeline(self):
+        if self._pipeline is not None:
+            self._pipeline.stop()
+            self._pipeline = None
+
     def _update_video(self):
+        self._stop_pipeline()
         self._video = None
         self._video_path_changed = False
         self._is_stream = False
+        self._over = False
+        self._index = 0
 
         self._fps = 30.0
         self._duration = 1.0
+        self._frame_count = 0
 
         path = self._video_path
         is_local_path = not path.startswith("http://")
         if is_local_path:
             path = os.path.join(assets.ASSET_PATH, self._video_path or "")
         if not self._video_path or (is_local_path and not os.path.exists(path)):
-            self.frame = np.zeros((1, 1, 4), dtype=np.uint8)
-            self.frame_changed = True
-            if not USE_PBO_TRANSFER:
-                self.frame = self.frame.view(gloo.Texture2D)
+            self._set_frame(np.zeros((1, 1, 4), dtype=np.uint8))
             return
 
-        self._video = cv2.VideoCapture(path)
+        video = cv2.VideoCapture(path)
         self._force_read = True
 
-        width = int(self._video.get(cv2.CAP_PROP_FRAME_WIDTH))
-        height = int(self._video.get(cv2.CAP_PROP_FRAME_HEIGHT))
-        frame_count  = int(self._video.get(cv2.CAP_PROP_FRAME_COUNT))
-        fps = self._video.get(cv2.CAP_PROP_FPS)
+        width = int(video.get(cv2.CAP_PROP_FRAME_WIDTH))
+        height = int(video.get(cv2.CAP_PROP_FRAME_HEIGHT))
+        frame_count  = int(video.get(cv2.CAP_PROP_FRAME_COUNT))
+        fps = video.get(cv2.CAP_PROP_FPS)
 
         self._fps = fps
+        self._frame_count = frame_count if is_local_path else 0
         self._duration = max(0.0, (frame_count - 1) / fps)
         self._is_stream = not is_local_path
-        self.frame = np.zeros((height, width, 4), dtype=np.uint8)
-        self.frame_changed = True
-        if not USE_PBO_TRANSFER:
-            self.frame = self.frame.view(gloo.Texture2D)
+        self._set_frame(np.zeros((height, width, 4), dtype=np.uint8))
+        self._pipeline = DecodePipeline(video, self._frame_count, (height, width, 4))
+        self._pipeline.decoder.loop = self._loop and not self._is_stream
+        self._pipeline.restart(0 if self.direction > 0 else self._frame_count - 1, self.direction)
+        self._video = video
+
+    def _set_frame(self, frame):
+        # shows a frame, returns the buffer of the frame shown before (None if there is none to reuse)
+        with self.frame_lock:
+            previous = self.frame
+            if not USE_PBO_TRANSFER:
+                # (uploaded from one texture)
+                if previous is None or previous.shape != frame.shape:
+                    self.frame = frame.copy().view(gloo.Texture2D)
+                else:
+                    self.frame[...] = frame
+                previous = frame
+            else:
+                self.frame = frame
+            self.frame_changed = True
+        return previous
+
+    def _tick(self):
+        # returns whether the next frame is due
+        # with a virtual / external clock (see util.time) frames follow the time of that clock instead of real time
+        clock = util.time.global_time.clock
+        if clock.realtime:
+            self._clock.tick()
+            return True
+
+        frame_duration = 1.0 / 30.0
+        if abs(self._speed) >= 0.0001:
+            frame_duration = 1.0 / abs(self._fps * self._speed)
+        t = clock.time()
+        # (re)start following the clock, don't catch up with big jumps
+        if self._clock_frame_time is None or t < self._clock_frame_time or t - self._clock_frame_time > 1.0:
+            self._clock_frame_time = t
+        if t - self._clock_frame_time < frame_duration:
+            time.sleep(0.001)
+            return False
+        self._clock_frame_time += frame_duration
+        return True
 
     def run(self):
         self._update_video()
 
         while self._running:
-            dt = self._clock.tick()
+            if not self._tick():
+                continue
 
             if self._video_path_changed:
                 self._update_video()
-            if self._video is None:
+            pipeline = self._pipeline
+            if pipeline is None:
                 continue
 
-            # seek time before looping to handle reverse playing and saved time correctly
             if self._seek_time is not None:
                 seek_time = max(0, min(self._seek_time, self._duration))
-                self._video.set(cv2.CAP_PROP_POS_MSEC, seek_time * 1000.0)
                 self._seek_time = None
-                self._force_read = True
-            if not self._is_stream and self.is_over and self.loop:
-                if self._speed > 0.0:
-                    self.time = 0.0
-                else:
-                    self.time = self.duration
+                if not self._is_stream:
+                    pipeline.restart(int(round(seek_time * self._fps)), self.direction)
+                    self._over = False
+                    self._force_read = True
             # respect global time for playback, pause video too (but we don't care about time offset)
             if (not self._play or abs(self._speed) < 0.001 or util.time.global_time.paused) and not self._force_read:
                 continue
-            self._force_read = False
-
-            grabbed, frame = self._video.read()
 
-            # if we're playing reverse: go two frames back
-            # two frames because we just read one and want to go another frame back
-            if self._speed < 0.0:
-                index = int(self._video.get(cv2.CAP_PROP_POS_FRAMES))
-                self._video.set(cv2.CAP_PROP_POS_FRAMES, index - 2)
-
-            # remember if there was a problem grabbing the frame
-            # seems to happen sometimes with last frame(s) of a video
-            if not grabbed:
-                self._frame_grabbed = False
+            frame = pipeline.next_frame()
+            if frame is None:
+                # (not decoded yet)
                 continue
-            self._frame_grabbed = True
-
-            frame_rgba = cv2.cvtColor(frame, cv2.COLOR_BGR2RGBA)
-            self.frame[:, :, :] = frame_rgba
-            self.frame_changed = True
+            self._force_read = False
+            index, buffer = frame
+            if index is END_OF_VIDEO:
+                self._over = True
+                continue
+            self._over = False
+            self._index = index
+            previous = self._set_frame(buffer)
+            if previous is not None and previous.shape == buffer.shape:
+                pipeline.buffers.put(previous)
 
     def stop(self):
         self._running = False
+        self._stop_pipeline()
 
 class PlayVideo(Node):
     class Meta:
@@ -237,58 +510,60 @@ class PlayVideo(Node):
         self._frame = None
 
     def _transfer_frame_pbo(self):
-        # generate PBO's 
-        if self._video_thread.has_video_loaded and (self._pbo_shape != self._video_thread.frame.shape):
-            if self._pbos is not None:
-                gl.glDeleteBuffers(PBO_COUNT, self._pbos)
+        # the video thread doesn't swap the shown frame while it's copied
+        with self._video_thread.frame_lock:
+            # generate PBO's 
+            if self._video_thread.has_video_loaded and (self._pbo_shape != self._video_thread.frame.shape):
+                if self._pbos is not None:
+                    gl.glDeleteBuffers(PBO_COUNT, self._pbos)
+
+                self._pbo_shape = self._video_thread.frame.shape
+                self._pbos = gl.glGenBuffers(PBO_COUNT)
+
+                h, w, b = self._pbo_shape
+                num_bytes = h*w*b
+                for pbo in self._pbos:
+                    gl.glBindBuffer(gl.GL_PIXEL_UNPACK_BUFFER, pbo)
+                    gl.glBufferData(gl.GL_PIXEL_UNPACK_BUFFER, num_bytes, None, gl.GL_STREAM_DRAW)
+                gl.glBindBuffer(gl.GL_PIXEL_UNPACK_BUFFER, 0)
+
+            # generate/update OpenGL texture
+            if (self._frame is None or self._frame.shape != self._pbo_shape) and self._pbo_shape is not None:
+                self._frame = np.zeros(self._pbo_shape, dtype=np.uint8).view(gloo.Texture2D)
+                self._frame.activate()
+                self._frame.deactivate()
+
+            # do the transfer of pixel data from cpu to gpu using PBO's
+            # inspired by this: https://gist.github.com/roxlu/4663550
+            if self._video_thread.has_video_loaded and self._video_thread.frame_changed:
+                self._video_thread.frame_changed = False
+
+                pbo = self._pbos[self._pbo_index]
+                gl.glBindBuffer(gl.GL_PIXEL_UNPACK_BUFFER, pbo)
+                t = self._frame._handle
+                h, w, b = self._pbo_shape
+                assert t != None and t != 0
+                gl.glBindTexture(gl.GL_TEXTURE_2D, t)
+                gl.glTexSubImage2D(gl.GL_TEXTURE_2D, 0, 0, 0, w, h, gl.GL_RGBA, gl.GL_UNSIGNED_BYTE, None)
 
-            self._pbo_shape = self._video_thread.frame.shape
-            self._pbos = gl.glGenBuffers(PBO_COUNT)
+                h, w, b = self._pbo_shape
+                num_bytes = h*w*b
 
-            h, w, b = self._pbo_shape
-            num_bytes = h*w*b
-            for pbo in self._pbos:
+                self._pbo_index = (self._pbo_index + 1) % PBO_COUNT
+                pbo = self._pbos[self._pbo_index]
                 gl.glBindBuffer(gl.GL_PIXEL_UNPACK_BUFFER, pbo)
-                gl.glBufferData(gl.GL_PIXEL_UNPACK_BUFFER, num_bytes, None, gl.GL_STREAM_DRAW)
-            gl.glBindBuffer(gl.GL_PIXEL_UNPACK_BUFFER, 0)
-
-        # generate/update OpenGL texture
-        if (self._frame is None or self._frame.shape != self._pbo_shape) and self._pbo_shape is not None:
-            self._frame = np.zeros(self._pbo_shape, dtype=np.uint8).view(gloo.Texture2D)
-            self._frame.activate()
-            self._frame.deactivate()
-
-        # do the transfer of pixel data from cpu to gpu using PBO's
-        # inspired by this: https://gist.github.com/roxlu/4663550
-        if self._video_thread.has_video_loaded and self._video_thread.frame_changed:
-            self._video_thread.frame_changed = False
-
-            pbo = self._pbos[self._pbo_index]
-            gl.glBindBuffer(gl.GL_PIXEL_UNPACK_BUFFER, pbo)
-            t = self._frame._handle
-            h, w, b = self._pbo_shape
-            assert t != None and t != 0
-            gl.glBindTexture(gl.GL_TEXTURE_2D, t)
-            gl.glTexSubImage2D(gl.GL_TEXTURE_2D, 0, 0, 0, w, h, gl.GL_RGBA, gl.GL_UNSIGNED_BYTE, None)
-
-            h, w, b = self._pbo_shape
-            num_bytes = h*w*b
-
-            self._pbo_index = (self._pbo_index + 1) % PBO_COUNT
-            pbo = self._pbos[self._pbo_index]
-            gl.glBindBuffer(gl.GL_PIXEL_UNPACK_BUFFER, pbo)
-            # this might be an alternative, but not so fast as tested so far
-            #gl.glBufferSubData(gl.GL_PIXEL_UNPACK_BUFFER, 0, num_bytes, ctypes.c_void_p(self._video_thread.frame.ctypes.data))
-
-            ptr = gl.glMapBuffer(gl.GL_PIXEL_UNPACK_BUFFER, gl.GL_WRITE_ONLY)
-            if ptr != 0:
-                #start = time.time()
-                ctypes.memmove(ctypes.c_voidp(ptr), ctypes.c_void_p(self._video_thread.frame.ctypes.data), num_bytes)
-                #end = time.time()
-                #elapsed = end - start
-                #print("Took %.2fms, %.2fMB/s" % (elapsed * 1000, (num_bytes / 1000000) / elapsed))
-                gl.glUnmapBuffer(gl.GL_PIXEL_UNPACK_BUFFER)
-            gl.glBindBuffer(gl.GL_PIXEL_UNPACK_BUFFER, 0)
+                # this might be an alternative, but not so fast as tested so far
+                #gl.glBufferSubData(gl.GL_PIXEL_UNPACK_BUFFER, 0, num_bytes, ctypes.c_void_p(self._video_thread.frame.ctypes.data))
+
+                ptr = gl.glMapBuffer(gl.GL_PIXEL_UNPACK_BUFFER, gl.GL_WRITE_ONLY)
+                if ptr != 0:
+                    #start = time.time()
+                    ctypes.memmove(ctypes.c_voidp(ptr), ctypes.c_void_p(self._video_thread.frame.ctypes.data), num_bytes)
+                    #end = time.time()
+                    #elapsed = end - start
+                    #print("Took %.2fms, %.2fMB/s" % (elapsed * 1000, (num_bytes / 1000000) / elapsed))
+                    gl.glUnmapBuffer(gl.GL_PIXEL_UNPACK_BUFFER)
+                gl.glBindBuffer(gl.GL_PIXEL_UNPACK_BUFFER, 0)
 
     def _evaluate(self):
         if USE_PBO_TRANSFER:
@@ -350,15 +625,31 @@ class PlayVideo(Node):
                 time = time % duration
             self._video_thread.time = time
 
+RECORDER_BACKENDS = ["ffmpeg", "y4m", "raw", "png"]
+READBACK_FORMATS = {"rgb24" : gl.GL_RGB, "rgba" : gl.GL_RGBA, "yuv420" : gl.GL_RED}
+
 class FFMPEGVideoRecorder(Node):
     class Meta:
         inputs = [
             {"name" : "input", "dtype" : dtype.tex2d},
             {"name" : "start", "dtype" : dtype.event},
             {"name" : "stop", "dtype" : dtype.event},
+            {"name" : "backend", "dtype" : dtype.int, "dtype_args" : {"default" : 0, "choices" : RECORDER_BACKENDS}},
+            # (empty for a timestamped file in the screenshots directory)
+            {"name" : "path", "dtype" : dtype.str},
+            {"name" : "fps", "dtype" : dtype.float, "dtype_args" : {"default" : 30.0, "range" : [1.0, 240.0]}},
+            {"name" : "codec", "dtype" : dtype.str, "dtype_args" : {"default" : "libx264"}, "group" : "additional"},
+            {"name" : "preset", "dtype" : dtype.int, "dtype_args" : {"default" : util.encoder.PRESETS.index("medium"), "choices" : util.encoder.PRESETS}, "group" : "additional"},
+            # convert to yuv420 on the GPU for backends encoding yuv (ffmpeg, y4m)
+            {"name" : "gpu_yuv", "dtype" : dtype.bool, "dtype_args" : {"default" : True}, "group" : "additional"},
+            # start a new file after that many seconds / MB (0 for no segments)
+            {"name" : "segment_seconds", "dtype" : dtype.float, "dtype_args" : {"default" : 0.0, "range" : [0.0, float("inf")]}, "group" : "additional"},
+            {"name" : "segment_mb", "dtype" : dtype.float, "dtype_args" : {"default" : 0.0, "range" : [0.0, float("inf")]}, "group" : "additional"},
         ]
         outputs = [
             {"name" : "recording", "dtype" : dtype.bool},
+            {"name" : "dropped", "dtype" : dtype.int},
+            {"name" : "queued", "dtype" : dtype.int},
         ]
 
     def __init__(self):
@@ -366,84 +657,72 @@ class FFMPEGVideoRecorder(Node):
 
         self._recording = False
         self._texture_shape = None
-        self._process = None
+        self._sink = None
 
-        self._pbo_shape = None
-        self._pbo_index = 0
-        self._pbos = None
+        # frames are (optionally converted to yuv420 and) downloaded asynchronously (see util.readback)
+        # and written to the sink (see util.encoder) in a thread, the render thread doesn't wait for either
+        self._conversion = None
+        self._readback = None
+        self._writer = None
 
-    def _download_texture(self, texture):
-        # generate PBO's 
-        if self._pbos is None or self._pbo_shape != texture.shape:
-            if self._pbos is not None:
-                gl.glDeleteBuffers(2, self._pbos)
-
-            self._pbo_shape = texture.shape
-            self._pbos = gl.glGenBuffers(2)
-
-            h, w, b = self._pbo_shape
-            num_bytes = h*w*b
-            for pbo in self._pbos:
-                gl.glBindBuffer(gl.GL_PIXEL_PACK_BUFFER, pbo)
-                gl.glBufferData(gl.GL_PIXEL_PACK_BUFFER, num_bytes, None, gl.GL_STREAM_DRAW)
-            gl.glBindBuffer(gl.GL_PIXEL_PACK_BUFFER, 0)
-
-        # do the transfer of pixel data from gpu to cpu using PBO's
-        # inspired by this: https://gist.github.com/roxlu/4663550
-        h, w, b = self._pbo_shape
-        b -= 1
-        num_bytes = h*w*b
-        pbo = self._pbos[self._pbo_index]
-        gl.glBindBuffer(gl.GL_PIXEL_PACK_BUFFER, pbo)
-        t = texture._handle
-        assert t != None and t != 0
-        gl.glBindTexture(gl.GL_TEXTURE_2D, t)
-        gl.glGetTexImage(gl.GL_TEXTURE_2D, 0, gl.GL_RGB, gl.GL_UNSIGNED_BYTE, ctypes.c_void_p(0))
-
-        self._pbo_index = (self._pbo_index + 1) % 2
-        pbo = self._pbos[self._pbo_index]
-        gl.glBindBuffer(gl.GL_PIXEL_PACK_BUFFER, pbo)
-        ptr = gl.glMapBuffer(gl.GL_PIXEL_PACK_BUFFER, gl.GL_READ_ONLY)
-        data = None
-        if ptr != 0:
-            p = ctypes.cast(ptr, ctypes.POINTER(ctypes.c_ubyte * num_bytes))
-            data = np.frombuffer(p.contents, dtype=np.uint8).copy().reshape((h, w, b))
-            gl.glUnmapBuffer(gl.GL_PIXEL_PACK_BUFFER)
-        gl.glBindBuffer(gl.GL_PIXEL_PACK_BUFFER, 0)
-
-        assert data is not None
-        return data
+    @property
+    def dropped_frames(self):
+        # frames dropped because no pixel buffer was free or the writer queue was full
+        if self._readback is None:
+            return 0
+        return self._readback.dropped + self._writer.dropped
 
     def _start_recording(self):
-        path = "test.mp4"
-
         texture = self.get("input")
         if texture is None:
             return
         self._texture_shape = texture.shape
         h, w, _ = texture.shape
 
-        command = [
-            "ffmpeg",
-            "-y",
-            "-f", "rawvideo",
-            "-vcodec", "rawvideo",
-            "-s", "%dx%d" % (w, h),
-            "-pix_fmt", "rgb24",
-            "-r", "30",
-            "-i", "-",
-            #"-i", "pipe:0",
-            #"-c:v", "h264_nvenc", "-preset", "slow", "-profile:v", "high", "-b:v", "5M",
-            "-an",
-            util.image.generate_screenshot_path(suffix=".mp4"),
-        ]
-
-        self._process = subprocess.Popen(command, stdin=subprocess.PIPE, bufsize=-1) #1000000*10)
+        backend = RECORDER_BACKENDS[max(0, min(len(RECORDER_BACKENDS) - 1, int(self.get("backend"))))]
+        sink_class = util.encoder.SINKS[backend]
+        use_yuv = self.get("gpu_yuv") and sink_class.FORMATS[0] == "yuv420"
+        if use_yuv:
+            format = "yuv420"
+            size = util.encoder.even_size((w, h))
+        else:
+            format = [ f for f in sink_class.FORMATS if f != "yuv420" ][0]
+            size = (w, h)
+        options = {}
+        if backend == "ffmpeg":
+            preset = util.encoder.PRESETS[max(0, min(len(util.encoder.PRESETS) - 1, int(self.get("preset"))))]
+            options = {"codec" : self.get("codec") or "libx264", "preset" : preset}
+        path = self.get("path") or util.image.generate_screenshot_path(suffix=sink_class.EXTENSION)
+
+        try:
+            self._sink = util.encoder.SegmentedSink(backend, path, size, self.get("fps"), format,
+                    max_seconds=self.get("segment_seconds"), max_bytes=int(self.get("segment_mb") * 2**20), **options)
+        except Exception as e:
+            print("### Warning: Unable to start recording to %s: %s" % (path, e))
+            self._sink = None
+            return
+        self._conversion = util.readback.YUV420Conversion() if use_yuv else None
+        self._readback = util.readback.TextureReadback(format=READBACK_FORMATS[format])
+        # (frames are written from the mapped pixel buffers)
+        self._writer = util.readback.FrameWriter(self._sink.write, max_queued=self._readback.count)
+        self._writer.start()
 
         self._recording = True
 
     def _stop_recording(self):
-        self._process.stdin.close()
+        for frame in self._readback.flush():
+            self._writer.put(frame)
+        self._writer.stop()
+        self._readback.delete()
+        if self._conversion is not None:
+            self._conversion.delete()
+            self._conversion = None
+        try:
+            self._sink.close()
+        except Exception as e:
+            print("### Warning: Error finishing recording: %s" % e)
+        if self.dropped_frames:
+            print("### Warning: Dropped %d of %d recorded frames" % (self.dropped_frames, self._readback.frames))
 
         self._recording = False
 
@@ -457,23 +736,28 @@ class FFMPEGVideoRecorder(Node):
             texture = self.get("input")
             if texture is None or texture.shape != self._texture_shape:
                 self._stop_recording()
+            elif self._writer.error is not None:
+                print("### Warning: Writing recorded frames failed, stopping recording")
+                self._stop_recording()
             else:
-                #start = time.time()
-                data = self._download_texture(texture)
-                #end = time.time()
-                #print("Reading stuff takes %.2f ms" % ((end - start) * 1000))
-                #start = time.time()
-                b = data.tobytes()
-                #end = time.time()
-                #print("Test takes %.2f ms" % ((end - start) * 1000))
-                #start = time.time()
-                self._process.stdin.write(b)
-                #end = time.time()
-                #print("Write takes %.2f ms" % ((end - start) * 1000))
+                if self._conversion is not None:
+                    texture = self._conversion.convert(texture)
+                for frame in self._readback.read(texture):
+                    self._writer.put(frame)
 
         self.set("recording", self._recording)
+        self.set("dropped", self.dropped_frames)
+        self.set("queued", self._writer.queue_depth if self._writer is not None else 0)
+
+    def _show_custom_context(self):
+        if self._readback is not None:
+            imgui.text("Frames: %d, dropped: %d" % (self._readback.frames, self.dropped_frames))
+            imgui.text("Queued: %d, max. queued: %d" % (self._writer.queue_depth, self._writer.max_queue_depth))
+            for path in self._sink.paths:
+                imgui.text(path)
+
+        super()._show_custom_context()
 
     def stop(self):
         if self._recording:
             self._stop_recording()
-
@@ -3,14 +3,29 @@ from pyvisual.node import dtype
 from pyvisual.node.io.audio import AudioData, FFTData, DEFAULT_SAMPLE_RATE
 from pyvisual.node.op.module import StaticModule
 from pyvisual.audio import util
+from pyvisual.util.time import clock_time
 from scipy import signal
 from glumpy import gloo
 import math
+import functools
+import threading
+import weakref
 import time
 import numpy as np
 import imgui
 import librosa
 
+# filter banks by input audio data, filter nodes with the same input are run together
+_filter_banks = weakref.WeakKeyDictionary()
+_filter_banks_lock = threading.Lock()
+def get_filter_bank(audio):
+    with _filter_banks_lock:
+        bank = _filter_banks.get(audio)
+        if bank is None:
+            bank = util.FilterBank()
+            _filter_banks[audio] = bank
+        return bank
+
 AUDIO_FILTER_TYPES = ["low", "high"]
 class AudioFilter(Node):
     class Meta:
@@ -28,6 +43,8 @@ class AudioFilter(Node):
             "category" : "audio"
         }
 
+    PARALLEL_EVALUATION = True
+
     def __init__(self):
         super().__init__()
 
@@ -35,8 +52,18 @@ class AudioFilter(Node):
         # contains error message if there is a problem
         self.filter_status = None
         self.output = None
+        # filter bank of the input the filter is in
+        self.filter_bank = None
+
+    def _set_filter_bank(self, filter_bank):
+        if self.filter_bank is not None and self.filter is not None:
+            self.filter_bank.remove(self.filter)
+        self.filter_bank = filter_bank
+        if self.filter_bank is not None and self.filter is not None:
+            self.filter_bank.add(self.filter)
 
     def build_filter(self, sample_rate):
+        self._set_filter_bank(None)
         filter_type = int(self.get("type"))
         if not filter_type in (0, 1):
             filter_type = 0
@@ -65,23 +92,33 @@ class AudioFilter(Node):
         if ((self.filter is None or self.output is None) and self.filter_status is None) \
                 or self.have_inputs_changed("type", "order", "cutoff") \
                 or self.output.sample_rate != input_audio.sample_rate \
-                or self._last_evaluated == 0.0:
+                or self.output.block_size != input_audio.block_size \
+                or self.output.channels != input_audio.channels \
+                or not self._evaluated:
             self.build_filter(sample_rate=input_audio.sample_rate)
-            self.output = AudioData(input_audio.sample_rate, input_audio.block_size)
+            self.output = AudioData(input_audio.sample_rate, input_audio.block_size, input_audio.channels)
 
         if self.filter is None:
             self.set("output", None)
             return
 
         if not self.get("enabled"):
+            self._set_filter_bank(None)
             self.set("output", input_audio)
             return
 
-        self.output.clear()
-        for block in input_audio.blocks:
-            self.output.append(self.filter.process(block))
+        filter_bank = get_filter_bank(input_audio)
+        if filter_bank is not self.filter_bank:
+            self._set_filter_bank(filter_bank)
+        # one filter call over all samples of the frame (for all filters of the input)
+        self.output.resize(len(input_audio))
+        self.output.frames[:] = filter_bank.process(self.filter, input_audio.frames, input_audio.version)
         self.set("output", self.output)
 
+    def stop(self):
+        self._set_filter_bank(None)
+        super().stop()
+
     def _show_custom_ui(self):
         if self.filter_status is not None:
             imgui.dummy(1, 5)
@@ -93,7 +130,7 @@ class AudioFilter(Node):
         if imgui.button("copy filter coefficients"):
             if self.filter is not None:
                 import clipboard
-                clipboard.copy("""a = %s\nb = %s""" % (str(self.filter._a.tolist()), str(self.filter._b.tolist())))
+                clipboard.copy("""sos = %s""" % str(self.filter.sos.tolist()))
 
 class AbsAudio(Node):
     class Meta:
@@ -107,16 +144,24 @@ class AbsAudio(Node):
             "category" : "audio"
         }
 
+    PARALLEL_EVALUATION = True
+
+    def __init__(self):
+        super().__init__()
+
+        self.output = None
+
     def _evaluate(self):
         input_audio = self.get("input")
         if input_audio is None:
             self.set("output", None)
             return
 
-        output = AudioData(input_audio.sample_rate, input_audio.block_size)
-        for block in input_audio.blocks:
-            output.append(np.abs(block))
-        self.set("output", output)
+        if self.output is None or self.output.sample_rate != input_audio.sample_rate \
+                or self.output.block_size != input_audio.block_size or self.output.channels != input_audio.channels:
+            self.output = AudioData(input_audio.sample_rate, input_audio.block_size, input_audio.channels)
+        np.abs(input_audio.blocks, out=self.output.resize(len(input_audio)))
+        self.set("output", self.output)
 
 class SampleAudio(Node):
     class Meta:
@@ -136,11 +181,11 @@ class SampleAudio(Node):
             self.set("output", 0.0)
             return
 
-        if len(input_audio.blocks) == 0:
+        if len(input_audio) == 0:
             return
 
-        block = input_audio.blocks[-1]
-        self.set("output", block[-1])
+        # (mixed down channels)
+        self.set("output", float(np.mean(input_audio.frames[-1])))
 
 def create_gauss_kernel(count, sigma):
     # gauss kernel, flipped, normalized, in rows
@@ -168,85 +213,104 @@ class SampleAudioSSBO(Node):
     def __init__(self):
         super().__init__()
 
-        # global sample index where sample of first block starts
-        self._blocks_index = 0
-        self._blocks = []
-
-        self._last_samples_size = None
-        self._last_samples = []
-        self._last_samples_kernel = None
+        # the last samples of the input (frames of audio data are reused), and the global sample index
+        # where the kept samples start
+        self._history = util.SampleHistory(np.float32)
+        self._samples_index = 0
+
+        # the last sample sets as rows of a ring (as many as smooth_count), the number of sets in it
+        # and the row of the next one
+        self._sets = None
+        self._set_count = 0
+        self._set_row = 0
+        # gauss kernel rotated for each row the oldest set might be in, in rows
+        self._kernels = None
+        self._smoothed = None
         self._ssbo = None
 
     def _update_ssbo(self, size):
         self._ssbo = np.zeros((size,), dtype=np.float32).view(gloo.ShaderStorageBuffer)
 
+    def _update_sets(self, smooth_count, size):
+        # sets of another size are dropped, otherwise the newest ones are kept
+        sets = np.zeros((smooth_count, size), dtype=np.float32)
+        count = 0
+        if self._sets is not None and self._sets.shape[1] == size:
+            count = min(self._set_count, smooth_count)
+            rows = (self._set_row - count + np.arange(count)) % len(self._sets)
+            sets[:count] = self._sets[rows]
+        self._sets = sets
+        self._set_count = count
+        self._set_row = count % smooth_count
+        self._smoothed = np.zeros((size,), dtype=np.float32)
+
     def _evaluate(self):
         size = self.get_input("size")
         if size.has_changed() or self._ssbo is None:
             self._update_ssbo(int(size.value))
 
         input_audio = self.get("input")
-        if input_audio is None or len(input_audio.blocks) == 0:
+        if input_audio is None or len(input_audio) == 0:
             return
-        self._blocks.extend(input_audio.blocks)
 
         # number of samples to be sampled
-        c = size.value
+        c = int(size.value)
         # if samples are always taken from the same index mod some value for a frequency
         # then that frequency always appear with the same phase
         index_mod = input_audio.sample_rate / self.get("tune_frequency") * 4
 
-        total_length = lambda: sum([ len(b) for b in self._blocks ])
         # remove excess blocks, s.t. there are max. index_mod + c samples
         # (index_mod + c should ensure that we can always get c samples starting from some index_mod offset)
-        while total_length() - input_audio.block_size > index_mod + c:
-            block = self._blocks.pop(0)
-            self._blocks_index += len(block)
-
-        last_index = self._blocks_index + total_length()
-        # i is index relative to current blocks
+        # (at most index_mod + c + block_size samples are kept)
+        block_size = input_audio.block_size
+        samples = input_audio.mono()
+        self._history.reserve(math.ceil(index_mod) + c + block_size + len(samples))
+        self._history.write(samples)
+        total_length = self._history.written - self._samples_index
+        removed = max(0, math.ceil((total_length - block_size - (index_mod + c)) / block_size)) * block_size
+        self._samples_index += removed
+        total_length -= removed
+
+        # i is index relative to current samples
         # (and it's the first possible index where (i mod index_mod) == 0)
-        i = round(index_mod * math.ceil(self._blocks_index / index_mod)) - self._blocks_index
+        i = round(index_mod * math.ceil(self._samples_index / index_mod)) - self._samples_index
         assert i >= 0
         # it might happen that there are not enough samples yet
-        if i + c >= total_length():
+        if i + c >= total_length:
             return
 
-        # TODO perhaps performance improvement, but it's okay for now
-        all_samples = np.concatenate(self._blocks)
-        samples = all_samples[i:i+int(c)]
+        samples = self._history.window(self._samples_index + i, c)
+        smooth_count = int(self.get("smooth_count"))
+        smooth_sigma = self.get("smooth_sigma")
         # clear last samples if sample size has changed
-        if len(samples) != self._last_samples_size:
-            self._last_samples_size = len(samples)
-            self._last_samples = []
+        if self._sets is None or self._sets.shape != (smooth_count, c):
+            self._update_sets(smooth_count, c)
 
         # take samples if enabled, otherwise do smoothing by repeating current samples + gauss kernel
-        if self.get("enabled") or len(self._last_samples) == 0:
-            self._last_samples.append(samples)
+        row = self._set_row
+        if self.get("enabled") or self._set_count == 0:
+            self._sets[row] = samples
+        elif self.get("smooth_to_zero"):
+            self._sets[row] = 0.0
         else:
-            if self.get("smooth_to_zero"):
-                self._last_samples.append(np.zeros_like(self._last_samples[-1]))
-            else:
-                self._last_samples.append(self._last_samples[-1])
-        self._last_samples_size = len(self._last_samples[0])
+            self._sets[row] = self._sets[row - 1]
+        self._set_row = (row + 1) % smooth_count
+        self._set_count = min(self._set_count + 1, smooth_count)
 
-        smooth_count = int(self.get("smooth_count"))
-        smooth_sigma = self.get("smooth_sigma")
         if self.have_inputs_changed("smooth_count", "smooth_sigma") \
-                or self._last_samples_kernel is None \
-                or len(self._last_samples_kernel) != smooth_count:
-            self._last_samples_kernel = create_gauss_kernel(smooth_count, smooth_sigma)
+                or self._kernels is None \
+                or len(self._kernels) != smooth_count:
+            kernel = create_gauss_kernel(smooth_count, smooth_sigma)[:, 0]
+            self._kernels = np.stack([ np.roll(kernel, row) for row in range(smooth_count) ]).astype(np.float32)
 
         # have exactly smooth_count of sample sets ready
-        while len(self._last_samples) > smooth_count:
-            self._last_samples.pop(0)
-        if len(self._last_samples) < smooth_count:
+        if self._set_count < smooth_count:
             return
 
-        # smooth samples by applying gauss kernel over last sample sets
-        samples = np.sum(self._last_samples * self._last_samples_kernel, axis=0)
-
-        self._ssbo[:] = samples * self.get("scale")
+        # smooth samples by applying gauss kernel over last sample sets (the oldest one is in the next row)
+        np.dot(self._kernels[self._set_row], self._sets, out=self._smoothed)
+        np.multiply(self._smoothed, self.get("scale"), out=self._smoothed)
+        self._ssbo[:] = self._smoothed
         self.set("output", self._ssbo)
 
 class VUNormalizer(Node):
@@ -326,8 +390,8 @@ class BeatAnalyzer(Node):
         self.current_bpm = 0.0
         self.is_beat_running = False
 
-        self.last_beat = time.time()
-        self.delta_to_last_beat = lambda self=self: time.time() - self.last_beat
+        self.last_beat = clock_time()
+        self.delta_to_last_beat = lambda self=self: clock_time() - self.last_beat
         self.bpm_from_last_beat = lambda self=self: 60.0 / self.delta_to_last_beat()
 
         self.bpm_window_average = sliding_window_average(8)
@@ -360,7 +424,7 @@ class BeatAnalyzer(Node):
                 print("--- bpm", bpm, self.current_bpm, "---")
             else:
                 print("hmm, new bpm doesn't make sense:", bpm,)
-            self.last_beat = time.time()
+            self.last_beat = clock_time()
 
         #print(self.bpm_from_last_beat())
         self.is_beat_running = self.bpm_fits_lower_threshold(self.bpm_from_last_beat())
@@ -387,6 +451,27 @@ class BeatDetection(StaticModule):
 WINDOW_NAMES = ["hamming", "hanning", "cosine"]
 WINDOW_FN = [np.hamming, np.hanning, signal.cosine]
 
+# windows by (window index, length)
+_windows = {}
+def get_window(index, length):
+    key = (index, length)
+    if key not in _windows:
+        _windows[key] = WINDOW_FN[index](length)
+    return _windows[key]
+
+def band_slice(frequencies, min_freq, max_freq):
+    # slice of the (ascending) frequencies in (min_freq, max_freq]
+    start = np.searchsorted(frequencies, min_freq, side="right")
+    end = np.searchsorted(frequencies, max_freq, side="right")
+    return slice(start, max(start, end))
+
+# band plans by (number of bins, band count, gamma), these depend on the fft length and sample rate
+# only through the number of bins between min / max frequency of a node
+# (bounded, gamma changes continuously while dragging it in the editor)
+@functools.lru_cache(maxsize=64)
+def get_band_plan(bins, count, gamma):
+    return util.BandPlan(bins, count, gamma)
+
 class FFT(Node):
     class Meta:
         inputs = [
@@ -395,63 +480,57 @@ class FFT(Node):
             {"name" : "smooth_sigma", "dtype" : dtype.float, "dtype_args" : {"default" : 1, "range" : [0.0001, float("inf")]}},
             {"name" : "window", "dtype" : dtype.int, "dtype_args" : {"choices" : WINDOW_NAMES}},
             {"name" : "scale_db", "dtype" : dtype.float, "dtype_args" : {"default" : 0.0, "range" : [0.0, 1.0]}},
+            {"name" : "length", "dtype" : dtype.int, "dtype_args" : {"default" : 4, "range" : [1, float("inf")]}, "group" : "additional"},
+            {"name" : "overlap", "dtype" : dtype.float, "dtype_args" : {"default" : 0.0, "range" : [0.0, 0.95]}, "group" : "additional"},
         ]
         outputs = [
             {"name" : "output", "dtype" : dtype.fft},
         ]
 
+    PARALLEL_EVALUATION = True
+
     def __init__(self):
         super().__init__()
 
-        self._blocks = []
+        self._stft = None
         self._sample_rate = None
         self._block_size = None
-        
-        self._fft_len = None
-        self._last_magnitudes = []
-        self._last_magnitudes_size = None
-        self._last_magnitudes_kernel = None
 
-    def _process_fft(self, blocks, samplerate):
-        # smoothing here works similar as in SampleAudioSSBO
+        # last magnitudes for smoothing, circular (oldest at _last_magnitudes_index once it's full)
+        self._last_magnitudes = None
+        self._last_magnitudes_count = 0
+        self._last_magnitudes_index = 0
+        self._last_magnitudes_kernel = None
+        self._frequencies = None
 
-        samples = np.concatenate(blocks)
-        M = len(samples)
-        window = WINDOW_FN[int(self.get("window"))](M)
-        samples = samples * window
+    def _update_stft(self, input_audio):
+        # window of length blocks, a new one every hop samples
+        self._sample_rate = input_audio.sample_rate
+        self._block_size = input_audio.block_size
+        length = int(self.get("length")) * input_audio.block_size
+        hop = max(1, int(round(length * (1.0 - self.get("overlap")))))
+        self._stft = util.StreamingSTFT(length, hop, get_window(int(self.get("window")), length))
 
+    def _update_smoothing(self, bins):
         smooth_count = int(self.get("smooth_count"))
-        smooth_sigma = self.get("smooth_sigma")
-
-        Fs = samplerate
-        magnitudes = np.abs(np.fft.fft(samples, axis=0)[:M // 2 + 1:-1])
-
-        if len(magnitudes) != self._last_magnitudes_size:
-            self._last_magnitudes_size = len(magnitudes)
-            self._last_magnitudes = []
-        self._last_magnitudes.append(magnitudes)
-
-        # update gauss kernel if smooth count/sigma changed
-        if self.have_inputs_changed("smooth_count", "smooth_sigma") \
-                or self._fft_len is None or self._fft_len != len(magnitudes) \
-                or len(self._last_magnitudes_kernel) != smooth_count:
-            self._last_magnitudes_kernel = create_gauss_kernel(smooth_count, smooth_sigma)
-
-        while len(self._last_magnitudes) > smooth_count:
-            self._last_magnitudes.pop(0)
-        if len(self._last_magnitudes) < smooth_count:
+        self._last_magnitudes_kernel = create_gauss_kernel(smooth_count, self.get("smooth_sigma"))[:, 0]
+        if self._last_magnitudes is not None and self._last_magnitudes.shape == (smooth_count, bins):
             return
-
-        last_magnitudes = np.array(self._last_magnitudes)
-        magnitudes = np.sum(last_magnitudes * self._last_magnitudes_kernel, axis=0)
-
-        scale_db = self.get("scale_db")
-        if self.get("scale_db"):
-            magnitudes = 20*np.log10(magnitudes)
-
-        frequencies = np.arange(0, len(magnitudes)) * Fs / M
-        fft = FFTData(magnitudes, frequencies, frequencies[1])
-        self.set("output", fft)
+        # keep the most recent magnitudes if only the count has changed
+        last_magnitudes = np.zeros((smooth_count, bins))
+        count = 0
+        if self._last_magnitudes is not None and self._last_magnitudes.shape[1] == bins:
+            count = min(self._last_magnitudes_count, smooth_count)
+            for i in range(count):
+                last_magnitudes[count - 1 - i] = self._last_magnitudes[(self._last_magnitudes_index - 1 - i) % len(self._last_magnitudes)]
+        self._last_magnitudes = last_magnitudes
+        self._last_magnitudes_count = count
+        self._last_magnitudes_index = count % smooth_count
+
+    def _push_magnitudes(self, magnitudes):
+        self._last_magnitudes[self._last_magnitudes_index] = magnitudes
+        self._last_magnitudes_index = (self._last_magnitudes_index + 1) % len(self._last_magnitudes)
+        self._last_magnitudes_count = min(self._last_magnitudes_count + 1, len(self._last_magnitudes))
 
     def _evaluate(self):
         input_audio = self.get("input")
@@ -459,42 +538,45 @@ class FFT(Node):
             self.set("output", None)
             return
 
-        #print("Got %d blocks" % len(input_audio.blocks))
-        # TODO expose this!
-        N = 4
-        overlap = N - 1
-        for block in input_audio.blocks:
-            self._blocks.append(block)
-        self._sample_rate = input_audio.sample_rate
-        self._block_size = input_audio.block_size
-
-        generated_fft = False
-        while len(self._blocks) >= N:
-            fft_blocks = self._blocks[:N]
-            process = True
-
-            #to_pop = N - overlap
-            #remaining = len(self._blocks) - to_pop
-            #assert remaining >= 0
-            #if remaining >= N:
-            #    process = False
+        if self._stft is None or self.have_inputs_changed("window", "length", "overlap") \
+                or self._sample_rate != input_audio.sample_rate or self._block_size != input_audio.block_size:
+            self._update_stft(input_audio)
+        M = self._stft.length
+        # bins 1 to M/2 - 2 (DC and the highest bins are left out)
+        bins = max(0, M // 2 - 2)
+        if self._last_magnitudes is None or self.have_inputs_changed("smooth_count", "smooth_sigma") \
+                or self._last_magnitudes.shape[1] != bins:
+            self._update_smoothing(bins)
+
+        spectra = self._stft.process([input_audio.mono()])
+        # add current fft value to last fft results for smoothing
+        if len(spectra) == 0:
+            if self._last_magnitudes_count != 0:
+                self._push_magnitudes(self._last_magnitudes[self._last_magnitudes_index - 1])
+            return
+        for magnitudes in spectra:
+            self._push_magnitudes(magnitudes[1:bins + 1])
+        if self._last_magnitudes_count < len(self._last_magnitudes):
+            return
 
-            for i in range(N):
-                self._blocks.pop(0)
+        # smoothing here works similar as in SampleAudioSSBO
+        kernel = np.roll(self._last_magnitudes_kernel, self._last_magnitudes_index)
+        magnitudes = np.dot(kernel, self._last_magnitudes)
 
-            #if process or True:
-            self._process_fft(fft_blocks, input_audio.sample_rate)
-            generated_fft = True
-            #else:
-            #    pass
+        if self.get("scale_db"):
+            magnitudes = 20*np.log10(magnitudes)
 
-        # add current fft value to last fft results for smoothing
-        if not generated_fft and len(self._last_magnitudes) != 0:
-            self._last_magnitudes.append(self._last_magnitudes[-1])
+        Fs = self._sample_rate
+        if self._frequencies is None or len(self._frequencies) != bins or self._frequencies[-1] != (bins - 1) * Fs / M:
+            self._frequencies = np.arange(0, bins) * Fs / M
+        fft = FFTData(magnitudes, self._frequencies, self._frequencies[1])
+        self.set("output", fft)
 
     def _show_custom_context(self):
-        imgui.text("FFT's per frame: ~%.2f" % (self._sample_rate / self._block_size / 60.0))
-        imgui.text("Smoothing kernel: %s" % str(", ".join([ "%.3f" % f for f in self._last_magnitudes_kernel ])))
+        if self._stft is not None:
+            imgui.text("FFT's per frame: ~%.2f" % (self._sample_rate / self._stft.hop / 60.0))
+        if self._last_magnitudes_kernel is not None:
+            imgui.text("Smoothing kernel: %s" % str(", ".join([ "%.3f" % f for f in self._last_magnitudes_kernel ])))
 
         super()._show_custom_context()
 
@@ -509,6 +591,8 @@ class BandpassFFT(Node):
             {"name" : "output", "dtype" : dtype.fft}
         ]
 
+    PARALLEL_EVALUATION = True
+
     def _evaluate(self):
         fft = self.get("input")
         if fft is None:
@@ -517,8 +601,8 @@ class BandpassFFT(Node):
 
         min_freq, max_freq = self.get("min"), self.get("max")
 
-        mask = (fft.frequencies > min_freq) & (fft.frequencies <= max_freq)
-        new_fft = FFTData(fft.magnitudes[mask], fft.frequencies[mask], fft.bin_resolution)
+        band = band_slice(fft.frequencies, min_freq, max_freq)
+        new_fft = FFTData(fft.magnitudes[band], fft.frequencies[band], fft.bin_resolution)
         if len(new_fft.frequencies) == 0:
             new_fft = None
         self.set("output", new_fft)
@@ -533,6 +617,8 @@ class AWeightingFFT(Node):
             {"name" : "output", "dtype" : dtype.fft}
         ]
 
+    PARALLEL_EVALUATION = True
+
     def _evaluate(self):
         fft = self.get("input")
         if fft is None:
@@ -561,10 +647,13 @@ class QuantizeFFT(Node):
             {"name" : "output", "dtype" : dtype.fft}
         ]
 
+    PARALLEL_EVALUATION = True
+
     def __init__(self):
         super().__init__()
 
-        self._freqs = []
+        self._plan = None
+        self._frequencies = None
 
     def _evaluate(self):
         fft = self.get("input")
@@ -573,27 +662,21 @@ class QuantizeFFT(Node):
             return
 
         count = int(self.get("count"))
-        count = max(0, count)
+        count = max(1, count)
         gamma = self.get("gamma")
 
         min_freq, max_freq = self.get("min_freq"), self.get("max_freq")
 
-        mask = (fft.frequencies > min_freq) & (fft.frequencies <= max_freq)
-        filtered_fft = FFTData(fft.magnitudes[mask], fft.frequencies[mask], fft.bin_resolution)
-
-        magnitudes = np.zeros((count,), dtype=np.float32)
-        frequencies = np.zeros((count,), dtype=np.float32)
-
-        self._freqs = []
         # take count of already filtered fft!
-        factor = len(filtered_fft.magnitudes) / count
-        for i in range(count):
-            # https://dlbeer.co.nz/articles/fftvis.html for gamma formula
-            first_index = int(((i / count) ** (1 / gamma)) * len(filtered_fft.magnitudes))
-            last_index = int((((i+1) / count) ** (1 / gamma)) * len(filtered_fft.magnitudes))
-            magnitudes[i] = filtered_fft.magnitudes[first_index:last_index].mean()
-            frequencies[i] = filtered_fft.frequencies[last_index - 1]
-            self._freqs.append((i, first_index, last_index, frequencies[i]))
+        band = band_slice(fft.frequencies, min_freq, max_freq)
+        filtered_frequencies = fft.frequencies[band]
+        self._plan = get_band_plan(len(filtered_frequencies), count, gamma)
+        magnitudes = self._plan.apply(fft.magnitudes[band])
+        if len(filtered_frequencies):
+            frequencies = filtered_frequencies[self._plan.frequency_indices].astype(np.float32)
+        else:
+            frequencies = np.zeros((count,), dtype=np.float32)
+        self._frequencies = frequencies
 
         if self.get("db"):
             magnitudes = 20*np.log10(magnitudes)
@@ -605,8 +688,9 @@ class QuantizeFFT(Node):
         self.set("output", filtered_fft)
 
     def _show_custom_context(self):
-        for freq in self._freqs:
-            imgui.text(str(freq))
+        if self._plan is not None:
+            for i in range(self._plan.count):
+                imgui.text(str((i, int(self._plan.first[i]), int(self._plan.last[i]), self._frequencies[i])))
 
         super()._show_custom_context()
 
@@ -1,8 +1,8 @@
 import random
 import numpy as np
-import time
 from pyvisual.node.base import Node
 from pyvisual.node import dtype
+from pyvisual.util.time import clock_time
 from collections import OrderedDict
 
 def weighted_random(weights):
@@ -88,7 +88,7 @@ class HoldBool(Node):
         self._next_off = 0
 
     def _evaluate(self):
-        t = time.time()
+        t = clock_time()
         i = self.get("input")
         condition = self.get("condition")
         if i and condition:
@@ -110,7 +110,7 @@ class SetResetBool(Node):
         ]
 
     def _evaluate(self):
-        if self._last_evaluated == 0.0:
+        if not self._evaluated:
             self.set("output", self.get("default"))
 
         if self.get("set"):
@@ -4,7 +4,6 @@ from pyvisual.node.base import Node
 from pyvisual.node.op.module import StaticModule
 from pyvisual.node import dtype
 from pyvisual import util
-from glumpy.app import clock
 from collections import OrderedDict
 
 def weighted_random(weights):
@@ -81,7 +80,7 @@ class FPSTimerEvent(Node):
             self._next_event = None
         if self._next_event is None:
             if self._fps is None:
-                self._fps = clock.get_default().get_fps_limit()
+                self._fps = util.time.frame_rate()
             f = self.get("fps_fraction")
             if f <= 0.0:
                 f = 1.0
@@ -1,3 +1,4 @@
+import os
 import time
 import math
 import random
@@ -52,11 +53,13 @@ class LFO(Node):
         self._time = 0.0
 
     def _evaluate(self):
-        generator = int(self.get("type"))
-        length = self.get("length")
+        type_input, length_input, phase_input, min_input, max_input = self.input_values
+        generator = int(type_input.value)
+        length = length_input.value
         self._time = self._timer(1.0 / length, False)
-        value = LFO.OSCILLATORS[generator](self._time, 1.0, self.get("phase"))
-        value = self.get("min") + value * (self.get("max") - self.get("min"))
+        value = LFO.OSCILLATORS[generator](self._time, 1.0, phase_input.value)
+        min_value = min_input.value
+        value = min_value + value * (max_input.value - min_value)
         self.set("output", value)
 
     def get_state(self):
@@ -365,6 +368,9 @@ class ChooseFile(Node):
             "index" : lambda node: node.generate_index(shuffle=True)
         }
 
+    # files after the chosen one that are loaded ahead (if they are images)
+    PREFETCH = 1
+
     def __init__(self):
         self._files = None
         self._index = 0
@@ -381,7 +387,7 @@ class ChooseFile(Node):
             return (self._index + 1) % count
 
     def _evaluate(self):
-        if self.have_inputs_changed("wildcard") or self._last_evaluated == 0.0:
+        if self.have_inputs_changed("wildcard") or not self._evaluated:
             wildcard = self.get("wildcard").strip()
             if not wildcard:
                 self._files = []
@@ -415,9 +421,18 @@ class ChooseFile(Node):
                 return
             if self._index < len(self._files):
                 self.set("output", self._files[self._index])
+                self._prefetch()
             else:
                 self.set("output", "")
 
+    def _prefetch(self):
+        # loads the images that "next" chooses ahead (for a LoadTexture reading the chosen file)
+        count = len(self._files)
+        for i in range(1, min(self.PREFETCH, count - 1) + 1):
+            path = self._files[(self._index + i) % count]
+            if util.texture_loader.is_image(path):
+                util.texture_loader.texture_loader.prefetch(os.path.join(assets.ASSET_PATH, path))
+
 class Noise1D(Node):
     class Meta:
         inputs = [
@@ -10,7 +10,10 @@ from pyvisual.node import dtype
 from pyvisual.node.op.gpu import custom_meta
 from pyvisual.editor import widget
 from pyvisual import assets
+from pyvisual.util import render_target
+from pyvisual.util.program_cache import CachedProgram
 from glumpy import gloo, gl, glm
+from glumpy.gloo.texture import Texture3D
 from PIL import Image
 
 class RenderNode(Node):
@@ -20,22 +23,56 @@ class RenderNode(Node):
         }
 
     USES_OPENGL = True
+    POOLED_RENDER_TARGET = True
+    RETAINS_INPUT_TEXTURES = False
 
     def __init__(self):
         super().__init__()
 
         self._fbo = None
+        # pool the render target is taken from (set by a graph pooling render targets)
+        self.render_target_pool = None
 
     def get_fbo(self, size):
         if self._fbo is not None:
-            h, w, _ = self._fbo.color[0].shape
-            if size == (w, h):
+            if size == render_target.fbo_size(self._fbo):
                 return self._fbo
-        w, h = size
-        texture = np.zeros((h, w, 4), dtype=np.uint8).view(gloo.Texture2D)
-        self._fbo = gloo.FrameBuffer(color=[texture])
+            self.release_fbo()
+        if self.render_target_pool is not None:
+            self._fbo = self.render_target_pool.acquire(size)
+        else:
+            self._fbo = render_target.create_fbo(size)
         return self._fbo
 
+    def set_render_target_pool(self, pool):
+        if pool is self.render_target_pool:
+            return
+        # the current render target is kept, but changes the pool that accounts for it
+        if self._fbo is not None:
+            if self.render_target_pool is not None:
+                self.render_target_pool.detach(self._fbo)
+            if pool is not None:
+                pool.attach(self._fbo)
+        self.render_target_pool = pool
+
+    def release_fbo(self):
+        # gives the render target back to its pool, the last rendered texture must not be used anymore
+        # returns whether there was a pooled render target
+        fbo = self._fbo
+        if fbo is None or self.render_target_pool is None:
+            return False
+        self._fbo = None
+        self.render_target_pool.release(fbo)
+        return True
+
+    @property
+    def render_target_texture(self):
+        return self._fbo.color[0] if self._fbo is not None else None
+
+    def stop(self):
+        self.release_fbo()
+        super().stop()
+
     def create_transform(self, m, texture_size, target_size):
         texture_aspect = texture_size[0] / texture_size[1]
         target_aspect = target_size[0] / target_size[1]
@@ -79,6 +116,8 @@ class RenderNode(Node):
 
 # TODO
 dummy = np.zeros((1, 1, 4), dtype=np.uint8).view(gloo.Texture2D)
+# (frame history with one black frame)
+dummy3d = np.zeros((1, 1, 1, 4), dtype=np.uint8).view(Texture3D)
 
 WRAPPING_MODES = ["repeat", "mirrored repeat", "clamp to edge", "clamp to border"]
 WRAPPING_MODES_GL = [gl.GL_REPEAT, gl.GL_MIRRORED_REPEAT, gl.GL_CLAMP_TO_EDGE, gl.GL_CLAMP_TO_BORDER]
@@ -94,6 +133,7 @@ GL_TO_DTYPE = {
     "vec4" : dtype.color,
     "mat4" : dtype.mat4,
     "sampler2D" : dtype.tex2d,
+    "sampler3D" : dtype.tex3d,
 }
 
 # mapping of dtype's to functions converting values for preprocessor value generation
@@ -128,6 +168,11 @@ class BaseShader(RenderNode):
 
         self.quad = None
         self.shader_error = None
+        # program that is compiled at the moment (see _poll_program) and the inputs parsed from its sources
+        self._pending_program = None
+        self._pending_inputs = None
+        # program must be (re)built with the next evaluation
+        self._program_outdated = True
 
         # mapping of inputs to program preprocessor values
         self._input_preprocessor_mapping = []
@@ -258,12 +303,16 @@ class BaseShader(RenderNode):
         pass
 
     def update_program(self):
+        self._program_outdated = False
+        self._delete_pending_program()
         vertex = self.vertex_source.data
         fragment = self.fragment_source.data
 
         # TODO this check if shaders are not empty is very rudimentary!
         if not vertex or not fragment or not "void main" in fragment:
             print("### Warning: Empty vertex/fragment shader of node %s #%d" % (self, self.id))
+            if self.quad:
+                self.quad.delete()
             self.quad = None
             self.shader_error = "Empty vertex/fragment shader"
             return
@@ -276,21 +325,43 @@ class BaseShader(RenderNode):
         fragment = self._generate_preprocessor_input_defines(input_preprocessor_mapping) + fragment
 
         try:
+            # programs with the same sources are compiled once and shared, see util.program_cache
+            program = CachedProgram(vertex, fragment, version="430", count=4)
+            program["iPosition"] = [(-1,-1), (-1,+1), (+1,-1), (+1,+1)]
+            program["iTexCoord"] = [( 0, 1), ( 0, 0), ( 1, 1), ( 1, 0)]
+            # set all uniform textures to dummy textures, in case some aren't set when rendering
+            for uniform, gtype in program.all_uniforms:
+                if gtype == gl.GL_SAMPLER_2D:
+                    program[uniform] = dummy
+                elif gtype == gl.GL_SAMPLER_3D:
+                    program[uniform] = dummy3d
+            program.compile()
+        except Exception as e:
+            self._program_failed()
+            return
+
+        # the current program is still used until the new one is compiled
+        self._pending_program = program
+        self._pending_inputs = (input_preprocessor_mapping, input_uniform_mapping, preprocessor_ports, uniform_ports)
+        self._poll_program()
+
+    def _poll_program(self):
+        # takes the pending program once it's compiled
+        program = self._pending_program
+        try:
+            if not program.poll():
+                return
+            self._pending_program = None
+            input_preprocessor_mapping, input_uniform_mapping, preprocessor_ports, uniform_ports = self._pending_inputs
+            self._pending_inputs = None
+            if program.error is not None:
+                error = program.error
+                program.delete()
+                raise assets.ShaderError("Shader compilation error:\n%s" % error)
+
             if self.quad:
                 self.quad.delete()
-            self.quad = gloo.Program(vertex, fragment, version="430", count=4)
-            self.quad["iPosition"] = [(-1,-1), (-1,+1), (+1,-1), (+1,+1)]
-            self.quad["iTexCoord"] = [( 0, 1), ( 0, 0), ( 1, 1), ( 1, 0)]
-
-            # HACKY
-            # we want to check if the built shader program compiles
-            # need to run it once
-            # but also set all uniform textures to dummy textures, otherwise it doesn't work
-            # (that's how it's possible with glumpy at the moment)
-            for uniform, gtype in self.quad.all_uniforms:
-                if gtype == gl.GL_SAMPLER_2D:
-                    self.quad[uniform] = dummy
-            self.quad.draw(gl.GL_TRIANGLE_STRIP)
+            self.quad = program
             self.shader_error = None
 
             # create custom input ports from preprocessor/uniform inputs
@@ -313,31 +384,45 @@ class BaseShader(RenderNode):
             # force a new evaluation after the shader program has been updated
             self.force_evaluate()
         except Exception as e:
-            if self.quad:
-                self.quad.delete()
-            self.quad = None
-            self.shader_error = traceback.format_exc()
-            traceback.print_exc()
-            print("Error happened in class %s, node %d" % (self, self.id))
+            self._delete_pending_program()
+            self._program_failed()
+
+    def _program_failed(self):
+        if self.quad:
+            self.quad.delete()
+        self.quad = None
+        self.shader_error = traceback.format_exc()
+        traceback.print_exc()
+        print("Error happened in class %s, node %d" % (self, self.id))
+
+    def _delete_pending_program(self):
+        if self._pending_program is not None:
+            self._pending_program.delete()
+            self._pending_program = None
+            self._pending_inputs = None
 
     def set_uniforms(self, program):
         for input_name, uniform_name, dt in self._input_uniform_mapping:
             value = self.get(input_name)
             if dt == dtype.tex2d and value is None:
                 value = dummy
+            elif dt == dtype.tex3d and value is None:
+                value = dummy3d
             elif dt == dtype.bool:
                 value = int(value)
             program[uniform_name] = value
 
     def evaluate(self):
         # update program if shader source has changed, on first evaluation, or if a preprocessor input value has changed
-        if self.vertex_source.has_changed or self.fragment_source.has_changed or self._last_evaluated == 0.0:
+        if self.vertex_source.has_changed or self.fragment_source.has_changed or self._program_outdated:
             self.update_program()
         else:
             for value in self._preprocessor_values:
                 if value.has_changed():
                     self.update_program()
                     break
+        if self._pending_program is not None:
+            self._poll_program()
 
         return super().evaluate()
 
@@ -378,6 +463,15 @@ class BaseShader(RenderNode):
 
         self.set("output", self.render(target_size, do_render))
 
+    def stop(self):
+        # programs are given back to the program cache, built again if the node is evaluated again
+        self._delete_pending_program()
+        if self.quad:
+            self.quad.delete()
+        self.quad = None
+        self._program_outdated = True
+        super().stop()
+
     def _show_custom_ui(self):
         if self.shader_error is None:
             return
@@ -389,6 +483,7 @@ class BaseShader(RenderNode):
 
     def _show_custom_context(self):
         if imgui.button("reload shaders"):
+            assets.shader_assets.check_changes(force=True)
             self.update_program()
 
         super()._show_custom_context()
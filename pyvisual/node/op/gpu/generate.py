@@ -246,7 +246,7 @@ class GLSLSandbox(TimeMaskedGenerate):
         # and (possibly modified) fragment source would be downloaded again / overwritten
         shader_id_changed = self.have_inputs_changed("id")
 
-        if self._last_evaluated == 0.0:
+        if not self._evaluated:
             fragment_source = self.get("fragment_source")
             if fragment_source:
                 self._set_fragment(fragment_source)
@@ -289,4 +289,6 @@ class GLSLSandbox(TimeMaskedGenerate):
         reference_path = node_widget.imgui_pick_file("reference_fragment", base_path)
         if reference_path is not None:
             self._export_fragment(reference_path)
+            if self._reference_file_watcher is not None:
+                self._reference_file_watcher.close()
             self._reference_file_watcher = assets.FileWatcher(reference_path)
@@ -12,7 +12,7 @@ from pyvisual.node import dtype
 from pyvisual.editor import widget
 from pyvisual.audio import util
 
-from glumpy.app import clock
+from pyvisual.util.time import frame_rate
 
 #
 # Base operation nodes
@@ -192,8 +192,9 @@ class Edge(Node):
 
     def _evaluate(self):
         last_value = self.last_value
-        value = self.get("value")
-        threshold = self.get("threshold")
+        value_input, threshold_input = self.input_values
+        value = value_input.value
+        threshold = threshold_input.value
         self.set("rising", last_value < threshold and value >= threshold)
         self.set("falling", last_value >= threshold and value < threshold)
         self.set("combined", last_value < threshold and value >= threshold or last_value > threshold and value <= threshold)
@@ -368,16 +369,16 @@ class BinaryOpFloat(Node):
         return "op: %s" % self._op_name
 
     def _evaluate(self):
-        op_value = self.get_input("op")
-        if op_value.has_changed():
-            op = int(op_value.value)
+        op_input, a_input, b_input = self.input_values
+        if op_input.has_changed():
+            op = int(op_input.value)
             if op < 0 or op >= len(self.OPS):
                 op = 0
             self._op_name = list(BINARY_OPS.keys())[op]
             self._op = self.OPS[op]
 
-        a = self.get("a")
-        b = self.get("b")
+        a = a_input.value
+        b = b_input.value
         try:
             self.set("out", self._op(a, b))
         except ZeroDivisionError:
@@ -477,7 +478,7 @@ class LowpassFloat(Node):
 
     def _create_filter(self, order, cutoff):
         try:
-            fps = clock.get_default().get_fps_limit() * 0.75
+            fps = frame_rate() * 0.75
             filter = util.Filter(signal.butter, order, cutoff, fps, {"btype" : "low", "analog" : False})
             self.status = None
             return filter
@@ -485,7 +486,7 @@ class LowpassFloat(Node):
             self.status = str(e)
 
     def _evaluate(self):
-        if self.have_inputs_changed("order", "cutoff") or self._last_evaluated == 0.0:
+        if self.have_inputs_changed("order", "cutoff") or not self._evaluated:
             self._filter = self._create_filter(self.get("order"), self.get("cutoff"))
 
         value = self.get("input")
@@ -624,7 +625,7 @@ class HSV2RGBA(Node):
 # Texture operations
 #
 
-from glumpy import gloo
+from pyvisual.util.render_target import TextureSnapshot, FrameHistory
 
 class HoldTexture(Node):
     class Meta:
@@ -636,24 +637,82 @@ class HoldTexture(Node):
             {"name" : "output", "dtype" : dtype.tex2d},
         ]
 
+    USES_OPENGL = True
+    # (copies its input)
+    RETAINS_INPUT_TEXTURES = False
+    # (must see each hold event)
+    ALWAYS_DEMANDED = True
+
     def __init__(self):
         super().__init__()
 
-        self._texture = None
+        self._snapshot = TextureSnapshot()
 
     def _evaluate(self):
         if self.get("hold"):
             texture = self.get("input")
             if texture is None:
-                self._texture = None
+                self._snapshot.release()
+                self.set("output", None)
             else:
-                # take detour by CPU for now
-                # - as glumpy doesn't make it so easy to copy texture data
-                t = texture.get().copy().view(gloo.Texture2D)
-                t.activate()
-                t.deactivate()
-                self._texture = t
-            self.set("output", self._texture)
+                # copied on the GPU
+                self.set("output", self._snapshot.take(texture))
+
+    def stop(self):
+        self._snapshot.release()
+
+MAX_HISTORY_DEPTH = 64
+
+class TextureHistory(Node):
+    # Keeps the last frames of the input in a 3d texture (one frame per layer) that shaders read as sampler3D,
+    # with the layer of the newest frame as index (see shader/lib/history.glsl). Frames are scaled down so
+    # their longer side is at most max_size.
+    class Meta:
+        inputs = [
+            {"name" : "input", "dtype" : dtype.tex2d},
+            {"name" : "depth", "dtype" : dtype.int, "dtype_args" : {"default" : 8, "range" : [1, MAX_HISTORY_DEPTH]}},
+            {"name" : "max_size", "dtype" : dtype.int, "dtype_args" : {"default" : 512, "range" : [1, 4096], "unit" : "px"}},
+        ]
+        outputs = [
+            {"name" : "history", "dtype" : dtype.tex3d},
+            {"name" : "index", "dtype" : dtype.int},
+        ]
+
+    USES_OPENGL = True
+    # (copies its input)
+    RETAINS_INPUT_TEXTURES = False
+    # (keeps a frame each frame)
+    ALWAYS_DEMANDED = True
+
+    def __init__(self):
+        super().__init__()
+
+        self._history = FrameHistory()
+
+    def _evaluate(self):
+        texture = self.get("input")
+        if texture is None:
+            self._history.release()
+            self.set("history", None)
+            self.set("index", 0)
+            return
+
+        depth = max(1, min(MAX_HISTORY_DEPTH, int(self.get("depth"))))
+        max_size = max(1, int(self.get("max_size")))
+        # copied on the GPU
+        self.set("history", self._history.push(texture, depth, max_size))
+        self.set("index", self._history.index)
+
+    def stop(self):
+        self._history.release()
+
+    def _show_custom_context(self):
+        texture = self._history.texture
+        if texture is not None:
+            depth, h, w, _ = texture.shape
+            imgui.text("%d frames of %dx%d, %.1f MB" % (depth, w, h, self._history.nbytes / 2**20))
+
+        super()._show_custom_context()
 
 #
 # String operations
@@ -703,6 +762,8 @@ class DelayXXX(Node):
         }
 
     FORCE_EARLY_EXECUTION = True
+    # (forwards changes of the last frame)
+    ALWAYS_DEMANDED = True
 
     def __init__(self):
         super().__init__()
@@ -743,3 +804,22 @@ class DelayTexture(DelayXXX):
             {"name" : "output", "dtype" : dtype.tex2d}
         ]
 
+    USES_OPENGL = True
+
+    def __init__(self):
+        super().__init__()
+
+        self._snapshot = TextureSnapshot()
+
+    def _after_evaluate(self):
+        # the input texture is copied, so the node rendering it can render to it again
+        # while the nodes after this one still read the last frame (in cyclic connections especially)
+        value = self.get_input("input")
+        # (None isn't forwarded, see DelayXXX)
+        if value.has_changed() and value.value is not None:
+            self._next_value = self._snapshot.take(value.value)
+            self.force_evaluate()
+
+    def stop(self):
+        self._snapshot.release()
+
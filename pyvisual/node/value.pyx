@@ -1,4 +1,14 @@
+cdef class DirtyFlag:
+    # shared by a node and all of its values
+    # set whenever one of the values changes, used by the dirty scheduling of a graph
+    cdef public int dirty
+
+    def __cinit__(self):
+        self.dirty = True
+
 cdef class Value:
+    cdef DirtyFlag _dirty_flag
+
     @property
     def value(self):
         return None
@@ -17,6 +27,9 @@ cdef class Value:
         if self.has_changed():
             value.value = self.value
 
+    cpdef set_dirty_flag(self, DirtyFlag dirty_flag):
+        self._dirty_flag = dirty_flag
+
 cdef class SettableValue(Value):
     cdef object _value
     cdef int _changed
@@ -37,6 +50,8 @@ cdef class SettableValue(Value):
     def value(self, object value):
         self._value = value
         self._changed = True
+        if self._dirty_flag is not None:
+            self._dirty_flag.dirty = True
 
     @property
     def force_value(self):
@@ -44,6 +59,8 @@ cdef class SettableValue(Value):
     @force_value.setter
     def force_value(self, int force_value):
         self._force_value = force_value
+        if self._dirty_flag is not None:
+            self._dirty_flag.dirty = True
 
     cpdef has_changed(self):
         return self._changed
@@ -67,10 +84,16 @@ cdef class ConnectedValue(Value):
         self._keep_value_on_disconnect = True
         self._has_connection_changed = False
 
+    cpdef set_dirty_flag(self, DirtyFlag dirty_flag):
+        self._dirty_flag = dirty_flag
+        self._manual_value.set_dirty_flag(dirty_flag)
+
     def connect(self, node, port_id):
         self._connected_node = node
         self._connected_value = node.get_value(port_id)
         self._has_connection_changed = True
+        if self._dirty_flag is not None:
+            self._dirty_flag.dirty = True
 
     def disconnect(self):
         # make the manual input keep the value when connection is removed
@@ -79,6 +102,8 @@ cdef class ConnectedValue(Value):
         self._connected_node = None
         self._connected_value = None
         self._has_connection_changed = True
+        if self._dirty_flag is not None:
+            self._dirty_flag.dirty = True
 
     @property
     def manual_value(self):
@@ -112,3 +137,68 @@ cdef class ConnectedValue(Value):
         self._manual_value.reset_changed()
         self._has_connection_changed = False
 
+
+cdef class NodeCore:
+    # holds the values of a node in port order (see Node.compile_values)
+    # and does change detection / resetting of the values without going through the node
+    cdef object _node
+    cdef list _inputs
+    cdef list _outputs
+    # whether the node overrides evaluate / _after_evaluate, these must always be called then
+    cdef readonly int custom_evaluate
+    cdef readonly int custom_after_evaluate
+
+    def __init__(self, node, list inputs, list outputs, int custom_evaluate, int custom_after_evaluate):
+        self._node = node
+        self._inputs = inputs
+        self._outputs = outputs
+        self.custom_evaluate = custom_evaluate
+        self.custom_after_evaluate = custom_after_evaluate
+
+    cpdef int have_inputs_changed(self):
+        cdef Value value
+        for value in self._inputs:
+            if value.has_changed():
+                return True
+        return False
+
+    cpdef reset_changed(self):
+        cdef Value value
+        for value in self._inputs:
+            value.reset_changed()
+        for value in self._outputs:
+            value.reset_changed()
+
+    cpdef int needs_evaluate(self):
+        # same condition as in Node.evaluate
+        if self.custom_evaluate:
+            return True
+        node = self._node
+        return node.always_evaluate or node._force_evaluate or self.have_inputs_changed() or not node._evaluated
+
+cpdef set evaluate_instances(list instances):
+    # evaluates sorted instances, returns the ones that were evaluated
+    # nodes that don't need an evaluation are skipped without calling into them
+    cdef set active_instances = set()
+    cdef NodeCore core
+    for instance in instances:
+        core = instance.core
+        if core is not None and not core.needs_evaluate():
+            continue
+        if instance.evaluate():
+            active_instances.add(instance)
+    return active_instances
+
+cpdef reset_instances(list instances):
+    # calls _after_evaluate of all instances, then resets the changed status of their values
+    cdef NodeCore core
+    for instance in instances:
+        core = instance.core
+        if core is None or core.custom_after_evaluate:
+            instance._after_evaluate()
+    for instance in instances:
+        core = instance.core
+        if core is None:
+            instance.reset_evaluated()
+        else:
+            core.reset_changed()
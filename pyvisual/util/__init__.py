@@ -1 +1 @@
-from . import image, time
+from . import image, time, render_target, encoder, readback, program_cache, texture_loader
@@ -0,0 +1,294 @@
+# Sinks writing recorded frames (see FFMPEGVideoRecorder): raw frames, Y4M, an ffmpeg pipe or PNG sequences.
+# Sinks run on the CPU only (they don't need an OpenGL context) and are called from the recorder's writer thread.
+# Frames are numpy uint8 arrays in one of FRAME_FORMATS:
+# - "rgb24", "rgba": shape (h, w, 3 / 4)
+# - "yuv420": shape (h * 3 / 2, w), the Y plane in the first h rows, below it the U plane (h / 2 x w / 2)
+#   in the left half and the V plane in the right half (as rendered by util.readback.YUV420Conversion)
+# A SegmentedSink splits a recording into several files (segments), rotated after some time or size.
+
+import os
+import subprocess
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+from PIL import Image
+
+FRAME_FORMATS = ["rgb24", "rgba", "yuv420"]
+# presets of ffmpeg's x264/x265 encoders
+PRESETS = ["ultrafast", "superfast", "veryfast", "faster", "fast", "medium", "slow", "slower", "veryslow"]
+
+def frame_shape(size, format):
+    w, h = size
+    if format == "yuv420":
+        return (h * 3 // 2, w)
+    return (h, w, 3 if format == "rgb24" else 4)
+
+def even_size(size):
+    # yuv420 frames have chroma for each 2x2 pixels
+    w, h = size
+    return max(2, w - w % 2), max(2, h - h % 2)
+
+def crop_to_even(frame):
+    # crops a rgb24 / rgba frame to even_size (the last column / row of odd sizes), for encoding it as yuv420
+    h, w = frame.shape[:2]
+    w, h = even_size((w, h))
+    return frame[:h, :w]
+
+def yuv420_planes(frame, size):
+    # returns the Y, U, V planes of a yuv420 frame (views, U and V aren't contiguous)
+    w, h = size
+    chroma = frame[h:]
+    return frame[:h], chroma[:, :w // 2], chroma[:, w // 2:]
+
+def rgb_to_yuv420(rgb):
+    # converts a rgb24 / rgba frame (of even size) to a yuv420 frame, BT.601 limited range like the GPU conversion
+    h, w = rgb.shape[:2]
+    rgb = rgb[:, :, :3].astype(np.float32) / 255.0
+    r, g, b = rgb[:, :, 0], rgb[:, :, 1], rgb[:, :, 2]
+    frame = np.empty((h * 3 // 2, w), dtype=np.uint8)
+    frame[:h] = np.clip(16.0 + 65.481 * r + 128.553 * g + 24.966 * b + 0.5, 0, 255)
+    # chroma of the average of each 2x2 pixels
+    block = rgb.reshape(h // 2, 2, w // 2, 2, 3).mean(axis=(1, 3))
+    r, g, b = block[:, :, 0], block[:, :, 1], block[:, :, 2]
+    frame[h:, :w // 2] = np.clip(128.0 - 37.797 * r - 74.203 * g + 112.0 * b + 0.5, 0, 255)
+    frame[h:, w // 2:] = np.clip(128.0 + 112.0 * r - 93.786 * g - 18.214 * b + 0.5, 0, 255)
+    return frame
+
+def yuv420_to_rgb(frame, size):
+    # inverse of rgb_to_yuv420 (for sinks writing rgb images)
+    y, u, v = yuv420_planes(frame, size)
+    y = (y.astype(np.float32) - 16.0) / 219.0
+    u = np.repeat(np.repeat((u.astype(np.float32) - 128.0) / 224.0, 2, axis=0), 2, axis=1)
+    v = np.repeat(np.repeat((v.astype(np.float32) - 128.0) / 224.0, 2, axis=0), 2, axis=1)
+    rgb = np.stack([y + 1.402 * v, y - 0.344136 * u - 0.714136 * v, y + 1.772 * u], axis=2)
+    return np.clip(rgb * 255.0 + 0.5, 0, 255).astype(np.uint8)
+
+class Sink:
+    # writes frames of one size and format to path
+    EXTENSION = ""
+    # frame formats the sink takes, the first one is preferred
+    FORMATS = FRAME_FORMATS
+
+    def __init__(self, path, size, fps, format):
+        if format not in self.FORMATS:
+            raise ValueError("Sink %s doesn't take %s frames" % (type(self).__name__, format))
+        self.path = path
+        self.size = size
+        self.fps = fps
+        self.format = format
+        self.frames = 0
+
+    @property
+    def output_bytes(self):
+        # size of the output so far
+        return os.path.getsize(self.path) if os.path.isfile(self.path) else 0
+
+    def write(self, frame):
+        self._write(frame)
+        self.frames += 1
+
+    def _write(self, frame):
+        pass
+
+    def close(self):
+        pass
+
+class RawSink(Sink):
+    # frames as they are, one after another
+    EXTENSION = ".raw"
+    FORMATS = ["rgba", "rgb24", "yuv420"]
+
+    def __init__(self, path, size, fps, format):
+        super().__init__(path, size, fps, format)
+
+        self._file = open(path, "wb")
+        self._bytes = 0
+
+    @property
+    def output_bytes(self):
+        return self._bytes
+
+    def _write(self, frame):
+        self._file.write(frame)
+        self._bytes += frame.nbytes
+
+    def close(self):
+        self._file.close()
+
+class Y4MSink(Sink):
+    # YUV4MPEG2 (readable by ffmpeg, mpv...), rgb frames are converted on the CPU
+    # (and cropped to even_size, like the frames converted on the GPU)
+    EXTENSION = ".y4m"
+    FORMATS = ["yuv420", "rgb24", "rgba"]
+
+    def __init__(self, path, size, fps, format):
+        super().__init__(path, size, fps, format)
+
+        self._file = open(path, "wb")
+        self._yuv_size = even_size(size)
+        w, h = self._yuv_size
+        rate = "%d:1000" % round(fps * 1000) if fps != int(fps) else "%d:1" % fps
+        header = "YUV4MPEG2 W%d H%d F%s Ip A1:1 C420jpeg\n" % (w, h, rate)
+        self._file.write(header.encode("ascii"))
+        self._bytes = len(header)
+
+    @property
+    def output_bytes(self):
+        return self._bytes
+
+    def _write(self, frame):
+        if self.format != "yuv420":
+            frame = rgb_to_yuv420(crop_to_even(frame))
+        self._file.write(b"FRAME\n")
+        self._bytes += 6
+        for plane in yuv420_planes(frame, self._yuv_size):
+            self._file.write(np.ascontiguousarray(plane))
+            self._bytes += plane.nbytes
+
+    def close(self):
+        self._file.close()
+
+class FFMPEGSink(Sink):
+    # encodes with an ffmpeg process, frames are written to its stdin
+    # (rgb frames are cropped to even_size, the encoded frames are yuv420)
+    EXTENSION = ".mp4"
+    FORMATS = ["yuv420", "rgb24", "rgba"]
+    PIX_FMTS = {"rgb24" : "rgb24", "rgba" : "rgba", "yuv420" : "yuv420p"}
+
+    def __init__(self, path, size, fps, format, codec="libx264", preset="medium", args=()):
+        super().__init__(path, size, fps, format)
+
+        w, h = even_size(size)
+        self._crop = (w, h) != tuple(size)
+        command = [
+            "ffmpeg",
+            "-y",
+            "-loglevel", "error",
+            "-f", "rawvideo",
+            "-vcodec", "rawvideo",
+            "-s", "%dx%d" % (w, h),
+            "-pix_fmt", self.PIX_FMTS[format],
+            "-r", str(fps),
+            "-i", "-",
+            "-an",
+            "-c:v", codec,
+        ]
+        if preset:
+            command.extend(["-preset", preset])
+        # (most players support only yuv420p)
+        command.extend(["-pix_fmt", "yuv420p"])
+        command.extend(args)
+        command.append(path)
+        self._process = subprocess.Popen(command, stdin=subprocess.PIPE, bufsize=-1)
+
+    def _write(self, frame):
+        if self.format == "yuv420":
+            for plane in yuv420_planes(frame, self.size):
+                self._process.stdin.write(np.ascontiguousarray(plane))
+        elif self._crop:
+            self._process.stdin.write(np.ascontiguousarray(crop_to_even(frame)))
+        else:
+            self._process.stdin.write(frame)
+
+    def close(self):
+        self._process.stdin.close()
+        self._process.wait()
+
+def _save_png(path, frame, compress_level):
+    Image.fromarray(frame).save(path, compress_level=compress_level)
+    return os.path.getsize(path)
+
+class PNGSequenceSink(Sink):
+    # one png per frame in the directory path, compressed by a pool of processes
+    EXTENSION = ""
+    FORMATS = ["rgb24", "rgba", "yuv420"]
+
+    def __init__(self, path, size, fps, format, processes=None, compress_level=1):
+        super().__init__(path, size, fps, format)
+
+        os.makedirs(path, exist_ok=True)
+        self.compress_level = compress_level
+        processes = processes or os.cpu_count() or 1
+        self._pool = ProcessPoolExecutor(max_workers=processes)
+        self._max_pending = 2 * processes
+        self._pending = deque()
+        self._bytes = 0
+
+    @property
+    def output_bytes(self):
+        return self._bytes
+
+    def _wait(self, count):
+        # waits until at most count frames are pending
+        while len(self._pending) > count:
+            self._bytes += self._pending.popleft().result()
+
+    def _write(self, frame):
+        if self.format == "yuv420":
+            frame = yuv420_to_rgb(frame, self.size)
+        else:
+            # (the frame is released after writing, the process gets a copy)
+            frame = np.array(frame)
+        self._wait(self._max_pending - 1)
+        path = os.path.join(self.path, "%06d.png" % self.frames)
+        self._pending.append(self._pool.submit(_save_png, path, frame, self.compress_level))
+
+    def close(self):
+        self._wait(0)
+        self._pool.shutdown()
+
+SINKS = {
+    "ffmpeg" : FFMPEGSink,
+    "y4m" : Y4MSink,
+    "raw" : RawSink,
+    "png" : PNGSequenceSink,
+}
+
+def create_sink(backend, path, size, fps, format, **options):
+    return SINKS[backend](path, size, fps, format, **options)
+
+class SegmentedSink:
+    # Writes to a new sink (segment) whenever the current one has max_seconds of frames or max_bytes of output
+    # (disabled if 0). Segments are named base_000.ext, base_001.ext... or base.ext if there is only one.
+    def __init__(self, backend, path, size, fps, format, max_seconds=0.0, max_bytes=0, **options):
+        self.backend = backend
+        self.size = size
+        self.fps = fps
+        self.format = format
+        self.max_seconds = max_seconds
+        self.max_bytes = max_bytes
+        self.options = options
+        self._base, self._extension = os.path.splitext(path)
+        if not self._extension:
+            self._extension = SINKS[backend].EXTENSION
+
+        self.paths = []
+        self.frames = 0
+        self._sink = None
+        self._segmented = max_seconds > 0.0 or max_bytes > 0
+
+    def _segment_path(self, index):
+        if not self._segmented:
+            return self._base + self._extension
+        return "%s_%03d%s" % (self._base, index, self._extension)
+
+    def _rotate(self):
+        if self._sink is not None:
+            self._sink.close()
+        path = self._segment_path(len(self.paths))
+        self._sink = create_sink(self.backend, path, self.size, self.fps, self.format, **self.options)
+        self.paths.append(path)
+
+    def write(self, frame):
+        sink = self._sink
+        if sink is None or (self.max_seconds > 0.0 and sink.frames >= self.max_seconds * self.fps) \
+                or (self.max_bytes > 0 and sink.output_bytes >= self.max_bytes):
+            self._rotate()
+        self._sink.write(frame)
+        self.frames += 1
+
+    def close(self):
+        if self._sink is not None:
+            self._sink.close()
+            self._sink = None
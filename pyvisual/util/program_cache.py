@@ -0,0 +1,285 @@
+# Process wide cache of linked shader programs (used by shader nodes, see node.op.gpu.base.BaseShader).
+# Programs are keyed by a hash of their complete sources (with #include's resolved and all #define's), nodes
+# with the same sources (40 instances of a filter for example) share one OpenGL program. Each node still has its
+# own uniform values: a CachedProgram uploads all of its uniforms again if another node has used the program since.
+# Programs that aren't used anymore are kept for a while (switching back to a scene doesn't compile them again).
+# Linked programs are saved as program binaries (glGetProgramBinary) in PROGRAM_CACHE_PATH and loaded from there
+# in later runs instead of compiling them (binaries are stored per driver, binaries the driver rejects are ignored).
+# Compilation is asynchronous if the driver supports KHR_parallel_shader_compile: compiling and linking is only
+# started and the program is polled each frame (see CachedProgram.poll) until the driver's threads have finished.
+# Otherwise polling waits for the driver.
+
+import collections
+import hashlib
+import os
+
+import numpy as np
+from glumpy import gl, gloo
+from OpenGL.GL.KHR import parallel_shader_compile
+
+from pyvisual import assets
+
+# unused programs that are kept linked
+KEEP_UNUSED = 64
+
+COMPILING = "compiling"
+LINKED = "linked"
+FAILED = "failed"
+
+def program_key(vertex, fragment):
+    # sources as they are compiled (with #version line)
+    h = hashlib.sha1()
+    for source in (vertex, fragment):
+        h.update(source.encode("utf-8"))
+        h.update(b"\0")
+    return h.hexdigest()
+
+def _get_program(handle, pname):
+    value = np.zeros(1, dtype=np.int32)
+    gl.glGetProgramiv(handle, pname, value)
+    return int(value[0])
+
+def _info_log(log):
+    return log.decode(errors="replace").strip() if isinstance(log, bytes) else str(log).strip()
+
+class _Entry:
+    def __init__(self, key):
+        self.key = key
+        self.handle = 0
+        self.shaders = []
+        self.status = COMPILING
+        self.error = None
+        # number of CachedProgram's using it
+        self.users = 0
+        # program whose uniform values are set in the OpenGL program at the moment
+        self.owner = None
+
+class ProgramCache:
+    def __init__(self, path=assets.PROGRAM_CACHE_PATH, keep_unused=KEEP_UNUSED):
+        # directory for program binaries (None to not save them)
+        self.path = path
+        self.keep_unused = keep_unused
+        self._entries = {}
+        # linked programs without users, least recently used first
+        self._unused = collections.OrderedDict()
+        # set with the first program (requires the OpenGL context)
+        self._parallel = None
+        self._binary_path = None
+
+        # programs compiled / loaded from program binaries / taken from the cache
+        self.compiled = 0
+        self.loaded = 0
+        self.hits = 0
+
+    @property
+    def parallel(self):
+        return bool(self._parallel)
+
+    @property
+    def program_count(self):
+        return len(self._entries)
+
+    def _init_context(self):
+        if self._parallel is not None:
+            return
+        self._parallel = bool(parallel_shader_compile.glInitParallelShaderCompileKHR())
+        if self._parallel:
+            # as many compiler threads as the driver likes
+            parallel_shader_compile.glMaxShaderCompilerThreadsKHR(0xFFFFFFFF)
+        if self.path and gl.glGetProgramBinary and int(gl.glGetIntegerv(gl.GL_NUM_PROGRAM_BINARY_FORMATS)) > 0:
+            driver = "\n".join(_info_log(gl.glGetString(name)) for name in (gl.GL_VENDOR, gl.GL_RENDERER, gl.GL_VERSION))
+            self._binary_path = os.path.join(self.path, hashlib.sha1(driver.encode("utf-8")).hexdigest()[:16])
+
+    def acquire(self, key, vertex, fragment):
+        # returns the entry of the program with the sources (starting to compile it if it's not cached),
+        # must be released again
+        self._init_context()
+        entry = self._entries.get(key)
+        if entry is None:
+            entry = _Entry(key)
+            try:
+                self._compile(entry, vertex, fragment)
+            except Exception:
+                self._delete(entry)
+                raise
+            self._entries[key] = entry
+        else:
+            self.hits += 1
+            self._unused.pop(key, None)
+        entry.users += 1
+        return entry
+
+    def release(self, entry):
+        entry.users -= 1
+        if entry.users > 0:
+            return
+        if entry.status == FAILED:
+            # (the sources are edited probably)
+            self._delete(entry)
+            return
+        self._unused[entry.key] = entry
+        while len(self._unused) > self.keep_unused:
+            _, unused = self._unused.popitem(last=False)
+            self._delete(unused)
+
+    def _compile(self, entry, vertex, fragment):
+        entry.handle = gl.glCreateProgram()
+        if self._load_binary(entry):
+            self.loaded += 1
+            return
+
+        # compile and link without asking for the status, that would wait for the compiler
+        for target, source in ((gl.GL_VERTEX_SHADER, vertex), (gl.GL_FRAGMENT_SHADER, fragment)):
+            shader = gl.glCreateShader(target)
+            gl.glShaderSource(shader, source)
+            gl.glCompileShader(shader)
+            gl.glAttachShader(entry.handle, shader)
+            entry.shaders.append(shader)
+        if self._binary_path is not None:
+            gl.glProgramParameteri(entry.handle, gl.GL_PROGRAM_BINARY_RETRIEVABLE_HINT, gl.GL_TRUE)
+        gl.glLinkProgram(entry.handle)
+        self.compiled += 1
+
+    def poll(self, entry, wait=False):
+        # returns whether the program has been linked or failed (see entry.error)
+        if entry.status != COMPILING:
+            return True
+        if self._parallel and not wait and not _get_program(entry.handle, parallel_shader_compile.GL_COMPLETION_STATUS_KHR):
+            return False
+
+        if _get_program(entry.handle, gl.GL_LINK_STATUS):
+            entry.status = LINKED
+            self._save_binary(entry)
+        else:
+            entry.status = FAILED
+            errors = []
+            for shader in entry.shaders:
+                if not gl.glGetShaderiv(shader, gl.GL_COMPILE_STATUS):
+                    errors.append(_info_log(gl.glGetShaderInfoLog(shader)))
+            errors.append(_info_log(gl.glGetProgramInfoLog(entry.handle)))
+            entry.error = "\n".join([ error for error in errors if error ]) or "Linking error"
+            print("### Warning: Couldn't compile shader program:\n%s" % entry.error)
+        for shader in entry.shaders:
+            gl.glDetachShader(entry.handle, shader)
+            gl.glDeleteShader(shader)
+        entry.shaders = []
+        return True
+
+    def _binary_file(self, key):
+        if self._binary_path is None:
+            return None
+        return os.path.join(self._binary_path, key + ".bin")
+
+    def _load_binary(self, entry):
+        path = self._binary_file(entry.key)
+        if path is None or not os.path.isfile(path):
+            return False
+        try:
+            data = open(path, "rb").read()
+            binary_format = int.from_bytes(data[:4], "little")
+            binary = np.frombuffer(data, dtype=np.uint8, offset=4)
+            gl.glProgramBinary(entry.handle, binary_format, binary, len(binary))
+        except Exception as e:
+            print("### Warning: Couldn't load program binary %s: %s" % (path, e))
+            return False
+        if not _get_program(entry.handle, gl.GL_LINK_STATUS):
+            # (the driver has been updated for example, compiled and saved again)
+            return False
+        entry.status = LINKED
+        return True
+
+    def _save_binary(self, entry):
+        path = self._binary_file(entry.key)
+        if path is None:
+            return
+        try:
+            length = _get_program(entry.handle, gl.GL_PROGRAM_BINARY_LENGTH)
+            if length <= 0:
+                return
+            binary = np.zeros(length, dtype=np.uint8)
+            binary_format = np.zeros(1, dtype=np.uint32)
+            written = np.zeros(1, dtype=np.int32)
+            gl.glGetProgramBinary(entry.handle, length, written, binary_format, binary)
+            os.makedirs(self._binary_path, exist_ok=True)
+            # (written completely or not at all, several processes might share the directory)
+            temp_path = "%s.%d.tmp" % (path, os.getpid())
+            with open(temp_path, "wb") as f:
+                f.write(int(binary_format[0]).to_bytes(4, "little"))
+                f.write(binary[:int(written[0])].tobytes())
+            os.replace(temp_path, path)
+        except Exception as e:
+            print("### Warning: Couldn't save program binary %s: %s" % (path, e))
+
+    def _delete(self, entry):
+        self._unused.pop(entry.key, None)
+        if self._entries.get(entry.key) is entry:
+            del self._entries[entry.key]
+        for shader in entry.shaders:
+            gl.glDeleteShader(shader)
+        entry.shaders = []
+        if entry.handle:
+            gl.glDeleteProgram(entry.handle)
+            entry.handle = 0
+
+    def clear(self):
+        # deletes the programs that aren't used
+        for entry in list(self._unused.values()):
+            self._delete(entry)
+
+program_cache = ProgramCache()
+
+class CachedProgram(gloo.Program):
+    # gloo.Program with its OpenGL program from a ProgramCache. compile() starts compiling (or takes the cached
+    # program), poll() tells when it's done. If it's activated (drawn) before, it waits for the compiler.
+    def __init__(self, vertex, fragment, version="430", count=0, cache=None):
+        super().__init__(vertex, fragment, version=version, count=count)
+
+        self._cache = cache if cache is not None else program_cache
+        # (like gloo.Shader compiles them)
+        self._sources = tuple("#version %s\n" % version + shader.code for shader in (self._vertex, self._fragment))
+        self.key = program_key(*self._sources)
+        self._entry = None
+
+    def compile(self):
+        # requires the OpenGL context
+        if self._entry is None:
+            self._entry = self._cache.acquire(self.key, *self._sources)
+
+    def poll(self, wait=False):
+        # returns whether the program is linked or failed (see error)
+        self.compile()
+        return self._cache.poll(self._entry, wait)
+
+    @property
+    def error(self):
+        return self._entry.error if self._entry is not None else None
+
+    def _create(self):
+        self.poll(wait=True)
+        if self._entry.status == FAILED:
+            raise assets.ShaderError(self._entry.error)
+        self._handle = self._entry.handle
+
+        # (like gloo.Program)
+        active_uniforms = [ name for name, gtype in self.active_uniforms ]
+        for uniform in self._uniforms.values():
+            uniform.active = uniform.name in active_uniforms
+        active_attributes = [ name for name, gtype in self.active_attributes ]
+        for attribute in self._attributes.values():
+            attribute.active = attribute.name in active_attributes
+
+    def _activate(self):
+        if self._entry.owner is not self:
+            # another program with the same OpenGL program has set its uniform values in the meantime
+            for uniform in self._uniforms.values():
+                uniform._need_update = True
+            self._entry.owner = self
+        super()._activate()
+
+    def _delete(self):
+        # the OpenGL program is deleted by the cache
+        if self._entry is not None:
+            if self._entry.owner is self:
+                self._entry.owner = None
+            self._cache.release(self._entry)
+            self._entry = None
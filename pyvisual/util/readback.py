@@ -0,0 +1,294 @@
+# Asynchronous download of textures (video recording) with a ring of pixel buffer objects.
+# A frame is read into a free buffer with glGetTexImage, which returns right away, and a fence is inserted
+# after it. Once the GPU has passed the fence the buffer is mapped and the frame is passed on as a numpy
+# array on the mapped memory (no copies), usually to a FrameWriter thread. The buffer is unmapped and reused
+# after the consumer has released the frame. If there is no free buffer (the GPU or the consumer is
+# behind), the frame is dropped instead of stalling the render thread.
+# Frames can be converted to yuv420 on the GPU before (see YUV420Conversion), which downloads
+# 1.5 instead of 4 (rgba) or 3 (rgb) bytes per pixel.
+
+import ctypes
+import queue
+import threading
+import traceback
+
+import numpy as np
+from glumpy import gl, gloo
+
+from pyvisual import assets
+from pyvisual.util import encoder
+
+# buffers of a readback ring (one the GPU writes into, one waiting for its fence, one being consumed)
+READBACK_COUNT = 3
+# seconds to wait for the GPU when flushing
+FLUSH_TIMEOUT = 1.0
+
+# channels by pixel format of downloaded frames
+CHANNELS = {
+    gl.GL_RED : 1,
+    gl.GL_RGB : 3,
+    gl.GL_RGBA : 4,
+}
+
+class ReadbackFrame:
+    # frame downloaded into a pixel buffer, data is valid until the frame is released
+    def __init__(self, readback, slot, data, index):
+        self._readback = readback
+        self._slot = slot
+        self.data = data
+        # number of the frame (counting dropped frames as well)
+        self.index = index
+
+    def release(self):
+        # may be called from any thread, the buffer is unmapped with the next read of the readback
+        if self._slot is not None:
+            self._readback._released.put(self._slot)
+            self._slot = None
+            self.data = None
+
+class _Slot:
+    def __init__(self, pbo):
+        self.pbo = pbo
+        self.fence = None
+        self.shape = None
+        self.index = 0
+        self.mapped = False
+
+class TextureReadback:
+    def __init__(self, count=READBACK_COUNT, format=gl.GL_RGB):
+        self.count = count
+        self.format = format
+        self.channels = CHANNELS[format]
+        self._slots = None
+        self._free = []
+        # slots with a download in flight, in order
+        self._pending = []
+        # slots released by consumers (possibly from other threads)
+        self._released = queue.SimpleQueue()
+        self._nbytes = 0
+
+        # frames passed to read / dropped because no buffer was free
+        self.frames = 0
+        self.dropped = 0
+
+    def _allocate(self, nbytes):
+        self._delete_buffers()
+        self._slots = [ _Slot(pbo) for pbo in np.ravel(gl.glGenBuffers(self.count)).tolist() ]
+        for slot in self._slots:
+            gl.glBindBuffer(gl.GL_PIXEL_PACK_BUFFER, slot.pbo)
+            gl.glBufferData(gl.GL_PIXEL_PACK_BUFFER, nbytes, None, gl.GL_STREAM_READ)
+        gl.glBindBuffer(gl.GL_PIXEL_PACK_BUFFER, 0)
+        self._free = list(self._slots)
+        self._nbytes = nbytes
+
+    def _collect(self):
+        # unmaps the buffers of released frames
+        while True:
+            try:
+                slot = self._released.get_nowait()
+            except queue.Empty:
+                break
+            if slot.mapped:
+                gl.glBindBuffer(gl.GL_PIXEL_PACK_BUFFER, slot.pbo)
+                gl.glUnmapBuffer(gl.GL_PIXEL_PACK_BUFFER)
+                gl.glBindBuffer(gl.GL_PIXEL_PACK_BUFFER, 0)
+                slot.mapped = False
+            if slot.pbo is not None:
+                self._free.append(slot)
+
+    def _map(self, slot):
+        gl.glDeleteSync(slot.fence)
+        slot.fence = None
+        h, w, c = slot.shape
+        gl.glBindBuffer(gl.GL_PIXEL_PACK_BUFFER, slot.pbo)
+        ptr = gl.glMapBufferRange(gl.GL_PIXEL_PACK_BUFFER, 0, h * w * c, gl.GL_MAP_READ_BIT)
+        gl.glBindBuffer(gl.GL_PIXEL_PACK_BUFFER, 0)
+        if not ptr:
+            print("### Warning: Couldn't map pixel buffer, dropping frame %d" % slot.index)
+            self.dropped += 1
+            self._free.append(slot)
+            return None
+        slot.mapped = True
+        p = ctypes.cast(ptr, ctypes.POINTER(ctypes.c_ubyte * (h * w * c)))
+        data = np.frombuffer(p.contents, dtype=np.uint8).reshape((h, w, c))
+        return ReadbackFrame(self, slot, data, slot.index)
+
+    def _finished(self, wait):
+        # returns the frames of downloads the GPU has finished (in order)
+        frames = []
+        timeout = int(FLUSH_TIMEOUT * 1e9) if wait else 0
+        while self._pending:
+            slot = self._pending[0]
+            result = gl.glClientWaitSync(slot.fence, gl.GL_SYNC_FLUSH_COMMANDS_BIT, timeout)
+            if result not in (gl.GL_ALREADY_SIGNALED, gl.GL_CONDITION_SATISFIED):
+                if not wait:
+                    break
+                print("### Warning: Timeout waiting for pixel buffer, dropping frame %d" % slot.index)
+                self.dropped += 1
+                gl.glDeleteSync(slot.fence)
+                slot.fence = None
+                self._pending.pop(0)
+                self._free.append(slot)
+                continue
+            self._pending.pop(0)
+            frame = self._map(slot)
+            if frame is not None:
+                frames.append(frame)
+        return frames
+
+    def read(self, texture):
+        # starts downloading the texture, returns the frames (ReadbackFrame) of earlier downloads that are ready now
+        # (the caller must release them, before the texture size changes)
+        index = self.frames
+        self.frames += 1
+        h, w = texture.shape[:2]
+        nbytes = h * w * self.channels
+        if self._slots is None or nbytes != self._nbytes:
+            # (frames of the old size are dropped)
+            self._allocate(nbytes)
+
+        self._collect()
+        frames = self._finished(wait=False)
+        if not self._free:
+            self.dropped += 1
+            return frames
+
+        slot = self._free.pop()
+        slot.shape = (h, w, self.channels)
+        slot.index = index
+        gl.glBindBuffer(gl.GL_PIXEL_PACK_BUFFER, slot.pbo)
+        gl.glPixelStorei(gl.GL_PACK_ALIGNMENT, 1)
+        gl.glBindTexture(gl.GL_TEXTURE_2D, texture.handle)
+        gl.glGetTexImage(gl.GL_TEXTURE_2D, 0, self.format, gl.GL_UNSIGNED_BYTE, ctypes.c_void_p(0))
+        gl.glBindTexture(gl.GL_TEXTURE_2D, 0)
+        gl.glPixelStorei(gl.GL_PACK_ALIGNMENT, 4)
+        gl.glBindBuffer(gl.GL_PIXEL_PACK_BUFFER, 0)
+        slot.fence = gl.glFenceSync(gl.GL_SYNC_GPU_COMMANDS_COMPLETE, 0)
+        self._pending.append(slot)
+        return frames
+
+    def flush(self):
+        # waits for all downloads in flight, returns their frames
+        self._collect()
+        return self._finished(wait=True)
+
+    def _delete_buffers(self):
+        if self._slots is None:
+            return
+        self._collect()
+        pbos = [ slot.pbo for slot in self._slots ]
+        for slot in self._slots:
+            if slot.fence is not None:
+                gl.glDeleteSync(slot.fence)
+                slot.fence = None
+            if slot.mapped:
+                # (frames that are still used can't be unmapped, the buffer is deleted anyways)
+                print("### Warning: Deleting pixel buffer of unreleased frame %d" % slot.index)
+                gl.glBindBuffer(gl.GL_PIXEL_PACK_BUFFER, slot.pbo)
+                gl.glUnmapBuffer(gl.GL_PIXEL_PACK_BUFFER)
+                slot.mapped = False
+            # (released later on, but not reused)
+            slot.pbo = None
+        gl.glBindBuffer(gl.GL_PIXEL_PACK_BUFFER, 0)
+        gl.glDeleteBuffers(len(pbos), np.array(pbos, dtype=np.uint32))
+        self._slots = None
+        self._free = []
+        self._pending = []
+
+    def delete(self):
+        # releases the pixel buffers (requires the OpenGL context), frames must be released before
+        self._delete_buffers()
+
+class FrameWriter(threading.Thread):
+    # Writes frames (ReadbackFrame) with a write function (stdin of an encoder process for example) in a thread
+    # and releases them. Frames are queued in a bounded queue, frames that don't fit are dropped.
+    def __init__(self, write, max_queued=READBACK_COUNT):
+        super().__init__(name="FrameWriter", daemon=True)
+
+        self._write = write
+        self._queue = queue.Queue(maxsize=max_queued)
+
+        self.written = 0
+        self.dropped = 0
+        self.max_queue_depth = 0
+        # exception of the last write that failed, frames aren't written anymore then
+        self.error = None
+
+    @property
+    def queue_depth(self):
+        return self._queue.qsize()
+
+    def put(self, frame):
+        if self.error is not None:
+            frame.release()
+            self.dropped += 1
+            return
+        try:
+            self._queue.put_nowait(frame)
+        except queue.Full:
+            frame.release()
+            self.dropped += 1
+            return
+        self.max_queue_depth = max(self.max_queue_depth, self._queue.qsize())
+
+    def run(self):
+        while True:
+            frame = self._queue.get()
+            if frame is None:
+                break
+            try:
+                if self.error is None:
+                    self._write(frame.data)
+                    self.written += 1
+            except Exception as e:
+                traceback.print_exc()
+                self.error = e
+            finally:
+                frame.release()
+
+    def stop(self):
+        # writes the queued frames and waits until they are written
+        self._queue.put(None)
+        self.join()
+
+class YUV420Conversion:
+    # Renders textures as yuv420 frames (see util.encoder) into a one channel texture, to be downloaded with
+    # TextureReadback(format=gl.GL_RED). Odd sizes are cropped to even sizes.
+    def __init__(self):
+        vertex = assets.load_shader(path="common/passthrough.vert")
+        fragment = assets.load_shader(path="common/yuv420.frag")
+        self._program = gloo.Program(vertex, fragment, count=4, version="130")
+        self._program["iPosition"] = [(-1,-1), (-1,+1), (+1,-1), (+1,+1)]
+        self._program["iTexCoord"] = [( 0, 1), ( 0, 0), ( 1, 1), ( 1, 0)]
+        self._program["uModelViewProjection"] = np.eye(4, dtype=np.float32)
+        self._program["uTextureSize"] = np.float32([1.0, 1.0])
+        self._program["uTransformUV"] = np.eye(4, dtype=np.float32)
+        self._fbo = None
+        self.size = None
+
+    def convert(self, texture):
+        # returns the texture with the converted frame (the same texture object while the size stays the same)
+        h, w = texture.shape[:2]
+        size = encoder.even_size((w, h))
+        fh, fw = encoder.frame_shape(size, "yuv420")
+        if self._fbo is None or self.size != size:
+            self.delete()
+            target = np.zeros((fh, fw, 1), dtype=np.uint8).view(gloo.Texture2D)
+            target._pending_data = None
+            self._fbo = gloo.FrameBuffer(color=[target])
+            self.size = size
+
+        self._fbo.activate()
+        gl.glViewport(0, 0, fw, fh)
+        self._program["uInputTexture"] = texture
+        self._program["uSize"] = np.int32(size)
+        self._program.draw(gl.GL_TRIANGLE_STRIP)
+        self._fbo.deactivate()
+        return self._fbo.color[0]
+
+    def delete(self):
+        if self._fbo is not None:
+            self._fbo.color[0].delete()
+            self._fbo.delete()
+            self._fbo = None
+            self.size = None
@@ -0,0 +1,307 @@
+# Render targets (framebuffers with one color texture) of render nodes.
+# Targets can be recycled through a RenderTargetPool: a graph that pools render targets
+# (see Graph.pool_render_targets) returns the target of a node to the pool after the last node
+# reading it has been evaluated, and the next node rendering with the same size and format reuses it.
+# Textures are snapshotted (HoldTexture, DelayTexture...) by copying them on the GPU into render targets
+# of snapshot_pool, see TextureSnapshot.
+# The last frames of a texture (TextureHistory) are copied into the layers of a 3d texture, see FrameHistory.
+
+import numpy as np
+from glumpy import gl, gloo
+# (3d textures aren't exported by gloo)
+from glumpy.gloo.texture import Texture3D, TextureFloat3D
+
+# frames that a free target stays in the pool before it's deleted
+KEEP_FRAMES = 60
+
+# texture data type and class by format
+FORMATS = {
+    "rgba8" : (np.uint8, gloo.Texture2D),
+    "rgba32f" : (np.float32, gloo.TextureFloat2D),
+}
+
+# 3d texture data type and class by format (frame histories)
+LAYERED_FORMATS = {
+    "rgba8" : (np.uint8, Texture3D),
+    "rgba32f" : (np.float32, TextureFloat3D),
+}
+
+def create_fbo(size, format="rgba8"):
+    w, h = size
+    dtype, texture_type = FORMATS[format]
+    # zeros are allocated lazily and never touched, the texture is allocated on the GPU
+    # without uploading any data (render nodes clear their target anyways)
+    texture = np.zeros((h, w, 4), dtype=dtype).view(texture_type)
+    texture._pending_data = None
+    return gloo.FrameBuffer(color=[texture])
+
+def fbo_size(fbo):
+    h, w, _ = fbo.color[0].shape
+    return w, h
+
+def fbo_format(fbo):
+    return texture_format(fbo.color[0])
+
+def texture_size(texture):
+    h, w = texture.shape[:2]
+    return w, h
+
+def texture_format(texture):
+    # format of render targets the texture can be copied to without conversion, None if there is none
+    if texture.ndim != 3 or texture.shape[2] != 4:
+        return None
+    for format, (dtype, texture_type) in FORMATS.items():
+        if texture.dtype == dtype:
+            return format
+    return None
+
+def create_layered_texture(size, depth, format="rgba8"):
+    w, h = size
+    dtype, texture_type = LAYERED_FORMATS[format]
+    # (allocated on the GPU only, like textures of render targets)
+    texture = np.zeros((depth, h, w, 4), dtype=dtype).view(texture_type)
+    texture._pending_data = None
+    return texture
+
+def layered_texture_format(texture):
+    for format, (dtype, texture_type) in LAYERED_FORMATS.items():
+        if texture.dtype == dtype:
+            return format
+    return None
+
+def fbo_bytes(fbo):
+    return fbo.color[0].nbytes
+
+# textures shown by the editor (texture widgets), these must not be recycled
+_previews = {}
+
+def set_preview(owner, texture):
+    if texture is None:
+        _previews.pop(id(owner), None)
+    else:
+        _previews[id(owner)] = texture
+
+def is_previewed(texture):
+    for preview in _previews.values():
+        if preview is texture:
+            return True
+    return False
+
+class RenderTargetPool:
+    def __init__(self, keep_frames=KEEP_FRAMES):
+        self.keep_frames = keep_frames
+        # (width, height, format) -> list of tuples (fbo, frame when it was released)
+        self._free = {}
+        self._frame = 0
+
+        self.allocated_bytes = 0
+        self.in_use_bytes = 0
+        self.peak_bytes = 0
+        self.allocations = 0
+        self.reuses = 0
+        self.releases = 0
+
+    def acquire(self, size, format="rgba8"):
+        free = self._free.get((size[0], size[1], format))
+        if free:
+            fbo, _ = free.pop()
+            self.reuses += 1
+        else:
+            fbo = create_fbo(size, format)
+            self.allocations += 1
+            self.allocated_bytes += fbo_bytes(fbo)
+            self.peak_bytes = max(self.peak_bytes, self.allocated_bytes)
+        self.in_use_bytes += fbo_bytes(fbo)
+        return fbo
+
+    def release(self, fbo):
+        w, h = fbo_size(fbo)
+        self._free.setdefault((w, h, fbo_format(fbo)), []).append((fbo, self._frame))
+        self.in_use_bytes -= fbo_bytes(fbo)
+        self.releases += 1
+
+    def attach(self, fbo):
+        # accounts for a target in use that was created elsewhere
+        self.allocated_bytes += fbo_bytes(fbo)
+        self.in_use_bytes += fbo_bytes(fbo)
+        self.peak_bytes = max(self.peak_bytes, self.allocated_bytes)
+
+    def detach(self, fbo):
+        # a target in use won't be released to this pool
+        self.allocated_bytes -= fbo_bytes(fbo)
+        self.in_use_bytes -= fbo_bytes(fbo)
+
+    def end_frame(self):
+        # deletes targets that weren't used for a while (after resizing for example)
+        self._frame += 1
+        for key, free in list(self._free.items()):
+            keep = [ (fbo, frame) for fbo, frame in free if self._frame - frame <= self.keep_frames ]
+            for fbo, frame in free:
+                if self._frame - frame > self.keep_frames:
+                    self._delete(fbo)
+            if keep:
+                self._free[key] = keep
+            else:
+                del self._free[key]
+
+    def _delete(self, fbo):
+        self.allocated_bytes -= fbo_bytes(fbo)
+        fbo.color[0].delete()
+        fbo.delete()
+
+    def stats(self):
+        return {
+            "allocated MB" : self.allocated_bytes / 2**20,
+            "in use MB" : self.in_use_bytes / 2**20,
+            "peak MB" : self.peak_bytes / 2**20,
+            "allocations" : self.allocations,
+            "reuses" : self.reuses,
+            "releases" : self.releases,
+        }
+
+    def clear(self):
+        for free in self._free.values():
+            for fbo, frame in free:
+                self._delete(fbo)
+        self._free = {}
+
+# render targets of texture snapshots, freed targets are deleted by the root graph (see Graph.evaluate)
+snapshot_pool = RenderTargetPool()
+
+# whether glCopyImageSubData (OpenGL 4.3) works, checked on first use
+_copy_image = None
+# framebuffers to read source textures from and to draw into layers of 3d textures with blits
+_read_framebuffer = None
+_draw_framebuffer = None
+
+def _ensure_on_gpu(texture):
+    # creates the texture (and uploads pending data) if that didn't happen yet
+    texture.activate()
+    texture.deactivate()
+
+def _can_copy_image():
+    global _copy_image
+    if _copy_image is None:
+        _copy_image = bool(gl.glCopyImageSubData)
+    return _copy_image
+
+def _blit(texture, size):
+    # blits (and scales) a texture into the bound draw framebuffer
+    global _read_framebuffer
+    if _read_framebuffer is None:
+        _read_framebuffer = gl.glGenFramebuffers(1)
+    gl.glBindFramebuffer(gl.GL_READ_FRAMEBUFFER, _read_framebuffer)
+    gl.glFramebufferTexture2D(gl.GL_READ_FRAMEBUFFER, gl.GL_COLOR_ATTACHMENT0, gl.GL_TEXTURE_2D, texture.handle, 0)
+    sw, sh = texture_size(texture)
+    gl.glBlitFramebuffer(0, 0, sw, sh, 0, 0, size[0], size[1], gl.GL_COLOR_BUFFER_BIT, gl.GL_LINEAR)
+    gl.glFramebufferTexture2D(gl.GL_READ_FRAMEBUFFER, gl.GL_COLOR_ATTACHMENT0, gl.GL_TEXTURE_2D, 0, 0)
+
+def copy_texture(texture, fbo):
+    # copies a texture into the color texture of a render target of the same size on the GPU,
+    # with glCopyImageSubData if the formats are the same, with a framebuffer blit otherwise
+    _ensure_on_gpu(texture)
+    target = fbo.color[0]
+    _ensure_on_gpu(target)
+    w, h = fbo_size(fbo)
+    if _can_copy_image() and texture_format(texture) == fbo_format(fbo):
+        gl.glCopyImageSubData(texture.handle, gl.GL_TEXTURE_2D, 0, 0, 0, 0,
+                target.handle, gl.GL_TEXTURE_2D, 0, 0, 0, 0, w, h, 1)
+        return
+
+    # (binds the target for reading and drawing)
+    fbo.activate()
+    _blit(texture, (w, h))
+    fbo.deactivate()
+
+def copy_texture_layer(texture, target, layer):
+    # copies a texture into a layer of a 3d texture on the GPU, scaled with a framebuffer blit
+    # if the size or format is different
+    global _draw_framebuffer
+    _ensure_on_gpu(texture)
+    _ensure_on_gpu(target)
+    _, h, w, _ = target.shape
+    if _can_copy_image() and texture_size(texture) == (w, h) and texture_format(texture) == layered_texture_format(target):
+        gl.glCopyImageSubData(texture.handle, gl.GL_TEXTURE_2D, 0, 0, 0, 0,
+                target.handle, gl.GL_TEXTURE_3D, 0, 0, 0, layer, w, h, 1)
+        return
+
+    if _draw_framebuffer is None:
+        _draw_framebuffer = gl.glGenFramebuffers(1)
+    gl.glBindFramebuffer(gl.GL_DRAW_FRAMEBUFFER, _draw_framebuffer)
+    gl.glFramebufferTextureLayer(gl.GL_DRAW_FRAMEBUFFER, gl.GL_COLOR_ATTACHMENT0, target.handle, 0, layer)
+    _blit(texture, (w, h))
+    gl.glFramebufferTextureLayer(gl.GL_DRAW_FRAMEBUFFER, gl.GL_COLOR_ATTACHMENT0, 0, 0, 0)
+    gl.glBindFramebuffer(gl.GL_FRAMEBUFFER, 0)
+
+class TextureSnapshot:
+    # Copy of a texture at some point in time, kept in a render target of a pool (snapshot_pool by default)
+    # that is reused while the size and format of the snapshotted textures stay the same.
+    def __init__(self, pool=None):
+        self.pool = pool if pool is not None else snapshot_pool
+        self._fbo = None
+
+    @property
+    def texture(self):
+        return self._fbo.color[0] if self._fbo is not None else None
+
+    def take(self, texture):
+        # copies the texture, returns the copy (the same texture object as with the last snapshot, if possible)
+        size = texture_size(texture)
+        format = texture_format(texture) or "rgba8"
+        if self._fbo is not None and (fbo_size(self._fbo) != size or fbo_format(self._fbo) != format):
+            self.release()
+        if self._fbo is None:
+            self._fbo = self.pool.acquire(size, format)
+        copy_texture(texture, self._fbo)
+        return self._fbo.color[0]
+
+    def release(self):
+        if self._fbo is not None:
+            self.pool.release(self._fbo)
+            self._fbo = None
+
+def history_size(size, max_size):
+    # size of the frames of a history, the longer side is scaled down to max_size
+    w, h = size
+    scale = min(1.0, max_size / max(w, h))
+    return max(1, int(round(w * scale))), max(1, int(round(h * scale)))
+
+class FrameHistory:
+    # The last frames of a texture in the layers of a 3d texture, used as a ring buffer:
+    # the newest frame is in layer index, the frame before in layer index - 1 (modulo depth) and so on.
+    # Frames are scaled down to max_size (see history_size), so the history takes depth * scaled size of memory.
+    def __init__(self):
+        self.texture = None
+        self.index = 0
+
+    @property
+    def depth(self):
+        return self.texture.shape[0] if self.texture is not None else 0
+
+    @property
+    def nbytes(self):
+        return self.texture.nbytes if self.texture is not None else 0
+
+    def push(self, texture, depth, max_size):
+        # copies the texture as newest frame, returns the 3d texture (the same object while the history isn't resized)
+        w, h = history_size(texture_size(texture), max_size)
+        format = texture_format(texture) or "rgba8"
+        if self.texture is not None and (self.texture.shape[:3] != (depth, h, w) or layered_texture_format(self.texture) != format):
+            self.release()
+        if self.texture is None:
+            self.texture = create_layered_texture((w, h), depth, format)
+            self.texture.interpolation = gl.GL_LINEAR
+            # the first frame is in all layers, so there are no empty frames
+            for layer in range(depth):
+                copy_texture_layer(texture, self.texture, layer)
+            self.index = 0
+        else:
+            self.index = (self.index + 1) % depth
+            copy_texture_layer(texture, self.texture, self.index)
+        return self.texture
+
+    def release(self):
+        if self.texture is not None:
+            self.texture.delete()
+            self.texture = None
+            self.index = 0
@@ -0,0 +1,383 @@
+# Loading of image files into textures in the background, and a cache of the loaded textures (LoadTexture, LoadTextures).
+# Images are decoded into numpy arrays by a pool of threads (PIL releases the GIL while decoding), the render
+# thread only uploads them: in slices of rows through a pixel buffer, at most upload_bytes per frame
+# (see TextureLoader.end_frame, called by the root graph after each frame). A request is done once its
+# texture is complete, nodes keep showing their previous texture until then.
+# Textures are cached by path and variant (downscaled to a maximum height, with mipmaps) and shared by all nodes
+# loading them. Each load must be released again, textures that aren't used anymore are kept until the cache
+# exceeds its budget of bytes, then the least recently used ones are deleted.
+# Images that are probably shown next can be prefetched (decoded and uploaded ahead into the cache).
+# Files of cached textures are watched (see watch.py), textures of changed files are loaded again by the next loads.
+# With a clock that isn't real time (offline rendering) loads wait for the texture, so frames don't depend on
+# how fast files are loaded.
+
+import collections
+import concurrent.futures
+import ctypes
+import os
+
+import numpy as np
+from PIL import Image
+from glumpy import gl, gloo
+
+from pyvisual import watch
+from pyvisual.util import time
+
+DECODE_THREADS = 2
+# bytes uploaded per frame (a 3840x2160 rgb image takes 4 frames, and one to allocate the texture)
+UPLOAD_BYTES_PER_FRAME = 8 * 2**20
+# bytes of cached textures, textures that aren't used are deleted above that
+CACHE_BYTES = 1024 * 2**20
+
+IMAGE_EXTENSIONS = (".png", ".jpg", ".jpeg", ".bmp", ".gif", ".tga", ".tif", ".tiff", ".webp")
+
+DECODING = "decoding"
+UPLOADING = "uploading"
+READY = "ready"
+FAILED = "failed"
+CANCELLED = "cancelled"
+
+# pixel formats by channels
+FORMATS = {
+    1 : gl.GL_RED,
+    2 : gl.GL_RG,
+    3 : gl.GL_RGB,
+    4 : gl.GL_RGBA,
+}
+
+def is_image(path):
+    return path.lower().endswith(IMAGE_EXTENSIONS)
+
+def decode_image(path, max_height=0):
+    # returns the pixels of an image file as (height, width, channels) uint8 array,
+    # downscaled to max_height (keeping the aspect ratio) if it's higher
+    image = Image.open(path)
+    if max_height and image.height > max_height:
+        size = (max(1, round(image.width * max_height / image.height)), max_height)
+        # (JPEGs are decoded at a lower resolution right away)
+        image.draft(None, size)
+        image = image.resize(size, Image.LANCZOS)
+    if image.mode not in ("L", "LA", "RGB", "RGBA"):
+        # (palette images, 16 bit images...)
+        image = image.convert("RGBA")
+    data = np.ascontiguousarray(np.asarray(image, dtype=np.uint8))
+    if data.ndim == 2:
+        data = data[:, :, np.newaxis]
+    return data
+
+class CachedTexture(gloo.Texture2D):
+    # Texture of the cache. Its storage is allocated once, setting its interpolation or wrapping (as filters do
+    # before each draw) only sets the parameters instead of specifying the storage again, which would drop the mipmaps.
+    # Linear minification uses the mipmaps if it has some. It has no data on the CPU (see TextureLoader._allocate).
+    def __init__(self):
+        super().__init__()
+        self.mipmaps = False
+        self._allocated = False
+
+    def _setup(self):
+        gloo.Texture._setup(self)
+        if self.mipmaps and self._interpolation[0] == gl.GL_LINEAR:
+            gl.glTexParameteri(self.target, gl.GL_TEXTURE_MIN_FILTER, gl.GL_LINEAR_MIPMAP_LINEAR)
+        if not self._allocated:
+            gl.glTexImage2D(self.target, 0, self._gpu_format, self.width, self.height,
+                            0, self._cpu_format, self.gtype, None)
+            self._allocated = True
+        self._need_setup = False
+
+class TextureRequest:
+    # a cached texture (or one being loaded)
+    def __init__(self, key, prefetch):
+        self.key = key
+        self.path, self.max_height, self.mipmaps = key
+        # prefetched textures are uploaded after the ones that are needed now
+        self.prefetch = prefetch
+        self.state = DECODING
+        # set when done (READY)
+        self.texture = None
+        self.error = None
+        # number of loads that haven't been released
+        self.users = 0
+        # bytes of the texture on the GPU
+        self.nbytes = 0
+        # version of the file when loading started (see watch.FileWatchService.version), None once removed
+        self.version = None
+
+        self._future = None
+        self._data = None
+        # next row to upload
+        self._row = 0
+
+    @property
+    def done(self):
+        # whether the texture is complete or loading has failed (see error)
+        return self.state in (READY, FAILED)
+
+class TextureLoader:
+    def __init__(self, threads=DECODE_THREADS, upload_bytes=UPLOAD_BYTES_PER_FRAME, cache_bytes=CACHE_BYTES):
+        self.upload_bytes = upload_bytes
+        self.cache_bytes = cache_bytes
+        self._pool = concurrent.futures.ThreadPoolExecutor(max_workers=threads, thread_name_prefix="TextureDecoder")
+        # requests that are being decoded / uploaded, in order
+        # (used by the render thread only)
+        self._loading = []
+        # all requests by key (path, max height, mipmaps), least recently used first
+        self._requests = collections.OrderedDict()
+        self._pbo = None
+        self._budget = upload_bytes
+
+        # bytes of all cached textures (see used_bytes for the ones that are used)
+        self.cached_bytes = 0
+        # loads of cached textures (or ones being loaded) / of new ones, prefetched loads, deleted unused textures
+        self.hits = 0
+        self.misses = 0
+        self.prefetch_hits = 0
+        self.evictions = 0
+        # bytes uploaded, frames with uploads
+        self.uploaded_bytes = 0
+        self.upload_frames = 0
+
+    @property
+    def hit_rate(self):
+        loads = self.hits + self.misses
+        return self.hits / loads if loads else 0.0
+
+    @property
+    def used_bytes(self):
+        return sum([ request.nbytes for request in self._requests.values() if request.users > 0 ])
+
+    def _get(self, path, max_height, mipmaps, prefetch):
+        # returns the request of a texture, starts loading it if it's not cached
+        key = (os.path.abspath(path), int(max_height), bool(mipmaps))
+        request = self._requests.get(key)
+        if request is not None and request.state == FAILED and request.users == 0:
+            # (tried again, the file might have been fixed)
+            self._remove(request)
+            request = None
+        if request is not None and self.has_changed(request):
+            self.invalidate(request.path)
+            request = None
+        if request is None:
+            request = TextureRequest(key, prefetch)
+            request.version = watch.file_watch.watch(request.path)
+            request._future = self._pool.submit(decode_image, request.path, request.max_height)
+            self._requests[key] = request
+            self._loading.append(request)
+            return request, False
+        self._requests.move_to_end(key)
+        return request, True
+
+    def load(self, path, prefetch=False, max_height=0, mipmaps=False, reload=False):
+        # starts loading an image file into a texture (or takes the cached one), returns the request
+        # (see TextureRequest.done), which must be released again
+        # prefetch: the texture isn't needed yet, it's uploaded after the others
+        # reload: the file is read again (see invalidate)
+        if reload:
+            self.invalidate(path)
+        request, cached = self._get(path, max_height, mipmaps, prefetch)
+        if cached:
+            self.hits += 1
+            if not prefetch and request.prefetch:
+                self.prefetch_hits += 1
+                request.prefetch = False
+        else:
+            self.misses += 1
+        request.users += 1
+        if not prefetch and not time.global_time.clock.realtime:
+            # (offline rendering, frames must not depend on how fast files load)
+            self.wait(request)
+        return request
+
+    def prefetch(self, path, max_height=0, mipmaps=False):
+        # loads an image file into the cache ahead, a later load of it takes the texture
+        self._get(path, max_height, mipmaps, prefetch=True)
+
+    def has_changed(self, request):
+        # whether the file of a texture has changed since it was loaded
+        return request.version is not None and request.version != watch.file_watch.version(request.path)
+
+    def invalidate(self, path):
+        # the file has changed, its textures (all variants) are loaded again by the next loads.
+        # textures that are still used stay valid until they're released
+        path = os.path.abspath(path)
+        for key, request in list(self._requests.items()):
+            if key[0] != path:
+                continue
+            if request.users == 0:
+                self._remove(request)
+            else:
+                del self._requests[key]
+
+    def release(self, request):
+        # the texture isn't used by the load anymore, it's kept while the cache has space
+        # (loading it is stopped if it's not done yet, it's deleted if it has been invalidated)
+        request.users -= 1
+        if request.users > 0:
+            return
+        if request.state != READY or self._requests.get(request.key) is not request:
+            self._remove(request)
+            return
+        self._requests.move_to_end(request.key)
+        self._evict()
+
+    def _remove(self, request):
+        if self._requests.get(request.key) is request:
+            del self._requests[request.key]
+        if request.version is not None:
+            watch.file_watch.unwatch(request.path)
+            request.version = None
+        request._future.cancel()
+        request._data = None
+        if request in self._loading:
+            self._loading.remove(request)
+        if request.texture is not None:
+            request.texture.delete()
+            request.texture = None
+            self.cached_bytes -= request.nbytes
+        if not request.done:
+            request.state = CANCELLED
+
+    def _evict(self):
+        # deletes the least recently used textures nobody uses until the cached ones fit into the budget
+        # (prefetched textures that are still loading as well)
+        if self.cached_bytes <= self.cache_bytes:
+            return
+        for request in list(self._requests.values()):
+            if self.cached_bytes <= self.cache_bytes:
+                break
+            if request.users == 0 and request.texture is not None:
+                self._remove(request)
+                self.evictions += 1
+
+    def _decoded(self, request, wait=False):
+        # returns whether the request can be uploaded
+        if request.state == DECODING:
+            if not wait and not request._future.done():
+                return False
+            try:
+                request._data = request._future.result()
+            except Exception as e:
+                request.error = str(e)
+                request.state = FAILED
+                self._loading.remove(request)
+                print("### Warning: Couldn't load texture %s: %s" % (request.path, e))
+                return False
+            request.state = UPLOADING
+        return request.state == UPLOADING
+
+    def _next_upload(self):
+        # first request needed now that can be uploaded, otherwise the first prefetched one
+        prefetched = None
+        for request in list(self._loading):
+            if not self._decoded(request):
+                continue
+            if not request.prefetch:
+                return request
+            if prefetched is None:
+                prefetched = request
+        return prefetched
+
+    def _allocate(self, request):
+        h, w, c = request._data.shape
+        # (over a single pixel, the data is uploaded from the decoded array and not kept)
+        texture = np.broadcast_to(np.zeros(c, dtype=np.uint8), (h, w, c)).view(CachedTexture)
+        texture._pending_data = None
+        texture.mipmaps = request.mipmaps
+        texture.activate()
+        texture.deactivate()
+        request.texture = texture
+        request.nbytes = h * w * c * 4 // 3 if request.mipmaps else h * w * c
+        self.cached_bytes += request.nbytes
+        # (the request is used or it's prefetched, other textures are deleted if there is no space for it)
+        self._evict()
+
+    def _upload(self, request, max_bytes):
+        # allocates the texture of a request or uploads its next rows (at least one), returns the bytes of the budget used
+        data = request._data
+        h, w, c = data.shape
+        if request.texture is None:
+            self._allocate(request)
+            # (allocating takes about as long as uploading the data, counted like that)
+            return data.nbytes
+
+        row_bytes = w * c
+        rows = max(1, min(h - request._row, max_bytes // row_bytes))
+        nbytes = rows * row_bytes
+        if self._pbo is None:
+            self._pbo = gl.glGenBuffers(1)
+        gl.glBindBuffer(gl.GL_PIXEL_UNPACK_BUFFER, self._pbo)
+        # (orphans the buffer, the driver might still read the last slice from it)
+        gl.glBufferData(gl.GL_PIXEL_UNPACK_BUFFER, nbytes, None, gl.GL_STREAM_DRAW)
+        ptr = gl.glMapBufferRange(gl.GL_PIXEL_UNPACK_BUFFER, 0, nbytes, gl.GL_MAP_WRITE_BIT | gl.GL_MAP_INVALIDATE_BUFFER_BIT)
+        if ptr:
+            ctypes.memmove(ctypes.c_void_p(ptr), ctypes.c_void_p(data[request._row:].ctypes.data), nbytes)
+            gl.glUnmapBuffer(gl.GL_PIXEL_UNPACK_BUFFER)
+            pixels = ctypes.c_void_p(0)
+        else:
+            print("### Warning: Couldn't map pixel buffer, uploading %s directly" % request.path)
+            gl.glBindBuffer(gl.GL_PIXEL_UNPACK_BUFFER, 0)
+            pixels = data[request._row:request._row + rows]
+        gl.glPixelStorei(gl.GL_UNPACK_ALIGNMENT, 1)
+        gl.glBindTexture(gl.GL_TEXTURE_2D, request.texture.handle)
+        gl.glTexSubImage2D(gl.GL_TEXTURE_2D, 0, 0, request._row, w, rows, FORMATS[c], gl.GL_UNSIGNED_BYTE, pixels)
+        request._row += rows
+        if request._row >= h and request.mipmaps:
+            gl.glGenerateMipmap(gl.GL_TEXTURE_2D)
+        gl.glBindTexture(gl.GL_TEXTURE_2D, 0)
+        gl.glBindBuffer(gl.GL_PIXEL_UNPACK_BUFFER, 0)
+
+        self.uploaded_bytes += nbytes
+        if request._row >= h:
+            request._data = None
+            request.state = READY
+            self._loading.remove(request)
+        return nbytes
+
+    def update(self):
+        # uploads decoded images within the budget of this frame (render thread)
+        if self._budget <= 0 or not self._loading:
+            return
+        uploaded = 0
+        while self._budget > 0:
+            request = self._next_upload()
+            if request is None:
+                break
+            nbytes = self._upload(request, self._budget)
+            self._budget -= nbytes
+            uploaded += nbytes
+        if uploaded:
+            self.upload_frames += 1
+
+    def wait(self, request):
+        # finishes loading a request right away
+        if request.state == DECODING:
+            self._decoded(request, wait=True)
+        while request.state == UPLOADING:
+            self._upload(request, request._data.nbytes)
+
+    def end_frame(self):
+        self.update()
+        self._budget = self.upload_bytes
+
+    def stats(self):
+        return {
+            "cached MB" : self.cached_bytes / 2**20,
+            "used MB" : self.used_bytes / 2**20,
+            "textures" : len(self._requests),
+            "loading" : len(self._loading),
+            "hit rate" : self.hit_rate,
+            "prefetch hits" : self.prefetch_hits,
+            "evictions" : self.evictions,
+            "uploaded MB" : self.uploaded_bytes / 2**20,
+        }
+
+    def clear(self):
+        # deletes the textures nobody uses (stops loading them)
+        for request in list(self._requests.values()):
+            if request.users == 0:
+                self._remove(request)
+        if self._pbo is not None and not self._loading:
+            gl.glDeleteBuffers(1, np.array([self._pbo], dtype=np.uint32))
+            self._pbo = None
+
+# loader and cache of the texture nodes, uploads after each frame of the root graph (see RootGraph._end_frame)
+texture_loader = TextureLoader()
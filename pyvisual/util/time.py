@@ -1,8 +1,63 @@
 import math
 import time
 
+# Clock sources: where the time of ReferenceTimer and all time-driven nodes comes from.
+# tick() is called once per frame by whatever drives the frames (editor, renderer),
+# frame_rate() is the nominal frame rate for nodes that depend on it.
+
+class WallClock:
+    # real time
+    realtime = True
+
+    def time(self):
+        return time.time()
+
+    def tick(self):
+        pass
+
+    def frame_rate(self):
+        from glumpy.app import clock
+        return clock.get_default().get_fps_limit()
+
+class VirtualClock:
+    # advances by a fixed step each frame, independent of how long a frame really takes
+    # (offline rendering faster or slower than real time, reproducible benchmarks)
+    realtime = False
+
+    def __init__(self, fps=60.0, start_time=0.0):
+        self.fps = fps
+        self.start_time = start_time
+        self.frame = 0
+
+    def time(self):
+        return self.start_time + self.frame / self.fps
+
+    def tick(self):
+        self.frame += 1
+
+    def frame_rate(self):
+        return self.fps
+
+class ExternalClock:
+    # time is set from outside (synchronization with other software for example)
+    realtime = False
+
+    def __init__(self, fps=60.0, current_time=0.0):
+        self.fps = fps
+        self.current_time = current_time
+
+    def time(self):
+        return self.current_time
+
+    def tick(self):
+        pass
+
+    def frame_rate(self):
+        return self.fps
+
 class ReferenceTimer:
-    def __init__(self, initial_time=0.0):
+    def __init__(self, initial_time=0.0, clock=None):
+        self.clock = clock if clock is not None else WallClock()
         self.initial_time_offset = initial_time
         self.time_offset = 0.0
 
@@ -13,7 +68,7 @@ class ReferenceTimer:
     def time(self):
         if self._paused:
             return self._paused_time + self.time_offset
-        return time.time() + self.initial_time_offset + self.time_offset + self._internal_offset
+        return self.clock.time() + self.initial_time_offset + self.time_offset + self._internal_offset
 
     @property
     def paused(self):
@@ -27,11 +82,30 @@ class ReferenceTimer:
         if paused:
             self._paused_time = self.time() - self.time_offset
         else:
-            self._internal_offset = -(time.time() - self._paused_time)
+            self._internal_offset = -(self.clock.time() - self._paused_time)
         self._paused = paused
 
+    def set_clock(self, clock, current_time=None):
+        # keeps the current time (and pause state) when switching clocks
+        # or continues from current_time (without the time offset) if given
+        if current_time is None:
+            current_time = self.time() - self.time_offset
+        self.clock = clock
+        if self._paused:
+            self._paused_time = current_time
+        else:
+            self._internal_offset = current_time - self.clock.time() - self.initial_time_offset
+
 global_time = ReferenceTimer()
 
+# time of the clock source without offsets / pausing of global time
+# use this instead of time.time() for durations in nodes
+def clock_time():
+    return global_time.clock.time()
+
+def frame_rate():
+    return global_time.clock.frame_rate()
+
 # TODO what kind of interface should timers actually have?
 def ScalableTimer(initial_time=0.0):
     _last_time = global_time.time()
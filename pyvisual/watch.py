@@ -0,0 +1,327 @@
+# Central watching of files for changes (shader files, see assets.ShaderAssets, and assets.FileWatcher).
+# Each path is watched once, however many watchers it has. Changes are noticed by a thread:
+# - with inotify on Linux, watching the directories of the files (editors often save by replacing a file)
+# - otherwise (or if a directory can't be watched or has been deleted) by polling: one thread stats all polled files
+#   every POLL_INTERVAL
+# The render thread takes the changes with update(), which counts up the versions of the changed paths and hands
+# them to the subscriptions (see subscribe). update() returns right away if nothing has changed.
+
+import ctypes
+import ctypes.util
+import os
+import queue
+import select
+import struct
+import sys
+import threading
+import traceback
+import weakref
+
+# seconds between two checks of the polled files
+POLL_INTERVAL = 1.0
+# seconds the inotify thread waits for events before checking if it's stopped
+STOP_INTERVAL = 0.5
+
+IN_ATTRIB = 0x00000004
+IN_CLOSE_WRITE = 0x00000008
+IN_MOVED_TO = 0x00000080
+IN_CREATE = 0x00000100
+IN_DELETE = 0x00000200
+IN_MOVE_SELF = 0x00000800
+IN_Q_OVERFLOW = 0x00004000
+IN_IGNORED = 0x00008000
+IN_CLOEXEC = 0o2000000
+# finished writes, files moved or created in place of a file, touch, the directory moved away
+IN_MASK = IN_CLOSE_WRITE | IN_MOVED_TO | IN_CREATE | IN_DELETE | IN_ATTRIB | IN_MOVE_SELF
+
+EVENT = struct.Struct("iIII")
+
+class _PollingBackend:
+    def __init__(self, report, interval=POLL_INTERVAL):
+        self._report = report
+        self.interval = interval
+        self._lock = threading.Lock()
+        # (mtime, size) by path
+        self._stats = {}
+        self._stopped = threading.Event()
+        self._thread = threading.Thread(target=self._run, name="FileWatchPolling", daemon=True)
+        self._thread.start()
+
+    @staticmethod
+    def _stat(path):
+        try:
+            stat = os.stat(path)
+            return stat.st_mtime_ns, stat.st_size
+        except OSError:
+            # might happen sometimes that a file doesn't exist anymore for a moment
+            # when it is saved. dunno why
+            return None
+
+    def add(self, path):
+        stat = self._stat(path)
+        with self._lock:
+            self._stats[path] = stat
+
+    def remove(self, path):
+        with self._lock:
+            self._stats.pop(path, None)
+
+    def _run(self):
+        while not self._stopped.wait(self.interval):
+            with self._lock:
+                paths = list(self._stats.keys())
+            changed = []
+            for path in paths:
+                stat = self._stat(path)
+                if stat is None:
+                    continue
+                with self._lock:
+                    if path in self._stats and self._stats[path] != stat:
+                        self._stats[path] = stat
+                        changed.append(path)
+            for path in changed:
+                self._report(path)
+
+    def stop(self):
+        self._stopped.set()
+        self._thread.join()
+
+class _InotifyBackend:
+    def __init__(self, report, fall_back):
+        self._report = report
+        # called with the paths of a directory that can't be watched anymore
+        self._fall_back = fall_back
+        self._libc = ctypes.CDLL(ctypes.util.find_library("c"), use_errno=True)
+        self._fd = self._libc.inotify_init1(IN_CLOEXEC)
+        if self._fd < 0:
+            raise OSError(ctypes.get_errno(), "inotify_init1 failed")
+        self._lock = threading.Lock()
+        # watch descriptor and names of the watched files, by directory
+        self._directories = {}
+        # directory by watch descriptor
+        self._wds = {}
+        self._stopped = threading.Event()
+        self._thread = threading.Thread(target=self._run, name="FileWatchInotify", daemon=True)
+        self._thread.start()
+
+    def add(self, path):
+        # raises OSError if the directory can't be watched
+        directory, name = os.path.split(path)
+        with self._lock:
+            watched = self._directories.get(directory)
+            if watched is None:
+                wd = self._libc.inotify_add_watch(self._fd, os.fsencode(directory), IN_MASK)
+                if wd < 0:
+                    raise OSError(ctypes.get_errno(), "inotify_add_watch failed for %s" % directory)
+                watched = (wd, set())
+                self._directories[directory] = watched
+                self._wds[wd] = directory
+            watched[1].add(name)
+
+    def remove(self, path):
+        directory, name = os.path.split(path)
+        with self._lock:
+            watched = self._directories.get(directory)
+            if watched is None:
+                return
+            wd, names = watched
+            names.discard(name)
+            if not names:
+                self._libc.inotify_rm_watch(self._fd, wd)
+                del self._directories[directory]
+                del self._wds[wd]
+
+    def _handle(self, data):
+        offset = 0
+        while offset + EVENT.size <= len(data):
+            wd, mask, cookie, length = EVENT.unpack_from(data, offset)
+            name = os.fsdecode(data[offset + EVENT.size:offset + EVENT.size + length].rstrip(b"\0"))
+            offset += EVENT.size + length
+
+            changed = []
+            lost = []
+            with self._lock:
+                if mask & IN_Q_OVERFLOW:
+                    # (events have been lost)
+                    for directory, (_, names) in self._directories.items():
+                        changed.extend([ os.path.join(directory, name) for name in names ])
+                directory = self._wds.get(wd)
+                if directory is not None:
+                    if name and name in self._directories[directory][1]:
+                        changed.append(os.path.join(directory, name))
+                    if mask & (IN_IGNORED | IN_MOVE_SELF):
+                        rewatched, lost = self._rewatch(directory, wd, removed=bool(mask & IN_IGNORED))
+                        changed.extend(rewatched)
+            for path in changed:
+                self._report(path)
+            if lost:
+                self._fall_back(lost)
+
+    def _rewatch(self, directory, wd, removed):
+        # the directory has been deleted, moved away or replaced: the directory at its path is watched instead
+        # and its files count as changed. returns these paths, and the paths that can't be watched anymore
+        names = self._directories.pop(directory)[1]
+        del self._wds[wd]
+        if not removed:
+            self._libc.inotify_rm_watch(self._fd, wd)
+        paths = [ os.path.join(directory, name) for name in names ]
+        wd = self._libc.inotify_add_watch(self._fd, os.fsencode(directory), IN_MASK)
+        if wd < 0:
+            return [], paths
+        self._directories[directory] = (wd, names)
+        self._wds[wd] = directory
+        return paths, []
+
+    def _run(self):
+        while not self._stopped.is_set():
+            try:
+                readable, _, _ = select.select([self._fd], [], [], STOP_INTERVAL)
+                if readable:
+                    self._handle(os.read(self._fd, 64 * 1024))
+            except Exception as e:
+                traceback.print_exc()
+                self._stopped.wait(STOP_INTERVAL)
+
+    def stop(self):
+        self._stopped.set()
+        self._thread.join()
+        os.close(self._fd)
+
+class WatchSubscription:
+    # collects the paths changed with each update of the service, until they are taken
+    def __init__(self):
+        self.paths = set()
+
+    def take(self):
+        if not self.paths:
+            return frozenset()
+        paths = self.paths
+        self.paths = set()
+        return paths
+
+class FileWatchService:
+    def __init__(self, use_inotify=sys.platform.startswith("linux"), poll_interval=POLL_INTERVAL):
+        self.use_inotify = use_inotify
+        self.poll_interval = poll_interval
+        self._lock = threading.Lock()
+        # number of watchers by path
+        self._watchers = {}
+        # backend by path
+        self._backends = {}
+        self._versions = {}
+        # changed paths reported by the backends' threads
+        self._changes = queue.SimpleQueue()
+        self._subscriptions = weakref.WeakSet()
+        # created with the first watched path
+        self._inotify = None
+        self._polling = None
+
+        # changed paths of the last update that had changes
+        self.changed = frozenset()
+        self.updates = 0
+
+    @property
+    def backend(self):
+        return "inotify" if self._inotify is not None else "polling"
+
+    @property
+    def watched_paths(self):
+        return len(self._watchers)
+
+    def _report(self, path):
+        # (called from the backends' threads)
+        self._changes.put(path)
+
+    def _get_inotify(self):
+        if self._inotify is None and self.use_inotify:
+            try:
+                self._inotify = _InotifyBackend(self._report, self._fall_back)
+            except (OSError, AttributeError) as e:
+                print("### Warning: Can't use inotify for watching files, polling them instead (%s)" % e)
+                self.use_inotify = False
+        return self._inotify
+
+    def _get_polling(self):
+        if self._polling is None:
+            self._polling = _PollingBackend(self._report, self.poll_interval)
+        return self._polling
+
+    def _fall_back(self, paths):
+        # (called from the inotify thread) files of a directory that has been deleted are polled,
+        # they are reported once they exist again
+        with self._lock:
+            for path in paths:
+                if path in self._watchers and self._backends[path] is self._inotify:
+                    self._backends[path] = self._get_polling()
+                    self._backends[path].add(path)
+
+    def watch(self, path):
+        # starts watching the path (once per path), returns its version
+        path = os.path.abspath(path)
+        with self._lock:
+            if path in self._watchers:
+                self._watchers[path] += 1
+                return self._versions[path]
+            backend = self._get_inotify()
+            if backend is not None:
+                try:
+                    backend.add(path)
+                except OSError:
+                    backend = None
+            if backend is None:
+                backend = self._get_polling()
+                backend.add(path)
+            self._watchers[path] = 1
+            self._backends[path] = backend
+            self._versions.setdefault(path, 0)
+            return self._versions[path]
+
+    def unwatch(self, path):
+        path = os.path.abspath(path)
+        with self._lock:
+            if not path in self._watchers:
+                return
+            self._watchers[path] -= 1
+            if self._watchers[path] == 0:
+                del self._watchers[path]
+                self._backends.pop(path).remove(path)
+
+    def version(self, path):
+        # changes whenever the file changes (with an update)
+        return self._versions.get(os.path.abspath(path), 0)
+
+    def subscribe(self):
+        # returns a subscription getting the changed paths of each update (kept as long as it's referenced)
+        subscription = WatchSubscription()
+        self._subscriptions.add(subscription)
+        return subscription
+
+    def update(self):
+        # takes the changes noticed since the last update (called by the render thread, each frame or more often),
+        # returns the changed paths
+        if self._changes.empty():
+            return frozenset()
+        changed = set()
+        while True:
+            try:
+                changed.add(self._changes.get_nowait())
+            except queue.Empty:
+                break
+        for path in changed:
+            self._versions[path] = self._versions.get(path, 0) + 1
+        for subscription in list(self._subscriptions):
+            subscription.paths |= changed
+        self.changed = frozenset(changed)
+        self.updates += 1
+        return self.changed
+
+    def stop(self):
+        for backend in (self._inotify, self._polling):
+            if backend is not None:
+                backend.stop()
+        self._inotify = None
+        self._polling = None
+        self._watchers = {}
+        self._backends = {}
+
+file_watch = FileWatchService()